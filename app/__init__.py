@@ -3,22 +3,118 @@ app.__init__
 Inicializador del paquete Flask.
 """
 import os
+from time import perf_counter
 from flask import Flask
 
 
 def create_app(config=None):
+    """Crea la app e inicializa almacenamiento y cachés antes de devolverla, de modo que
+    la primera petición no pague el arranque; /readyz responde 200 sólo después."""
+    t0 = perf_counter()
     app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), '..', 'templates'), static_folder=os.path.join(os.path.dirname(__file__), '..', 'static'))
     app.config.from_mapping(
         SECRET_KEY='dev',
-        DATABASE=os.path.join(os.path.dirname(__file__), '..', 'datos_academia', 'data.db')
+        DATABASE=os.path.join(os.path.dirname(__file__), '..', 'datos_academia', 'data.db'),
+        # Máximo de leads aceptados por petición en /api/leads/batch
+        BATCH_MAX_ITEMS=500,
+        # Pool de conexiones SQLite (una conexión por petición en curso)
+        DB_POOL_SIZE=8,
+        DB_POOL_TIMEOUT=5.0,
+        DB_BUSY_TIMEOUT_MS=5000,
+        # Escritura diferida: un hilo confirma leads/citas en grupos
+        DB_WRITE_BEHIND=False,
+        DB_WRITE_BATCH_SIZE=64,
+        DB_WRITE_FLUSH_MS=0,
+        DB_WRITE_QUEUE_SIZE=1000,
+        DB_WRITE_TIMEOUT=10.0,
+        # Control de admisión de /api/lead y /api/leads/batch (429 + Retry-After al saturarse).
+        # Las escrituras acaban serializadas en SQLite, así que pocas en curso bastan; las
+        # encoladas también ocupan un hilo y app.serve arranca hilos para todas
+        ADMISSION_ENABLED=True,
+        ADMISSION_MAX_IN_FLIGHT=4,
+        ADMISSION_MAX_QUEUE=64,
+        ADMISSION_QUEUE_TIMEOUT=0.5,
+        # Límite por cliente (0 = desactivado); el cliente se identifica por esta cabecera o su IP
+        ADMISSION_RATE_PER_TOKEN=0,
+        ADMISSION_BURST=20,
+        ADMISSION_TOKEN_HEADER='X-Client-Token',
+        # Asignación de citas: horario por día de la semana (0 = lunes), turnos y asesores por turno
+        SCHEDULE_BUSINESS_HOURS={
+            0: ('09:00', '18:00'), 1: ('09:00', '18:00'), 2: ('09:00', '18:00'),
+            3: ('09:00', '18:00'), 4: ('09:00', '18:00'), 5: ('09:00', '13:00')
+        },
+        SCHEDULE_SLOT_MINUTES=30,
+        SCHEDULE_SLOT_CAPACITY=2,
+        SCHEDULE_MIN_DAYS_AHEAD=1,
+        SCHEDULE_MAX_DAYS_AHEAD=60,
+        # Respuestas de /api/lead guardadas por Idempotency-Key (tabla + LRU en memoria)
+        IDEMPOTENCY_ENABLED=True,
+        IDEMPOTENCY_CACHE_SIZE=10000,
+        IDEMPOTENCY_TTL_SECONDS=24 * 3600,
+        # Confirmaciones de cita por SMS/WhatsApp vía outbox; NOTIFY_DISPATCHER=False si el
+        # despachador corre aparte (python -m app.notifications). Sin NOTIFY_GATEWAY ('http')
+        # no se arranca el despachador y los mensajes quedan 'pending' en el outbox
+        NOTIFY_ENABLED=True,
+        NOTIFY_DISPATCHER=True,
+        NOTIFY_CHANNEL='whatsapp',
+        NOTIFY_GATEWAY=None,
+        NOTIFY_HTTP_URL=None,
+        NOTIFY_HTTP_TOKEN=None,
+        NOTIFY_HTTP_TIMEOUT=5.0,
+        NOTIFY_BATCH_SIZE=50,
+        NOTIFY_MAX_ATTEMPTS=5,
+        NOTIFY_BACKOFF_SECONDS=2.0,
+        NOTIFY_BACKOFF_MAX_SECONDS=300.0,
+        NOTIFY_POLL_SECONDS=1.0,
+        # GET /api/stats/stream (SSE): cada cliente ocupa un hilo del servidor mientras está conectado
+        STATS_STREAM_ENABLED=True,
+        STATS_STREAM_MAX_SUBSCRIBERS=4,
+        STATS_STREAM_BUFFER=64,
+        STATS_STREAM_MIN_INTERVAL=0.25,
+        STATS_STREAM_HEARTBEAT_SECONDS=15.0,
+        # Histogramas de latencia y contadores expuestos en /metrics
+        METRICS_ENABLED=True,
+        # Perfilado opcional (también con la variable de entorno ASISTENTE_PROFILE=1)
+        PROFILE_ENABLED=False,
+        PROFILE_SAMPLE_RATE=100,
+        PROFILE_THRESHOLD_MS=0,
+        PROFILE_STACK_INTERVAL_MS=5,
+        PROFILE_DIR=os.path.join(os.path.dirname(__file__), '..', 'datos_academia', 'profiles'),
+        PROFILE_MAX_FILES=50,
+        PROFILE_WRITE_QUEUE=16
     )
+    if config:
+        app.config.update(config)
 
     # Crear carpeta de datos si no existe
     datos_dir = os.path.join(os.path.dirname(__file__), '..', 'datos_academia')
     os.makedirs(datos_dir, exist_ok=True)
 
+    # Métricas primero, para que midan también al resto de hooks
+    from . import metrics
+    metrics.init_app(app)
+    from . import profiling
+    profiling.init_app(app)
+    from . import admission
+    admission.init_app(app)
+    from . import idempotency
+    idempotency.init_app(app)
+
     # Importar y registrar rutas
     from . import routes
     routes.init_app(app)
+    # El despachador y el publicador de estadísticas necesitan la base ya migrada
+    from . import notifications
+    notifications.init_app(app)
+    from . import events
+    events.init_app(app)
+
+    # Precalentar y marcar la app como lista para recibir tráfico
+    routes.warm_up(app)
+    app.extensions['startup_seconds'] = perf_counter() - t0
+    app.extensions['ready'] = True
+    if 'metrics' in app.extensions:
+        app.extensions['metrics'].startup_seconds = app.extensions['startup_seconds']
+    app.logger.info('App lista en %.3f s', app.extensions['startup_seconds'])
 
     return app
@@ -0,0 +1,182 @@
+"""
+app.admission
+Control de admisión para los endpoints de escritura (/api/lead, /api/leads/batch).
+
+Todas las escrituras acaban serializadas en el único escritor de SQLite; si se dejan
+entrar sin límite se acumulan hasta que los clientes agotan su timeout y reintentan.
+Aquí se limita:
+
+- ADMISSION_MAX_IN_FLIGHT peticiones de escritura en curso a la vez,
+- ADMISSION_MAX_QUEUE esperando turno, cada una como máximo ADMISSION_QUEUE_TIMEOUT s,
+- ADMISSION_RATE_PER_TOKEN peticiones por segundo (ráfaga ADMISSION_BURST) por cliente,
+  identificado por la cabecera ADMISSION_TOKEN_HEADER o, sin ella, por su IP.
+
+Tanto las escrituras en curso como las que esperan en la cola ocupan un hilo de waitress;
+app.serve arranca hilos para las dos más unos libres (app.serve.HILOS_LIBRES), así que la
+cola se llena antes que la cola interna de waitress y el exceso recibe su 429 enseguida.
+
+Lo que no entra recibe enseguida un 429 con Retry-After. Los contadores de admitidas,
+encoladas y rechazadas (por motivo) se exponen en /metrics.
+"""
+import math
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app, jsonify, request
+
+MOTIVOS_RECHAZO = ('saturated', 'queue_timeout', 'rate_limited')
+
+
+class RateLimiter:
+    """Token bucket por cliente; recuerda como mucho `max_clients` clientes (LRU)."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # clave -> [fichas disponibles, instante de la última recarga]
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, clave: str) -> float:
+        """Gasta una ficha. Devuelve 0 si había, o los segundos hasta la próxima."""
+        ahora = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(clave)
+            if bucket is None:
+                bucket = self._buckets[clave] = [float(self.burst), ahora]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(clave)
+                bucket[0] = min(self.burst, bucket[0] + (ahora - bucket[1]) * self.rate)
+                bucket[1] = ahora
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float,
+                 limiter: Optional[RateLimiter] = None):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limiter = limiter
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {motivo: 0 for motivo in MOTIVOS_RECHAZO}
+        self._cond = threading.Condition()
+
+    def acquire(self, token: Optional[str] = None) -> Tuple[bool, str, float]:
+        """Intenta admitir una petición: (admitida, motivo del rechazo, segundos sugeridos)."""
+        if self.limiter is not None and token is not None:
+            espera = self.limiter.consume(token)
+            if espera > 0:
+                with self._cond:
+                    self.rejected['rate_limited'] += 1
+                return False, 'rate_limited', espera
+
+        with self._cond:
+            # Si ya hay cola, quien llega se pone detrás aunque acabe de quedar un hueco
+            if self.in_flight < self.max_in_flight and self.waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return True, '', 0.0
+            if self.waiting >= self.max_queue:
+                self.rejected['saturated'] += 1
+                return False, 'saturated', self.queue_timeout
+            self.waiting += 1
+            self.queued += 1
+            fin = monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    restante = fin - monotonic()
+                    if restante <= 0:
+                        self.rejected['queue_timeout'] += 1
+                        # Un aviso de release() pudo llegar a esta espera: se pasa al siguiente
+                        self._cond.notify()
+                        return False, 'queue_timeout', self.queue_timeout
+                    self._cond.wait(restante)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            return True, '', 0.0
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def render_metrics(self) -> List[str]:
+        with self._cond:
+            admitted, queued, rejected = self.admitted, self.queued, dict(self.rejected)
+            in_flight, waiting = self.in_flight, self.waiting
+        lineas = [
+            '# HELP admission_admitted_total Peticiones de escritura admitidas (incluye las que esperaron en cola).',
+            '# TYPE admission_admitted_total counter',
+            f'admission_admitted_total {admitted}',
+            '# HELP admission_queued_total Peticiones de escritura que esperaron turno en la cola.',
+            '# TYPE admission_queued_total counter',
+            f'admission_queued_total {queued}',
+            '# HELP admission_rejected_total Peticiones de escritura rechazadas con 429.',
+            '# TYPE admission_rejected_total counter',
+        ]
+        lineas.extend(f'admission_rejected_total{{reason="{motivo}"}} {n}' for motivo, n in rejected.items())
+        lineas += [
+            '# HELP admission_in_flight Peticiones de escritura en curso.',
+            '# TYPE admission_in_flight gauge',
+            f'admission_in_flight {in_flight}',
+            '# HELP admission_waiting Peticiones de escritura esperando en la cola.',
+            '# TYPE admission_waiting gauge',
+            f'admission_waiting {waiting}',
+        ]
+        return lineas
+
+
+def _token_cliente() -> str:
+    return request.headers.get(current_app.config['ADMISSION_TOKEN_HEADER']) or request.remote_addr or 'anonimo'
+
+
+def limitar(vista):
+    """Decorador para vistas de escritura: admite, ejecuta y libera, o responde 429."""
+    @wraps(vista)
+    def envuelta(*args, **kwargs):
+        controller = current_app.extensions.get('admission')
+        if controller is None:
+            return vista(*args, **kwargs)
+        admitida, motivo, espera = controller.acquire(_token_cliente())
+        if not admitida:
+            resp = jsonify({'error': 'Demasiadas peticiones, intente de nuevo', 'reason': motivo})
+            resp.status_code = 429
+            resp.headers['Retry-After'] = str(max(1, math.ceil(espera)))
+            return resp
+        try:
+            return vista(*args, **kwargs)
+        finally:
+            controller.release()
+    return envuelta
+
+
+def init_app(app):
+    if not app.config.get('ADMISSION_ENABLED', True):
+        return
+    rate = app.config['ADMISSION_RATE_PER_TOKEN']
+    limiter = RateLimiter(rate, app.config['ADMISSION_BURST']) if rate > 0 else None
+    controller = AdmissionController(
+        max_in_flight=app.config['ADMISSION_MAX_IN_FLIGHT'],
+        max_queue=app.config['ADMISSION_MAX_QUEUE'],
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        limiter=limiter
+    )
+    app.extensions['admission'] = controller
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.add_collector(controller.render_metrics)
@@ -3,25 +3,105 @@ app.agent
 Contiene la lógica para calificar leads y agendar citas.
 Mantiene la lógica en español y reglas simples para calificación.
 """
+import re
+import unicodedata
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Optional, Tuple
+
+from .scheduler import HORARIO_POR_DEFECTO, HorarioAtencion
+
+
+CATEGORIAS = {
+    "Idiomas": ["inglés", "español", "francés", "alemán", "portugués", "chino", "idioma", "lengua"],
+    "Tecnologia": ["programación", "python", "java", "web", "desarrollo", "software", "tecnología", "computación"],
+    "Negocios": ["administración", "contabilidad", "marketing", "ventas", "negocio", "emprendimiento"],
+    "Desarrollo personal": ["liderazgo", "comunicación", "coaching", "desarrollo personal", "habilidades"]
+}
+
+
+def quitar_tildes(texto: str) -> str:
+    """Elimina tildes y diéresis: "inglés" -> "ingles"."""
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+def _tabla_latin1() -> Tuple[bytes, bytes]:
+    """Tabla para bytes.translate que hace lower() + quitar_tildes() en una pasada sobre
+    texto latin-1 (el de las transcripciones en español). Los caracteres que quitar_tildes
+    elimina van a la lista de borrado; los que se convierten en más de una letra (¼, ½, ¾)
+    se marcan con un byte nulo para que clasificar_interes use el camino general."""
+    tabla = bytearray(range(256))
+    borrar = bytearray()
+    for b in range(256):
+        sin_tilde = quitar_tildes(chr(b).lower())
+        if len(sin_tilde) == 1:
+            tabla[b] = ord(sin_tilde)
+        elif sin_tilde:
+            tabla[b] = 0
+        else:
+            borrar.append(b)
+    return bytes(tabla), bytes(borrar)
+
+
+_LATIN1_SIN_TILDES, _LATIN1_BORRAR = _tabla_latin1()
+
+
+# Tabla precompilada una sola vez al importar: (categoria, palabras clave sin tilde).
+# El texto se normaliza igual antes de buscar, así "ingles" e "inglés" coinciden con
+# una sola búsqueda por palabra. Se conserva el orden de CATEGORIAS para que gane la
+# primera categoría que coincide.
+_TABLA_CATEGORIAS: Tuple[Tuple[str, Tuple[str, ...]], ...] = tuple(
+    (cat, tuple(dict.fromkeys(quitar_tildes(k) for k in keys)))
+    for cat, keys in CATEGORIAS.items()
+)
 
 
 def clasificar_interes(texto: str) -> str:
-    texto = texto.lower() if texto else ''
-    categorias = {
-        "Idiomas": ["inglés", "español", "francés", "alemán", "portugués", "chino", "idioma", "lengua"],
-        "Tecnologia": ["programación", "python", "java", "web", "desarrollo", "software", "tecnología", "computación"],
-        "Negocios": ["administración", "contabilidad", "marketing", "ventas", "negocio", "emprendimiento"],
-        "Desarrollo personal": ["liderazgo", "comunicación", "coaching", "desarrollo personal", "habilidades"]
-    }
-    for cat, keys in categorias.items():
+    if not texto:
+        return "Otros"
+    if texto.isascii():
+        texto = texto.lower()
+    else:
+        # lower() + quitar_tildes() en una pasada; si el texto no es latin-1 o trae ¼ ½ ¾
+        # (marcados con un byte nulo) se usa el camino general
+        try:
+            plano = texto.encode('latin-1').translate(_LATIN1_SIN_TILDES, _LATIN1_BORRAR)
+        except UnicodeEncodeError:
+            plano = b'\0'
+        texto = quitar_tildes(texto.lower()) if b'\0' in plano else plano.decode('ascii')
+    for cat, keys in _TABLA_CATEGORIAS:
         for k in keys:
             if k in texto:
                 return cat
     return "Otros"
 
 
+_HORARIO_POR_DEFECTO = HorarioAtencion(HORARIO_POR_DEFECTO, 30)
+
+# Nombres: dos o más palabras capitalizadas (sobre el texto pasado por title())
+_PATRON_NOMBRE = re.compile(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b')
+_NO_DIGITOS = re.compile(r'\D')
+
+
+def extraer_nombre(texto: str) -> Optional[str]:
+    """Extrae un nombre de la transcripción o None si no se encuentra."""
+    coincidencia = _PATRON_NOMBRE.search(texto.title())
+    if coincidencia:
+        return coincidencia.group(1)
+    # Si no encuentra con el patrón, tomar las primeras 2-3 palabras
+    palabras = texto.split()
+    if 2 <= len(palabras) <= 3:
+        return ' '.join(palabras).title()
+    return None
+
+
+def extraer_telefono(texto: str) -> Optional[str]:
+    """Deja sólo los dígitos del texto; válido si tiene entre 8 y 15."""
+    numeros = _NO_DIGITOS.sub('', texto)
+    if 8 <= len(numeros) <= 15:
+        return numeros
+    return None
+
+
 def calificar_lead(interes_categoria: str) -> str:
     # Regla simple: Idiomas y Tecnologia -> Alta; Negocios -> Media; Otros -> Baja
     if interes_categoria in ["Idiomas", "Tecnologia"]:
@@ -31,10 +111,17 @@ def calificar_lead(interes_categoria: str) -> str:
     return "Baja"
 
 
-def proponer_cita() -> Dict[str, str]:
-    # Propone la cita para el día siguiente a las 10:00
-    fecha = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
-    hora = '10:00'
+def proponer_cita(scheduler=None, conn=None) -> Dict[str, str]:
+    """Propone el primer turno libre.
+
+    Con `scheduler` (app.scheduler.SlotScheduler) el turno queda apartado hasta que se
+    llame a confirmar() o liberar(); sin él se toma el primer turno del horario por
+    defecto a partir de mañana, sin mirar la ocupación.
+    """
+    if scheduler is not None:
+        fecha, hora = scheduler.reservar(conn)
+    else:
+        fecha, hora = _HORARIO_POR_DEFECTO.primer_turno(datetime.now().date() + timedelta(days=1))
     return {'date': fecha, 'time': hora}
 
 
@@ -0,0 +1,132 @@
+"""
+app.call_stats
+Estadísticas de llamadas de la app de escritorio, acumuladas a medida que ocurren.
+
+EstadisticasLlamadas lleva dos juegos de contadores: los del día (se reinician al pasar
+la medianoche; los del día anterior quedan en `ayer`) y los acumulados desde que se
+abrió la app. Cada evento (inicio y fin de llamada, cita, reintento de un dato) suma en
+O(1) y resumen() calcula duración media, conversión a cita y reintentos por dato sin
+recorrer los leads. Al iniciar, sembrar() toma una vez los conteos de leads y citas
+guardados y las llamadas de hoy ya registradas (el resumen que fin_llamada() devuelve y
+la app guarda con cada transcripción), así reabrir la app no pone el día en cero.
+"""
+import threading
+from datetime import date, datetime
+from time import monotonic
+from typing import Any, Dict, Iterable, Optional
+
+# Datos que el agente pide en cada llamada (ver obtener_nombre/telefono/interes)
+CAMPOS = ('nombre', 'telefono', 'interes')
+
+
+class Contadores:
+    __slots__ = ('llamadas', 'leads', 'citas', 'convertidas', 'duracion_total', 'reintentos')
+
+    def __init__(self):
+        self.llamadas = 0
+        self.leads = 0
+        self.citas = 0
+        # Llamadas que terminaron con una cita agendada
+        self.convertidas = 0
+        self.duracion_total = 0.0
+        self.reintentos: Dict[str, int] = dict.fromkeys(CAMPOS, 0)
+
+    def resumen(self) -> Dict[str, Any]:
+        llamadas = self.llamadas
+        return {
+            'llamadas': llamadas,
+            'leads': self.leads,
+            'citas': self.citas,
+            'duracion_media': self.duracion_total / llamadas if llamadas else 0.0,
+            'conversion': self.convertidas / llamadas if llamadas else 0.0,
+            'reintentos_por_campo': {c: (n / llamadas if llamadas else 0.0) for c, n in self.reintentos.items()},
+        }
+
+
+class EstadisticasLlamadas:
+    def __init__(self, ahora: Optional[datetime] = None):
+        self.dia: date = (ahora or datetime.now()).date()
+        self.hoy = Contadores()
+        self.ayer: Optional[Contadores] = None
+        self.total = Contadores()
+        self._inicio: Optional[float] = None
+        self._reintentos_llamada: Dict[str, int] = dict.fromkeys(CAMPOS, 0)
+        # La conversación suma desde su hilo y la interfaz lee desde el de Tk
+        self._lock = threading.Lock()
+
+    def _al_dia(self, ahora: Optional[datetime]):
+        dia = (ahora or datetime.now()).date()
+        if dia != self.dia:
+            self.ayer = self.hoy if (dia - self.dia).days == 1 else Contadores()
+            self.hoy = Contadores()
+            self.dia = dia
+
+    def sembrar(self, leads: int = 0, citas: int = 0, leads_hoy: int = 0,
+                llamadas_hoy: Iterable[Dict[str, Any]] = ()):
+        """Conteos ya guardados (p. ej. Almacen.resumen()) para no empezar de cero.
+
+        `llamadas_hoy`: resúmenes de fin_llamada() de las llamadas de hoy de sesiones
+        anteriores (Transcripcion.llamadas_del_dia()). Sus leads ya vienen en `leads_hoy`.
+        """
+        with self._lock:
+            self.total.leads += leads
+            self.total.citas += citas
+            self.hoy.leads += leads_hoy
+            for llamada in llamadas_hoy:
+                self.hoy.llamadas += 1
+                self.hoy.duracion_total += llamada.get('duracion', 0.0)
+                convertida = bool(llamada.get('convertida'))
+                self.hoy.convertidas += convertida
+                self.hoy.citas += convertida
+                for campo, n in llamada.get('reintentos', {}).items():
+                    if campo in self.hoy.reintentos:
+                        self.hoy.reintentos[campo] += n
+
+    def inicio_llamada(self):
+        with self._lock:
+            self._inicio = monotonic()
+            self._reintentos_llamada = dict.fromkeys(CAMPOS, 0)
+
+    def en_llamada(self) -> bool:
+        return self._inicio is not None
+
+    def reintento(self, campo: str, ahora: Optional[datetime] = None):
+        """El cliente tuvo que repetir `campo` (uno de CAMPOS)."""
+        with self._lock:
+            self._al_dia(ahora)
+            self.hoy.reintentos[campo] += 1
+            self.total.reintentos[campo] += 1
+            self._reintentos_llamada[campo] += 1
+
+    def cita_agendada(self, ahora: Optional[datetime] = None):
+        with self._lock:
+            self._al_dia(ahora)
+            self.hoy.citas += 1
+            self.total.citas += 1
+
+    def fin_llamada(self, lead: bool = False, convertida: bool = False,
+                    ahora: Optional[datetime] = None) -> Dict[str, Any]:
+        """Cierra la llamada en curso: `lead` si se guardó un lead, `convertida` si terminó en cita.
+
+        Devuelve el resumen de la llamada (duracion, lead, convertida, reintentos) que
+        sembrar() acepta en `llamadas_hoy`.
+        """
+        with self._lock:
+            duracion = monotonic() - self._inicio if self._inicio is not None else 0.0
+            self._inicio = None
+            self._al_dia(ahora)
+            for contadores in (self.hoy, self.total):
+                contadores.llamadas += 1
+                contadores.duracion_total += duracion
+                contadores.leads += bool(lead)
+                contadores.convertidas += bool(convertida)
+            reintentos, self._reintentos_llamada = self._reintentos_llamada, dict.fromkeys(CAMPOS, 0)
+            return {'duracion': round(duracion, 3), 'lead': bool(lead), 'convertida': bool(convertida),
+                    'reintentos': reintentos}
+
+    def resumen(self, ahora: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """{'hoy': {...}, 'total': {...}} con llamadas, leads, citas, duracion_media (s),
+        conversion (0-1) y reintentos_por_campo (reintentos por llamada)."""
+        with self._lock:
+            self._al_dia(ahora)
+            return {'hoy': self.hoy.resumen(), 'total': self.total.resumen()}
@@ -0,0 +1,191 @@
+"""
+app.conversation_log
+Log de conversación de la app de escritorio con memoria acotada.
+
+Los hilos de la conversación sólo encolan mensajes (AgenteVozApp.cola_mensajes); el
+hilo de Tk los saca por lotes en cada after() con drenar() y VistaLog los escribe con
+un único insert por lote. Las etiquetas de color se configuran una vez, y las líneas
+más antiguas del widget (no mensajes: uno puede ocupar varias) se borran al pasar de
+`max_lineas`, así que el widget no crece con una sesión de varios días.
+
+Transcripcion anexa cada mensaje de la llamada en curso, en cuanto llega, como una línea
+de datos_academia/transcripciones/AAAA-MM-DD.jsonl (app.journal; el día en que empezó
+la llamada), así que la transcripción queda completa por larga que sea y en memoria
+sólo se lleva la cuenta. Al terminar la llamada se anexa una línea de cierre con el
+resumen (`llamada`, de EstadisticasLlamadas.fin_llamada), que al reabrir la app se lee
+con llamadas_del_dia() para sembrar las estadísticas del día; transcripciones_del_dia()
+reúne cada llamada con sus mensajes, de una en una.
+"""
+import os
+import queue
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .journal import Journal
+
+COLORES = {
+    'info': '#2c3e50',
+    'agente': '#2980b9',
+    'cliente': '#27ae60',
+    'error': '#e74c3c',
+    'sistema': '#8e44ad',
+}
+
+
+def drenar(cola: 'queue.Queue', maximo: int) -> List[Any]:
+    """Saca hasta `maximo` elementos de la cola sin bloquear."""
+    elementos = []
+    try:
+        while len(elementos) < maximo:
+            elementos.append(cola.get_nowait())
+    except queue.Empty:
+        pass
+    return elementos
+
+
+class VistaLog:
+    """Escribe lotes de líneas en un Text (o ScrolledText) de sólo lectura."""
+
+    def __init__(self, texto, max_lineas: int = 2000, colores: Optional[Dict[str, str]] = None):
+        self.texto = texto
+        self.max_lineas = max_lineas
+        self.lineas = 0
+        self.colores = colores or COLORES
+        for tipo, color in self.colores.items():
+            texto.tag_configure(tipo, foreground=color)
+
+    def escribir(self, lote: Sequence[Tuple[str, str]]):
+        """`lote`: pares (línea ya formateada, tipo)."""
+        if not lote:
+            return
+        # Si el lote solo ya supera el límite, no vale la pena insertar lo que se borraría
+        lote = lote[-self.max_lineas:]
+        argumentos: List[str] = []
+        for linea, tipo in lote:
+            argumentos.extend((linea + '\n', tipo if tipo in self.colores else 'info'))
+            # Un mensaje con saltos de línea ocupa varias líneas del widget
+            self.lineas += linea.count('\n') + 1
+        self.texto.config(state='normal')
+        self.texto.insert('end', *argumentos)
+        sobrantes = self.lineas - self.max_lineas
+        if sobrantes > 0:
+            self.texto.delete('1.0', f'{sobrantes + 1}.0')
+            self.lineas = self.max_lineas
+        self.texto.see('end')
+        self.texto.config(state='disabled')
+
+    def limpiar(self):
+        self.texto.config(state='normal')
+        self.texto.delete('1.0', 'end')
+        self.texto.config(state='disabled')
+        self.lineas = 0
+
+
+class Transcripcion:
+    def __init__(self, directorio: Optional[str] = None, max_mensajes: int = 500):
+        """Sin `directorio` las transcripciones no se guardan en disco: de la llamada en
+        curso sólo se conservan en memoria los últimos `max_mensajes`."""
+        self.directorio = str(directorio) if directorio else None
+        self.mensajes: Deque[Dict[str, str]] = deque(maxlen=max_mensajes)
+        # Mensajes de la llamada en curso; sin directorio, los que ya no caben en el deque
+        self.total = 0
+        self.descartados = 0
+        self.inicio: Optional[str] = None
+        self.id: Optional[str] = None
+        self._diario: Optional[Journal] = None
+
+    def agregar(self, timestamp: str, tipo: str, mensaje: str):
+        if self.inicio is None:
+            ahora = datetime.now()
+            self.inicio = ahora.isoformat(timespec='seconds')
+            self.id = ahora.isoformat(timespec='microseconds')
+        self.total += 1
+        if self.directorio:
+            self._diario_del_dia(self.inicio[:10]).agregar(
+                {'transcripcion': self.id, 'timestamp': timestamp, 'tipo': tipo, 'mensaje': mensaje})
+            return
+        if len(self.mensajes) == self.mensajes.maxlen:
+            self.descartados += 1
+        self.mensajes.append({'timestamp': timestamp, 'tipo': tipo, 'mensaje': mensaje})
+
+    def _ruta_del_dia(self, dia: str) -> str:
+        return os.path.join(self.directorio, 'transcripciones', f'{dia}.jsonl')
+
+    def _diario_del_dia(self, dia: str) -> Journal:
+        path = self._ruta_del_dia(dia)
+        if self._diario is None or self._diario.path != path:
+            if self._diario is not None:
+                self._diario.cerrar()
+            self._diario = Journal(path)
+        return self._diario
+
+    def guardar(self, **datos) -> Optional[Dict[str, Any]]:
+        """Cierra la transcripción en curso: anexa la línea de cierre (con `datos`
+        adicionales, p. ej. el teléfono) y empieza una vacía. Devuelve esa línea; sin
+        directorio lleva además los mensajes que quedaron en memoria."""
+        if not self.total:
+            return None
+        registro = dict(datos, transcripcion=self.id, inicio=self.inicio,
+                        fin=datetime.now().isoformat(timespec='seconds'), total_mensajes=self.total)
+        try:
+            if self.directorio:
+                self._diario_del_dia(self.inicio[:10]).agregar(registro)
+            else:
+                registro.update(mensajes=list(self.mensajes), descartados=self.descartados)
+        finally:
+            self.limpiar()
+        return registro
+
+    def _registros_del_dia(self, dia: Optional[str]) -> Iterator[Dict[str, Any]]:
+        if not self.directorio:
+            return iter(())
+        return Journal(self._ruta_del_dia(dia or datetime.now().strftime('%Y-%m-%d'))).cargar()
+
+    def transcripciones_del_dia(self, dia: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Llamadas que empezaron el día `dia` (hoy por defecto), cada una con la lista
+        de sus mensajes; en memoria sólo está la llamada que se está devolviendo. Una
+        llamada cortada sin línea de cierre (la app terminó a la fuerza) sale sin `fin`."""
+        abierta: Optional[Dict[str, Any]] = None
+        for registro in self._registros_del_dia(dia):
+            if 'mensaje' in registro:
+                if abierta is not None and abierta['transcripcion'] != registro['transcripcion']:
+                    yield abierta
+                    abierta = None
+                if abierta is None:
+                    abierta = {'transcripcion': registro['transcripcion'], 'mensajes': []}
+                abierta['mensajes'].append({k: registro[k] for k in ('timestamp', 'tipo', 'mensaje')})
+            elif isinstance(registro.get('mensajes'), list):
+                # Formato anterior: la llamada entera en una sola línea
+                yield registro
+            else:
+                mensajes: List[Dict[str, str]] = []
+                if abierta is not None:
+                    if abierta['transcripcion'] == registro.get('transcripcion'):
+                        mensajes = abierta['mensajes']
+                    else:
+                        yield abierta
+                    abierta = None
+                yield dict(registro, mensajes=mensajes)
+        if abierta is not None:
+            yield abierta
+
+    def llamadas_del_dia(self, dia: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Resúmenes `llamada` guardados el día `dia` (AAAA-MM-DD, hoy por defecto), sin
+        cargar el diario entero. Las transcripciones sin resumen (p. ej. la que se guarda
+        al cerrar la app a mitad de una llamada) no cuentan."""
+        for registro in self._registros_del_dia(dia):
+            if isinstance(registro.get('llamada'), dict):
+                yield registro['llamada']
+
+    def limpiar(self):
+        self.mensajes.clear()
+        self.total = 0
+        self.descartados = 0
+        self.inicio = None
+        self.id = None
+
+    def cerrar(self):
+        if self._diario is not None:
+            self._diario.cerrar()
+            self._diario = None
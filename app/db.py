@@ -2,25 +2,117 @@
 app.db
 Gestión simple de la base de datos SQLite para leads y citas.
 Usa sqlite3 y crea dos tablas: leads y appointments.
+Las peticiones HTTP obtienen su conexión de un pool acotado (ver get_db).
 """
 import sqlite3
 from sqlite3 import Connection
 import os
-from typing import Optional, Dict, Any
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Optional, Callable, Dict, Any, Iterator, List, Tuple
 
+from flask import current_app, g
 
-def get_connection(db_path: str) -> Connection:
+
+def get_connection(db_path: str, busy_timeout_ms: int = 5000) -> Connection:
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn = sqlite3.connect(db_path, timeout=busy_timeout_ms / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL permite lectores concurrentes con un escritor; NORMAL evita un fsync por commit
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
     return conn
 
 
-def init_db(db_path: str):
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    # Crear tabla leads
-    cur.execute('''
+class PoolExhaustedError(Exception):
+    """No hubo conexión libre en el pool dentro del tiempo de espera."""
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite compartido entre hilos.
+
+    Las conexiones se crean bajo demanda hasta `size`; cada una la usa un solo
+    hilo a la vez (se entrega con acquire y se devuelve con release).
+    """
+
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 5.0, busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                crear = True
+            else:
+                crear = False
+        if crear:
+            try:
+                return get_connection(self.db_path, self.busy_timeout_ms)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhaustedError(f'Sin conexiones libres tras {self.timeout}s (size={self.size})')
+
+    def release(self, conn: Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def get_db() -> Connection:
+    """Conexión de la petición actual, tomada del pool la primera vez que se pide."""
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
+
+
+def close_db(e=None):
+    """Devuelve al pool la conexión de la petición (registrado en teardown_appcontext)."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Deja sólo los dígitos del teléfono ("+57 300-111 2233" -> "573001112233").
+
+    Devuelve None si no queda ningún dígito.
+    """
+    digits = ''.join(ch for ch in str(phone) if ch.isdigit()) if phone else ''
+    return digits or None
+
+
+def _migration_base_tables(conn: Connection):
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS leads (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT,
@@ -30,9 +122,7 @@ def init_db(db_path: str):
         created_at TEXT
     )
     ''')
-
-    # Crear tabla appointments
-    cur.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS appointments (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         lead_id INTEGER,
@@ -44,34 +134,844 @@ def init_db(db_path: str):
         FOREIGN KEY(lead_id) REFERENCES leads(id)
     )
     ''')
-    conn.commit()
+
+
+# Contadores para /api/stats mantenidos por triggers en la misma transacción que
+# cada INSERT/DELETE, de modo que leerlos no depende del tamaño de las tablas.
+# dimension: 'total' (value 'leads'/'appointments'), 'qualification', 'interest',
+# 'lead_day' y 'appointment_day' (value 'YYYY-MM-DD').
+STATS_COUNTERS_DDL = [
+    '''
+    CREATE TABLE stats_counters (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, value)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leads_stats_insert AFTER INSERT ON leads BEGIN
+        INSERT INTO stats_counters (dimension, value, count) VALUES
+            ('total', 'leads', 1),
+            ('qualification', COALESCE(NEW.qualification, ''), 1),
+            ('interest', COALESCE(NEW.interest, ''), 1),
+            ('lead_day', COALESCE(substr(NEW.created_at, 1, 10), ''), 1)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leads_stats_delete AFTER DELETE ON leads BEGIN
+        UPDATE stats_counters SET count = count - 1
+        WHERE (dimension = 'total' AND value = 'leads')
+           OR (dimension = 'qualification' AND value = COALESCE(OLD.qualification, ''))
+           OR (dimension = 'interest' AND value = COALESCE(OLD.interest, ''))
+           OR (dimension = 'lead_day' AND value = COALESCE(substr(OLD.created_at, 1, 10), ''));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_insert AFTER INSERT ON appointments BEGIN
+        INSERT INTO stats_counters (dimension, value, count) VALUES
+            ('total', 'appointments', 1),
+            ('appointment_day', COALESCE(substr(NEW.created_at, 1, 10), ''), 1)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_delete AFTER DELETE ON appointments BEGIN
+        UPDATE stats_counters SET count = count - 1
+        WHERE (dimension = 'total' AND value = 'appointments')
+           OR (dimension = 'appointment_day' AND value = COALESCE(substr(OLD.created_at, 1, 10), ''));
+    END
+    ''',
+]
+
+STATS_COUNTERS_BACKFILL = '''
+    INSERT INTO stats_counters (dimension, value, count)
+    SELECT 'total', 'leads', COUNT(*) FROM leads
+    UNION ALL SELECT 'total', 'appointments', COUNT(*) FROM appointments
+    UNION ALL SELECT 'qualification', COALESCE(qualification, ''), COUNT(*) FROM leads GROUP BY 2
+    UNION ALL SELECT 'interest', COALESCE(interest, ''), COUNT(*) FROM leads GROUP BY 2
+    UNION ALL SELECT 'lead_day', COALESCE(substr(created_at, 1, 10), ''), COUNT(*) FROM leads GROUP BY 2
+    UNION ALL SELECT 'appointment_day', COALESCE(substr(created_at, 1, 10), ''), COUNT(*) FROM appointments GROUP BY 2
+'''
+
+
+def _migration_stats_counters(conn: Connection):
+    # Bases creadas antes de las migraciones versionadas pueden tener ya la tabla
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'"
+    ).fetchone()
+    if not existe:
+        for ddl in STATS_COUNTERS_DDL:
+            conn.execute(ddl)
+        conn.execute(STATS_COUNTERS_BACKFILL)
+
+
+def _migration_phone_dedup_and_indexes(conn: Connection):
+    """Teléfono normalizado único (un lead por llamante) e índices de las consultas frecuentes."""
+    conn.execute('ALTER TABLE leads ADD COLUMN phone_normalized TEXT')
+    conn.execute('ALTER TABLE leads ADD COLUMN updated_at TEXT')
+    conn.execute('ALTER TABLE leads ADD COLUMN call_count INTEGER NOT NULL DEFAULT 1')
+    conn.execute('''
+    CREATE TRIGGER leads_stats_update AFTER UPDATE OF interest, qualification, created_at ON leads BEGIN
+        UPDATE stats_counters SET count = count - 1
+        WHERE (dimension = 'qualification' AND value = COALESCE(OLD.qualification, ''))
+           OR (dimension = 'interest' AND value = COALESCE(OLD.interest, ''))
+           OR (dimension = 'lead_day' AND value = COALESCE(substr(OLD.created_at, 1, 10), ''));
+        INSERT INTO stats_counters (dimension, value, count) VALUES
+            ('qualification', COALESCE(NEW.qualification, ''), 1),
+            ('interest', COALESCE(NEW.interest, ''), 1),
+            ('lead_day', COALESCE(substr(NEW.created_at, 1, 10), ''), 1)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count;
+    END
+    ''')
+
+    conn.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    conn.execute('UPDATE leads SET phone_normalized = normalize_phone(phone), updated_at = created_at')
+
+    # Fusionar llamantes repetidos en el lead más antiguo, con los datos de su última llamada
+    duplicados = conn.execute(
+        'SELECT phone_normalized, MIN(id) AS keep_id, COUNT(*) AS calls FROM leads '
+        'WHERE phone_normalized IS NOT NULL GROUP BY phone_normalized HAVING COUNT(*) > 1'
+    ).fetchall()
+    for phone_normalized, keep_id, calls in duplicados:
+        ultimo = conn.execute(
+            'SELECT name, phone, interest, qualification, created_at FROM leads '
+            'WHERE phone_normalized = ? ORDER BY created_at DESC, id DESC LIMIT 1',
+            (phone_normalized,)
+        ).fetchone()
+        conn.execute(
+            'UPDATE appointments SET lead_id = ? WHERE lead_id IN '
+            '(SELECT id FROM leads WHERE phone_normalized = ? AND id != ?)',
+            (keep_id, phone_normalized, keep_id)
+        )
+        conn.execute('DELETE FROM leads WHERE phone_normalized = ? AND id != ?', (phone_normalized, keep_id))
+        conn.execute(
+            'UPDATE leads SET name = ?, phone = ?, interest = ?, qualification = ?, updated_at = ?, call_count = ? '
+            'WHERE id = ?',
+            (ultimo[0], ultimo[1], ultimo[2], ultimo[3], ultimo[4], calls, keep_id)
+        )
+
+    conn.execute('CREATE UNIQUE INDEX idx_leads_phone_normalized ON leads(phone_normalized)')
+    conn.execute('CREATE INDEX idx_leads_created_at ON leads(created_at)')
+    conn.execute('CREATE INDEX idx_appointments_lead_id ON appointments(lead_id)')
+
+
+def _migration_listing_indexes(conn: Connection):
+    """Índices para el listado paginado por id con filtros (id es el rowid, así que
+    cada índice entrega las filas de un valor ya ordenadas por id)."""
+    conn.execute('CREATE INDEX idx_leads_interest_id ON leads(interest, id)')
+    conn.execute('CREATE INDEX idx_leads_qualification_id ON leads(qualification, id)')
+    conn.execute('CREATE INDEX idx_appointments_type_id ON appointments(type, id)')
+
+
+def _migration_idempotency_keys(conn: Connection):
+    """Respuestas guardadas por Idempotency-Key para repetirlas tras un reintento."""
+    conn.execute('''
+    CREATE TABLE idempotency_keys (
+        key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        body TEXT NOT NULL,
+        created_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_idempotency_keys_created_at ON idempotency_keys(created_at)')
+
+
+def _migration_appointment_slots(conn: Connection):
+    """Ocupación de un día por turno para el asignador de citas (app.scheduler)."""
+    conn.execute('CREATE INDEX idx_appointments_date_time ON appointments(date, time)')
+
+
+def _migration_outbox(conn: Connection):
+    """Mensajes de confirmación pendientes de enviar (patrón outbox).
+
+    Se insertan en la misma transacción que la cita; el despachador de
+    app.notifications los envía en segundo plano. `next_attempt_at` (epoch) es a la vez
+    el momento del próximo reintento y el fin del plazo de un envío en curso.
+    """
+    conn.execute('''
+    CREATE TABLE outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        appointment_id INTEGER,
+        channel TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        body TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TEXT,
+        sent_at TEXT,
+        FOREIGN KEY(appointment_id) REFERENCES appointments(id)
+    )
+    ''')
+    conn.execute('CREATE INDEX idx_outbox_pending ON outbox(next_attempt_at) WHERE status = \'pending\'')
+
+
+def _migration_desktop_sort_indexes(conn: Connection):
+    """Índices (columna, id) para ordenar por nombre o teléfono las tablas paginadas de la
+    app de escritorio (app.storage); interés, calificación y fecha ya tienen el suyo."""
+    conn.execute('CREATE INDEX idx_leads_name_id ON leads(name, id)')
+    conn.execute('CREATE INDEX idx_leads_phone_id ON leads(phone, id)')
+
+
+# Migraciones en orden; PRAGMA user_version guarda cuántas se aplicaron.
+# Nunca modificar una ya publicada: agregar una nueva al final.
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_stats_counters,
+    _migration_phone_dedup_and_indexes,
+    _migration_listing_indexes,
+    _migration_idempotency_keys,
+    _migration_appointment_slots,
+    _migration_outbox,
+    _migration_desktop_sort_indexes,
+]
+
+
+def migrate(conn: Connection) -> int:
+    """Aplica las migraciones pendientes en una transacción y devuelve la versión final."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        if version < len(MIGRATIONS):
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(MIGRATIONS)
+
+
+def init_db(db_path: str):
+    conn = get_connection(db_path)
+    migrate(conn)
     return conn
 
 
-def insert_lead(conn: Connection, lead: Dict[str, Any]) -> int:
+# Consultas frecuentes; tests/test_db.py verifica con EXPLAIN QUERY PLAN que usan índice.
+SQL_LEAD_BY_PHONE = 'SELECT * FROM leads WHERE phone_normalized = ?'
+SQL_LEADS_CREATED_BETWEEN = 'SELECT * FROM leads WHERE created_at >= ? AND created_at < ? ORDER BY created_at'
+SQL_APPOINTMENTS_FOR_LEAD = 'SELECT * FROM appointments WHERE lead_id = ? ORDER BY id'
+# Lo que SQL_UPSERT_LEAD necesita del lead existente para saber qué cambia en stats_counters
+SQL_LEAD_PREVIO = 'SELECT id, interest, qualification, created_at, updated_at FROM leads WHERE phone_normalized = ?'
+SQL_SLOT_OCCUPANCY = 'SELECT time, COUNT(*) FROM appointments WHERE date = ? GROUP BY time'
+
+_SQL_INSERT_APPOINTMENT = 'INSERT INTO appointments (lead_id, date, time, type, status, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+# Sólo inserta si el turno (date, time) tiene menos de `capacity` citas. Dentro de la
+# transacción de escritura la cuenta y el INSERT son atómicos frente a otros escritores.
+_SQL_INSERT_APPOINTMENT_IF_FREE = (
+    'INSERT INTO appointments (lead_id, date, time, type, status, created_at) '
+    'SELECT ?, ?, ?, ?, ?, ? WHERE (SELECT COUNT(*) FROM appointments WHERE date = ? AND time = ?) < ?'
+)
+
+# Un llamante repetido (mismo teléfono normalizado) se fusiona en su lead existente:
+# se conserva la primera fecha de alta y se toman los datos de la llamada más reciente.
+SQL_UPSERT_LEAD = '''
+    INSERT INTO leads (name, phone, phone_normalized, interest, qualification, created_at, updated_at, call_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (phone_normalized) DO UPDATE SET
+        call_count = call_count + 1,
+        name = CASE WHEN excluded.updated_at >= COALESCE(updated_at, '') THEN excluded.name ELSE name END,
+        phone = CASE WHEN excluded.updated_at >= COALESCE(updated_at, '') THEN excluded.phone ELSE phone END,
+        interest = CASE WHEN excluded.updated_at >= COALESCE(updated_at, '') THEN excluded.interest ELSE interest END,
+        qualification = CASE WHEN excluded.updated_at >= COALESCE(updated_at, '') THEN excluded.qualification ELSE qualification END,
+        created_at = COALESCE(MIN(created_at, excluded.created_at), created_at, excluded.created_at),
+        updated_at = COALESCE(MAX(updated_at, excluded.updated_at), updated_at, excluded.updated_at)
+'''
+
+
+def _lead_params(lead: Dict[str, Any]) -> Tuple:
+    created_at = lead.get('created_at')
+    return (lead.get('name'), lead.get('phone'), normalize_phone(lead.get('phone')),
+            lead.get('interest'), lead.get('qualification'), created_at, created_at)
+
+
+def _minimo(a, b):
+    # COALESCE(MIN(a, b), a, b) de SQLite
+    return min(a, b) if a is not None and b is not None else (a if a is not None else b)
+
+
+def _maximo(a, b):
+    return max(a, b) if a is not None and b is not None else (a if a is not None else b)
+
+
+class CambiosStats(Counter):
+    """Incrementos de stats_counters de una escritura: (dimension, value) -> n.
+
+    `inicio` es el instante (time.monotonic) en que empezó la escritura, antes de su
+    commit; quien aplica los cambios sobre una copia de las estadísticas lo usa para
+    saber si esa copia ya los incluía.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.inicio = time.monotonic()
+
+
+def contar_lead(cambios: Counter, anterior: Optional[Tuple], lead: Dict[str, Any]) -> Tuple:
+    """Suma a `cambios` lo que los triggers de stats_counters cambian al guardar `lead`.
+
+    `cambios` usa las claves de stats_counters: (dimension, value) -> incremento.
+    `anterior` son las columnas de SQL_LEAD_PREVIO del lead con el mismo teléfono (o
+    None). Devuelve esas columnas tal como quedan tras SQL_UPSERT_LEAD, para encadenar
+    fusiones del mismo teléfono dentro de un lote.
+    """
+    interest, qualification, created_at = lead.get('interest'), lead.get('qualification'), lead.get('created_at')
+    if anterior is None:
+        cambios[('total', 'leads')] += 1
+        nuevo = (None, interest, qualification, created_at, created_at)
+    else:
+        lead_id, interes_previo, calificacion_previa, creado_previo, actualizado_previo = anterior
+        if created_at is None or created_at < (actualizado_previo or ''):
+            # Una llamada más antigua que la última guardada no cambia interés ni calificación
+            interest, qualification = interes_previo, calificacion_previa
+        created_at = _minimo(creado_previo, created_at)
+        nuevo = (lead_id, interest, qualification, created_at, _maximo(actualizado_previo, lead.get('created_at')))
+        cambios[('qualification', calificacion_previa or '')] -= 1
+        cambios[('interest', interes_previo or '')] -= 1
+        cambios[('lead_day', (creado_previo or '')[:10])] -= 1
+    cambios[('qualification', qualification or '')] += 1
+    cambios[('interest', interest or '')] += 1
+    cambios[('lead_day', (created_at or '')[:10])] += 1
+    return nuevo
+
+
+def contar_cita(cambios: Counter, appointment: Dict[str, Any]):
+    cambios[('total', 'appointments')] += 1
+    cambios[('appointment_day', (appointment.get('created_at') or '')[:10])] += 1
+
+
+def find_lead_by_phone(conn: Connection, phone: str) -> Optional[sqlite3.Row]:
+    phone_normalized = normalize_phone(phone)
+    if phone_normalized is None:
+        return None
+    return conn.execute(SQL_LEAD_BY_PHONE, (phone_normalized,)).fetchone()
+
+
+def get_appointments_for_lead(conn: Connection, lead_id: int) -> List[sqlite3.Row]:
+    return conn.execute(SQL_APPOINTMENTS_FOR_LEAD, (lead_id,)).fetchall()
+
+
+def _empezar_escritura(conn: Connection):
+    # Lo leído antes del upsert sigue valiendo: nadie más escribe hasta el commit
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+
+def insert_lead(conn: Connection, lead: Dict[str, Any], commit: bool = True,
+                cambios: Optional[Counter] = None) -> int:
+    """Inserta el lead o, si su teléfono ya existe, lo fusiona con el existente.
+
+    Devuelve el id del lead (nuevo o existente). Con `cambios`, le suma lo que cambia
+    en stats_counters (ver contar_lead).
+    """
+    params = _lead_params(lead)
+    cur = conn.cursor()
+    if cambios is not None:
+        anterior = None
+        if params[2] is not None:
+            _empezar_escritura(conn)
+            anterior = cur.execute(SQL_LEAD_PREVIO, (params[2],)).fetchone()
+        cur.execute(SQL_UPSERT_LEAD, params)
+        lead_id = cur.lastrowid if anterior is None else anterior[0]
+        contar_lead(cambios, anterior and tuple(anterior), lead)
+    else:
+        cur.execute(SQL_UPSERT_LEAD, params)
+        if params[2] is None:
+            lead_id = cur.lastrowid
+        else:
+            lead_id = cur.execute('SELECT id FROM leads WHERE phone_normalized = ?', (params[2],)).fetchone()[0]
+    if commit:
+        conn.commit()
+    return lead_id
+
+
+_SQL_INSERT_OUTBOX = (
+    'INSERT INTO outbox (appointment_id, channel, recipient, body, status, attempts, next_attempt_at, created_at) '
+    "VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)"
+)
+# Mensajes listos para enviar, del más antiguo al más nuevo (índice parcial idx_outbox_pending)
+SQL_OUTBOX_DUE = "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at"
+
+
+def _outbox_params(appointment_id: int, notification: Dict[str, Any]) -> Tuple:
+    return (appointment_id, notification['channel'], notification['recipient'], notification['body'],
+            time.time(), datetime.now().isoformat())
+
+
+class SlotUnavailableError(Exception):
+    """El turno pedido ya tiene todas sus plazas ocupadas."""
+
+
+def _appointment_params(appointment: Dict[str, Any], capacity: Optional[int] = None) -> Tuple:
+    params = (appointment.get('lead_id'), appointment.get('date'), appointment.get('time'), appointment.get('type'),
+              appointment.get('status'), appointment.get('created_at'))
+    if capacity is None:
+        return params
+    return params + (appointment.get('date'), appointment.get('time'), capacity)
+
+
+def count_appointments_by_slot(conn: Connection, date: str) -> Dict[str, int]:
+    """{hora: citas} del día `date` (YYYY-MM-DD)."""
+    return {row[0]: row[1] for row in conn.execute(SQL_SLOT_OCCUPANCY, (date,))}
+
+
+def insert_appointment(conn: Connection, appointment: Dict[str, Any], commit: bool = True,
+                       capacity: Optional[int] = None) -> int:
+    """Inserta la cita; con `capacity`, lanza SlotUnavailableError si su turno está lleno.
+
+    Si la cita trae 'notification' ({channel, recipient, body}) el mensaje de
+    confirmación se encola en el outbox dentro de la misma transacción.
+    """
+    cur = conn.cursor()
+    if capacity is None:
+        cur.execute(_SQL_INSERT_APPOINTMENT, _appointment_params(appointment))
+    else:
+        cur.execute(_SQL_INSERT_APPOINTMENT_IF_FREE, _appointment_params(appointment, capacity))
+        if not cur.rowcount:
+            raise SlotUnavailableError(f"Turno {appointment.get('date')} {appointment.get('time')} completo")
+    appointment_id = cur.lastrowid
+    if appointment.get('notification'):
+        cur.execute(_SQL_INSERT_OUTBOX, _outbox_params(appointment_id, appointment['notification']))
+    if commit:
+        conn.commit()
+    return appointment_id
+
+
+def insert_appointment_if_missing(conn: Connection, appointment: Dict[str, Any]) -> Optional[int]:
+    """Inserta la cita salvo que el lead ya tenga una en la misma fecha y hora.
+
+    Devuelve el id nuevo, o None si ya existía (para importaciones repetibles).
+    """
     cur = conn.cursor()
     cur.execute(
-        'INSERT INTO leads (name, phone, interest, qualification, created_at) VALUES (?, ?, ?, ?, ?)',
-        (lead.get('name'), lead.get('phone'), lead.get('interest'), lead.get('qualification'), lead.get('created_at'))
+        'INSERT INTO appointments (lead_id, date, time, type, status, created_at) '
+        'SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS '
+        '(SELECT 1 FROM appointments WHERE lead_id = ? AND date = ? AND time = ?)',
+        (appointment.get('lead_id'), appointment.get('date'), appointment.get('time'), appointment.get('type'),
+         appointment.get('status'), appointment.get('created_at'),
+         appointment.get('lead_id'), appointment.get('date'), appointment.get('time'))
     )
-    conn.commit()
-    return cur.lastrowid
+    return cur.lastrowid if cur.rowcount else None
+
+
+def insert_leads_batch(conn: Connection, leads: List[Dict[str, Any]],
+                       appointments: List[Dict[str, Any]],
+                       capacity: Optional[int] = None,
+                       cambios: Optional[Counter] = None) -> Tuple[List[int], List[int]]:
+    """Inserta (o fusiona por teléfono) varios leads y sus citas en una sola transacción.
+
+    Cada cita indica en 'lead_index' la posición de su lead dentro de `leads`.
+    Devuelve (ids de leads, ids de citas) en el mismo orden de entrada. Con `capacity`,
+    si algún turno ya está lleno se deshace todo el lote y se lanza SlotUnavailableError.
+    Con `cambios`, le suma lo que cambia en stats_counters si el lote se confirma.
+    """
+    lead_ids: List[int] = []
+    appt_ids: List[int] = []
+    contados: Counter = Counter()
+    with conn:
+        cur = conn.cursor()
+        params = [_lead_params(l) for l in leads]
+        ids_por_telefono: Dict[str, int] = {}
+        con_telefono = [p for p in params if p[2] is not None]
+        if cambios is not None:
+            _empezar_escritura(conn)
+            previos: Dict[str, Tuple] = {}
+            telefonos = list({p[2] for p in con_telefono})
+            for i in range(0, len(telefonos), 500):
+                chunk = telefonos[i:i + 500]
+                cur.execute(
+                    f'SELECT id, interest, qualification, created_at, updated_at, phone_normalized FROM leads '
+                    f'WHERE phone_normalized IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+                previos.update({row[5]: tuple(row)[:5] for row in cur.fetchall()})
+            for lead, p in zip(leads, params):
+                if p[2] is None:
+                    contar_lead(contados, None, lead)
+                else:
+                    previos[p[2]] = contar_lead(contados, previos.get(p[2]), lead)
+        if con_telefono:
+            cur.executemany(SQL_UPSERT_LEAD, con_telefono)
+            telefonos = list({p[2] for p in con_telefono})
+            for i in range(0, len(telefonos), 500):
+                chunk = telefonos[i:i + 500]
+                cur.execute(
+                    f'SELECT id, phone_normalized FROM leads WHERE phone_normalized IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+                ids_por_telefono.update({row[1]: row[0] for row in cur.fetchall()})
+        for p in params:
+            if p[2] is None:
+                cur.execute(SQL_UPSERT_LEAD, p)
+                lead_ids.append(cur.lastrowid)
+            else:
+                lead_ids.append(ids_por_telefono[p[2]])
+        if appointments:
+            sql = _SQL_INSERT_APPOINTMENT if capacity is None else _SQL_INSERT_APPOINTMENT_IF_FREE
+            cur.executemany(sql, [_appointment_params(dict(a, lead_id=lead_ids[a['lead_index']]), capacity)
+                                  for a in appointments])
+            if cur.rowcount != len(appointments):
+                raise SlotUnavailableError('Algún turno del lote está completo')
+            for appointment in appointments:
+                contar_cita(contados, appointment)
+            # Con AUTOINCREMENT y el bloqueo de escritura tomado por la transacción
+            # los ids asignados son consecutivos y terminan en last_insert_rowid().
+            last_id = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
+            appt_ids = list(range(last_id - len(appointments) + 1, last_id + 1))
+            avisos = [_outbox_params(appt_id, a['notification'])
+                      for a, appt_id in zip(appointments, appt_ids) if a.get('notification')]
+            if avisos:
+                cur.executemany(_SQL_INSERT_OUTBOX, avisos)
+    if cambios is not None:
+        cambios.update(contados)
+    return lead_ids, appt_ids
+
+
+def get_idempotency_key(conn: Connection, key: str) -> Optional[sqlite3.Row]:
+    return conn.execute(
+        'SELECT fingerprint, status, body, created_at FROM idempotency_keys WHERE key = ?', (key,)
+    ).fetchone()
+
+
+def save_idempotency_key(conn: Connection, key: str, fingerprint: str, status: int, body: str,
+                         created_at: float, commit: bool = True):
+    """Con commit=False queda en la transacción abierta (la del lead que produjo la respuesta)."""
+    # Reemplaza una entrada caducada de la misma clave
+    conn.execute(
+        'INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, status, body, created_at) VALUES (?, ?, ?, ?, ?)',
+        (key, fingerprint, status, body, created_at)
+    )
+    if commit:
+        conn.commit()
+
+
+def purge_idempotency_keys(conn: Connection, older_than: float) -> int:
+    """Borra las claves creadas antes de `older_than` (epoch) y devuelve cuántas."""
+    with conn:
+        return conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (older_than,)).rowcount
+
+
+def claim_notifications(conn: Connection, now: float, lease_seconds: float, limit: int) -> List[sqlite3.Row]:
+    """Toma hasta `limit` mensajes vencidos para enviarlos.
+
+    Cada mensaje tomado suma un intento y no vuelve a estar disponible hasta
+    now + lease_seconds, de modo que dos despachadores no envían el mismo y un envío
+    interrumpido (proceso caído) se reintenta al vencer el plazo.
+    """
+    with conn:
+        return conn.execute(
+            f'UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ? '
+            f'WHERE id IN ({SQL_OUTBOX_DUE} LIMIT ?) '
+            'RETURNING id, appointment_id, channel, recipient, body, attempts',
+            (now + lease_seconds, now, limit)
+        ).fetchall()
+
 
+def record_deliveries(conn: Connection, sent: List[int], retry: List[Tuple[float, str, int]],
+                      failed: List[Tuple[str, int]]):
+    """Guarda en una transacción el resultado de un lote: enviados, a reintentar
+    (próximo intento, error, id) y agotados (error, id)."""
+    with conn:
+        if sent:
+            conn.executemany("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                             [(datetime.now().isoformat(), i) for i in sent])
+        if retry:
+            conn.executemany('UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?', retry)
+        if failed:
+            conn.executemany("UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?", failed)
 
-def insert_appointment(conn: Connection, appointment: Dict[str, Any]) -> int:
+
+class WriteQueueFullError(Exception):
+    """La cola del escritor en segundo plano está llena."""
+
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """Escritor en segundo plano con commit agrupado (group commit).
+
+    Un hilo dedicado, con su propia conexión, vacía una cola acotada de leads
+    (cada uno con su cita opcional) y los confirma en grupos de hasta
+    `batch_size` elementos; si `flush_interval_ms` > 0 espera ese tiempo a que
+    lleguen más antes de confirmar. Quien envía recibe un Future que se resuelve
+    con (lead_id, appointment_id) cuando el grupo ya está confirmado. Con
+    `slot_capacity`, una cita cuyo turno se llenó resuelve su Future con
+    SlotUnavailableError y su lead no se guarda. La respuesta de una petición con
+    Idempotency-Key (`idempotency`) se guarda en la misma transacción que su lead.
+    Tras cada commit, `on_commit(cambios)` recibe lo que cambió en stats_counters.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval_ms: float = 0,
+                 max_queue: int = 1000, put_timeout: float = 1.0, busy_timeout_ms: int = 5000,
+                 observe: Optional[Callable[[str, float], None]] = None,
+                 slot_capacity: Optional[int] = None,
+                 on_commit: Optional[Callable[[Counter], None]] = None):
+        self.batch_size = batch_size
+        self.slot_capacity = slot_capacity
+        self.on_commit = on_commit
+        # observe(etapa, segundos): recibe la duración de inserts y de cada commit agrupado
+        self.observe = observe
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout
+        self._conn = get_connection(db_path, busy_timeout_ms)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+
+    def submit_lead(self, lead: Dict[str, Any], appointment: Optional[Dict[str, Any]] = None,
+                    idempotency: Optional[Tuple[str, str, Callable[[int, Optional[int]], str]]] = None) -> Future:
+        """Encola un lead (y su cita, cuyo lead_id se completa al insertar).
+
+        `idempotency`: (clave, huella, cuerpo); cuerpo(lead_id, appointment_id) arma el JSON
+        de la respuesta, que se guarda en idempotency_keys junto con el lead.
+        """
+        if self._closed:
+            raise RuntimeError('WriteBehindWriter cerrado')
+        future: Future = Future()
+        try:
+            self._queue.put((lead, appointment, idempotency, future), timeout=self.put_timeout)
+        except queue.Full:
+            raise WriteQueueFullError(f'Cola de escritura llena ({self._queue.maxsize} elementos)')
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Confirma todo lo encolado y detiene el hilo escritor."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._conn.close()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_item(self, lead, appointment, idempotency, cambios: Optional[Counter]) -> Tuple[int, Optional[int]]:
+        t0 = time.perf_counter()
+        lead_id = insert_lead(self._conn, lead, commit=False, cambios=cambios)
+        t1 = time.perf_counter()
+        appt_id = None
+        if appointment is not None:
+            appt_id = insert_appointment(self._conn, dict(appointment, lead_id=lead_id), commit=False,
+                                         capacity=self.slot_capacity)
+            if cambios is not None:
+                contar_cita(cambios, appointment)
+        if idempotency is not None:
+            key, fingerprint, cuerpo = idempotency
+            save_idempotency_key(self._conn, key, fingerprint, 200, cuerpo(lead_id, appt_id), time.time(),
+                                 commit=False)
+        if self.observe:
+            self.observe('insert_lead', t1 - t0)
+            if appointment is not None:
+                self.observe('insert_appointment', time.perf_counter() - t1)
+        return lead_id, appt_id
+
+    def _confirmado(self, cambios: Optional[Counter]):
+        if cambios:
+            self.on_commit(cambios)
+
+    def _write_batch(self, batch):
+        cambios = CambiosStats() if self.on_commit else None
+        try:
+            results = [self._write_item(lead, appointment, idempotency, cambios)
+                       for lead, appointment, idempotency, _ in batch]
+            t0 = time.perf_counter()
+            self._conn.commit()
+            if self.observe:
+                self.observe('group_commit', time.perf_counter() - t0)
+        except Exception:
+            self._conn.rollback()
+            # Reintentar uno a uno para que un elemento inválido no haga fallar a los demás
+            for lead, appointment, idempotency, future in batch:
+                cambios = CambiosStats() if self.on_commit else None
+                try:
+                    result = self._write_item(lead, appointment, idempotency, cambios)
+                    self._conn.commit()
+                except Exception as e:
+                    self._conn.rollback()
+                    future.set_exception(e)
+                else:
+                    self._confirmado(cambios)
+                    future.set_result(result)
+            return
+        self._confirmado(cambios)
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+LEAD_COLUMNS = 'id, name, phone, interest, qualification, created_at, updated_at, call_count'
+
+
+def _page(cur, sql: str, params: List[Any], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    # Se pide una fila extra para saber si hay página siguiente sin contar el total
+    rows = cur.execute(sql + ' LIMIT ?', params + [limit + 1]).fetchall()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = items[-1]['id'] if len(rows) > limit else None
+    return items, next_cursor
+
+
+def _leads_query(cursor: Optional[int] = None, interest: Optional[str] = None,
+                 qualification: Optional[str] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None) -> Tuple[str, List[Any]]:
+    where, params = [], []
+    if cursor is not None:
+        where.append('id < ?')
+        params.append(cursor)
+    if interest is not None:
+        where.append('interest = ?')
+        params.append(interest)
+    if qualification is not None:
+        where.append('qualification = ?')
+        params.append(qualification)
+    # El rango de fechas se aplica como filtro sobre el recorrido por id ("+" evita
+    # que el planificador elija idx_leads_created_at y tenga que ordenar todo el rango)
+    if date_from is not None:
+        where.append('+created_at >= ?')
+        params.append(date_from)
+    if date_to is not None:
+        where.append('+created_at < ?')
+        params.append(date_to)
+    sql = f'SELECT {LEAD_COLUMNS} FROM leads'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + ' ORDER BY id DESC', params
+
+
+def _appointments_query(cursor: Optional[int] = None, interest: Optional[str] = None,
+                        qualification: Optional[str] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None) -> Tuple[str, List[Any]]:
+    where, params = [], []
+    if cursor is not None:
+        where.append('a.id < ?')
+        params.append(cursor)
+    if interest is not None:
+        where.append('a.type = ?')
+        params.append(interest)
+    if qualification is not None:
+        where.append('l.qualification = ?')
+        params.append(qualification)
+    if date_from is not None:
+        where.append('+a.date >= ?')
+        params.append(date_from)
+    if date_to is not None:
+        where.append('+a.date < ?')
+        params.append(date_to)
+    # Con filtro por calificación el JOIN es interno; CROSS JOIN obliga a SQLite a
+    # recorrer appointments por id en lugar de partir de leads y ordenar después.
+    join = 'CROSS JOIN' if qualification is not None else 'LEFT JOIN'
+    sql = ('SELECT a.id, a.lead_id, a.date, a.time, a.type, a.status, a.created_at, '
+           'l.name AS lead_name, l.phone AS lead_phone, l.qualification AS lead_qualification '
+           f'FROM appointments a {join} leads l ON l.id = a.lead_id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + ' ORDER BY a.id DESC', params
+
+
+def list_leads(conn: Connection, limit: int = 50, **filtros) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Página de leads del más reciente al más antiguo, con paginación por cursor (keyset).
+
+    Filtros: `cursor` (id del último lead de la página anterior), `interest`,
+    `qualification`, `date_from`/`date_to` sobre created_at (desde inclusive, hasta
+    exclusivo). Devuelve (items, next_cursor).
+    """
+    sql, params = _leads_query(**filtros)
+    return _page(conn.cursor(), sql, params, limit)
+
+
+def list_appointments(conn: Connection, limit: int = 50, **filtros) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Igual que list_leads pero para citas: `interest` filtra por el tipo de la cita,
+    `qualification` por la del lead y el rango de fechas por la fecha de la cita."""
+    sql, params = _appointments_query(**filtros)
+    return _page(conn.cursor(), sql, params, limit)
+
+
+EXPORT_COLUMNS = [
+    'lead_id', 'name', 'phone', 'interest', 'qualification', 'created_at', 'updated_at', 'call_count',
+    'appointment_id', 'appointment_date', 'appointment_time', 'appointment_type', 'appointment_status'
+]
+
+
+def iter_export_rows(conn: Connection, batch_size: int = 1000) -> Iterator[Tuple]:
+    """Recorre leads unidos con sus citas (una fila por cita, o una sin cita) en orden de id.
+
+    El cursor de SQLite avanza bajo demanda, así que la memoria no depende del
+    tamaño de la tabla: sólo se materializan `batch_size` filas a la vez.
+    """
     cur = conn.cursor()
     cur.execute(
-        'INSERT INTO appointments (lead_id, date, time, type, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-        (appointment.get('lead_id'), appointment.get('date'), appointment.get('time'), appointment.get('type'), appointment.get('status'), appointment.get('created_at'))
+        'SELECT l.id, l.name, l.phone, l.interest, l.qualification, l.created_at, l.updated_at, l.call_count, '
+        'a.id, a.date, a.time, a.type, a.status '
+        'FROM leads l LEFT JOIN appointments a ON a.lead_id = l.id '
+        'ORDER BY l.id, a.id'
     )
-    conn.commit()
-    return cur.lastrowid
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        cur.close()
+
 
+def get_stats(conn: Connection, days: int = 30) -> Dict[str, Any]:
+    """Totales y desgloses leídos de stats_counters (sin recorrer leads/appointments).
 
-def get_stats(conn: Connection) -> Dict[str, int]:
+    `days` limita el desglose diario a los últimos N días con actividad.
+    """
     cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) as total_leads FROM leads')
-    total_leads = cur.fetchone()['total_leads']
-    cur.execute('SELECT COUNT(*) as total_appts FROM appointments')
-    total_appts = cur.fetchone()['total_appts']
-    return {'total_leads': total_leads, 'total_appointments': total_appts}
+    cur.execute(
+        "SELECT dimension, value, count FROM stats_counters "
+        "WHERE dimension IN ('total', 'qualification', 'interest') AND count > 0"
+    )
+    totals: Dict[str, int] = {}
+    by_qualification: Dict[str, int] = {}
+    by_interest: Dict[str, int] = {}
+    for row in cur.fetchall():
+        destino = {'total': totals, 'qualification': by_qualification, 'interest': by_interest}[row['dimension']]
+        destino[row['value']] = row['count']
+
+    by_day: Dict[str, Dict[str, int]] = {}
+    for dimension, clave in (('lead_day', 'leads'), ('appointment_day', 'appointments')):
+        cur.execute(
+            'SELECT value, count FROM stats_counters WHERE dimension = ? AND count > 0 ORDER BY value DESC LIMIT ?',
+            (dimension, days)
+        )
+        for row in cur.fetchall():
+            by_day.setdefault(row['value'], {'leads': 0, 'appointments': 0})[clave] = row['count']
+    by_day = dict(sorted(by_day.items(), reverse=True)[:days])
+
+    return {
+        'total_leads': totals.get('leads', 0),
+        'total_appointments': totals.get('appointments', 0),
+        'by_qualification': by_qualification,
+        'by_interest': by_interest,
+        'by_day': by_day
+    }
@@ -0,0 +1,341 @@
+"""
+app.events
+Estadísticas en vivo por Server-Sent Events (GET /api/stats/stream).
+
+Un único StatsPublisher por proceso reparte los eventos a todos los suscriptores: cada
+evento se serializa una vez y se copia al búfer acotado de cada uno
+(STATS_STREAM_BUFFER mensajes). Un cliente lento que llena su búfer se desconecta con
+un evento `dropped`; EventSource reconecta solo y recibe un `snapshot` nuevo.
+
+Eventos:
+    snapshot  al conectar: el mismo contenido que /api/stats
+    lead      tras cada POST /api/lead: lead_id, qualification, interest y la cita (o null)
+    stats     claves de /api/stats que cambiaron, con su valor nuevo (un parche, no un
+              incremento); 0 si un conteo desapareció
+
+La base se consulta sólo para el snapshot, cuando se conecta el primer suscriptor. Cada
+escritura (POST /api/lead, lotes y el escritor diferido) cuenta, sin consultas extra, lo
+que cambia en stats_counters (db.CambiosStats). El publicador suma esos incrementos a su
+copia del snapshot y, desde un hilo propio, difunde lo que cambió como mucho cada
+STATS_STREAM_MIN_INTERVAL segundos, agrupando las ráfagas en un solo evento. Si una
+escritura se confirmó mientras se leía el snapshot, no se sabe si la lectura ya la
+incluía: sólo en ese caso se vuelve a consultar. Sin suscriptores no se guarda copia
+ni se consulta nada. Las escrituras de otros procesos sobre la misma base (otra
+instancia, la app de escritorio) aparecen en el próximo snapshot.
+"""
+import json
+import threading
+from collections import Counter, deque
+from time import monotonic, sleep
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from . import db as db_module
+
+# Dimensión de stats_counters -> clave de /api/stats que la desglosa
+_DESGLOSES = {'qualification': 'by_qualification', 'interest': 'by_interest'}
+_POR_DIA = {'lead_day': 'leads', 'appointment_day': 'appointments'}
+
+# Lo que devuelve Suscripcion.siguiente() cuando la suscripción terminó
+FIN = object()
+
+
+def formato_sse(evento: str, datos: Any, id_evento: Optional[int] = None) -> str:
+    lineas = []
+    if id_evento is not None:
+        lineas.append(f'id: {id_evento}')
+    lineas.append(f'event: {evento}')
+    lineas.append('data: ' + json.dumps(datos, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lineas) + '\n\n'
+
+
+def diferencia_stats(antes: Dict[str, Any], despues: Dict[str, Any]) -> Dict[str, Any]:
+    """Claves de `despues` que difieren de `antes`; dentro de los diccionarios sólo las
+    entradas cambiadas, y las que desaparecieron con valor 0."""
+    cambios: Dict[str, Any] = {}
+    for clave, nuevo in despues.items():
+        viejo = antes.get(clave)
+        if isinstance(nuevo, dict) and isinstance(viejo, dict):
+            sub = diferencia_stats(viejo, nuevo)
+            for quitada in viejo.keys() - nuevo.keys():
+                sub[quitada] = 0 if not isinstance(viejo[quitada], dict) else {k: 0 for k in viejo[quitada]}
+            if sub:
+                cambios[clave] = sub
+        elif nuevo != viejo:
+            cambios[clave] = nuevo
+    return cambios
+
+
+def aplicar_cambios(stats: Dict[str, Any], cambios: Counter, max_days: int = 30) -> Dict[str, Any]:
+    """Suma a `stats` (contenido de /api/stats) los incrementos de stats_counters y
+    devuelve el parche con lo que cambió, en el formato de diferencia_stats."""
+    parche: Dict[str, Any] = {}
+    for (dimension, valor), n in cambios.items():
+        if not n:
+            continue
+        if dimension == 'total':
+            clave = f'total_{valor}'
+            stats[clave] = parche[clave] = stats.get(clave, 0) + n
+        elif dimension in _DESGLOSES:
+            clave = _DESGLOSES[dimension]
+            grupo = stats.setdefault(clave, {})
+            nuevo = max(0, grupo.get(valor, 0) + n)
+            if nuevo:
+                grupo[valor] = nuevo
+            else:
+                grupo.pop(valor, None)
+            parche.setdefault(clave, {})[valor] = nuevo
+        elif dimension in _POR_DIA:
+            by_day = stats.setdefault('by_day', {})
+            dia = by_day.get(valor)
+            if dia is None:
+                # Un día más antiguo que la ventana de max_days no se muestra
+                if n < 0 or (len(by_day) >= max_days and valor < min(by_day)):
+                    continue
+                dia = by_day[valor] = {'leads': 0, 'appointments': 0}
+                stats['by_day'] = by_day = dict(sorted(by_day.items(), reverse=True))
+            dia[_POR_DIA[dimension]] = max(0, dia[_POR_DIA[dimension]] + n)
+            parche.setdefault('by_day', {})[valor] = dict(dia)
+            if not any(dia.values()):
+                del by_day[valor]
+    by_day = stats.get('by_day', {})
+    for viejo in list(by_day)[max_days:]:
+        del by_day[viejo]
+        parche.setdefault('by_day', {})[viejo] = {'leads': 0, 'appointments': 0}
+    return parche
+
+
+class Suscripcion:
+    def __init__(self, max_mensajes: int):
+        self.max_mensajes = max_mensajes
+        self.descartada = False
+        self._mensajes: Deque[str] = deque()
+        self._cerrada = False
+        self._cond = threading.Condition()
+
+    def poner(self, mensaje: str) -> bool:
+        """Encola sin bloquear; False (y la suscripción se cierra) si el búfer está lleno."""
+        with self._cond:
+            if self._cerrada:
+                return False
+            if len(self._mensajes) >= self.max_mensajes:
+                # Lo pendiente ya no sirve: el cliente recibirá un snapshot al reconectar
+                self._mensajes.clear()
+                self._mensajes.append(formato_sse('dropped', {'reason': 'slow_consumer'}))
+                self._cerrada = True
+                self.descartada = True
+                self._cond.notify()
+                return False
+            self._mensajes.append(mensaje)
+            self._cond.notify()
+            return True
+
+    def cerrar(self):
+        with self._cond:
+            self._cerrada = True
+            self._cond.notify()
+
+    def siguiente(self, timeout: float):
+        """Próximo mensaje, None si pasó `timeout` sin ninguno, o FIN."""
+        with self._cond:
+            if not self._mensajes and not self._cerrada:
+                self._cond.wait(timeout)
+            if self._mensajes:
+                return self._mensajes.popleft()
+            return FIN if self._cerrada else None
+
+
+class StatsPublisher:
+    def __init__(self, cargar_stats: Callable[[], Dict[str, Any]], max_subscribers: int = 16,
+                 buffer_size: int = 64, min_interval: float = 0.25, max_days: int = 30):
+        """`cargar_stats()` devuelve el contenido de /api/stats (p. ej. db.get_stats)."""
+        self.cargar_stats = cargar_stats
+        self.max_subscribers = max_subscribers
+        self.buffer_size = buffer_size
+        self.min_interval = min_interval
+        self.max_days = max_days
+        self.events = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.queries = 0
+        self._suscriptores: List[Suscripcion] = []
+        # Copia de /api/stats al día, sólo mientras hay suscriptores
+        self._snapshot: Optional[Dict[str, Any]] = None
+        # (inicio, fin) de la consulta que dio el snapshot, en time.monotonic
+        self._consulta: Tuple[float, float] = (0.0, 0.0)
+        self._pendiente: Counter = Counter()
+        self._releer = False
+        self._id = 0
+        self._lock = threading.Lock()
+        self._cambio = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _cargar(self):
+        # Llamar con self._lock tomado
+        inicio = monotonic()
+        self._snapshot = self.cargar_stats()
+        self._consulta = (inicio, monotonic())
+        self._pendiente.clear()
+        self._releer = False
+        self.queries += 1
+
+    def suscribir(self) -> Optional[Suscripcion]:
+        """Nueva suscripción con el snapshot ya encolado, o None si no caben más."""
+        with self._lock:
+            if len(self._suscriptores) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            if self._snapshot is None or self._releer:
+                self._cargar()
+            else:
+                # Lo pendiente se incorpora antes de enviar la copia al nuevo suscriptor
+                parche = aplicar_cambios(self._snapshot, self._pendiente, self.max_days)
+                self._pendiente.clear()
+                if parche:
+                    self._difundir('stats', parche)
+            sus = Suscripcion(self.buffer_size)
+            sus.poner(formato_sse('snapshot', self._snapshot, self._id))
+            self._suscriptores.append(sus)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stats-publisher', daemon=True)
+                self._thread.start()
+            return sus
+
+    def _sin_suscriptores(self):
+        # Llamar con self._lock tomado: la copia deja de mantenerse hasta el próximo snapshot
+        if not self._suscriptores:
+            self._snapshot = None
+            self._pendiente.clear()
+
+    def cancelar(self, sus: Suscripcion):
+        sus.cerrar()
+        with self._lock:
+            if sus in self._suscriptores:
+                self._suscriptores.remove(sus)
+                self._sin_suscriptores()
+
+    def _difundir(self, evento: str, datos: Any):
+        # Llamar con self._lock tomado
+        self._id += 1
+        self.events += 1
+        mensaje = formato_sse(evento, datos, self._id)
+        vivos = []
+        for sus in self._suscriptores:
+            if sus.poner(mensaje):
+                vivos.append(sus)
+            else:
+                self.dropped += 1
+        self._suscriptores = vivos
+        self._sin_suscriptores()
+
+    def publicar(self, evento: str, datos: Any):
+        with self._lock:
+            if self._suscriptores:
+                self._difundir(evento, datos)
+
+    def sumar(self, cambios: 'db_module.CambiosStats'):
+        """Una escritura ya confirmada cambió stats_counters en `cambios`."""
+        confirmada_antes_de = monotonic()
+        with self._lock:
+            if self._snapshot is None:
+                return
+            inicio_consulta, fin_consulta = self._consulta
+            if confirmada_antes_de < inicio_consulta:
+                # El snapshot ya la incluye
+                return
+            if cambios.inicio > fin_consulta:
+                self._pendiente.update(cambios)
+            else:
+                self._releer = True
+        self._cambio.set()
+
+    def _run(self):
+        while not self._parar.is_set():
+            self._cambio.wait()
+            if self._parar.is_set():
+                break
+            self._cambio.clear()
+            inicio = monotonic()
+            with self._lock:
+                if self._suscriptores:
+                    if self._releer:
+                        anterior = self._snapshot
+                        self._cargar()
+                        parche = diferencia_stats(anterior or {}, self._snapshot)
+                    else:
+                        parche = aplicar_cambios(self._snapshot, self._pendiente, self.max_days)
+                        self._pendiente.clear()
+                    if parche:
+                        self._difundir('stats', parche)
+            # Agrupar las escrituras de la ráfaga en el próximo evento
+            restante = self.min_interval - (monotonic() - inicio)
+            if restante > 0:
+                sleep(restante)
+
+    def close(self):
+        self._parar.set()
+        self._cambio.set()
+        with self._lock:
+            suscriptores, self._suscriptores = self._suscriptores, []
+            self._sin_suscriptores()
+        for sus in suscriptores:
+            sus.cerrar()
+
+    def render_metrics(self) -> List[str]:
+        with self._lock:
+            suscriptores, eventos, descartados, rechazados, consultas = (
+                len(self._suscriptores), self.events, self.dropped, self.rejected, self.queries)
+        return [
+            '# HELP stats_stream_subscribers Clientes conectados a /api/stats/stream.',
+            '# TYPE stats_stream_subscribers gauge',
+            f'stats_stream_subscribers {suscriptores}',
+            '# HELP stats_stream_events_total Eventos difundidos a los suscriptores.',
+            '# TYPE stats_stream_events_total counter',
+            f'stats_stream_events_total {eventos}',
+            '# HELP stats_stream_dropped_total Suscriptores desconectados por no leer a tiempo.',
+            '# TYPE stats_stream_dropped_total counter',
+            f'stats_stream_dropped_total {descartados}',
+            '# HELP stats_stream_rejected_total Conexiones rechazadas por STATS_STREAM_MAX_SUBSCRIBERS.',
+            '# TYPE stats_stream_rejected_total counter',
+            f'stats_stream_rejected_total {rechazados}',
+            '# HELP stats_stream_queries_total Consultas de estadísticas a la base (snapshots).',
+            '# TYPE stats_stream_queries_total counter',
+            f'stats_stream_queries_total {consultas}',
+        ]
+
+
+def contador_cambios(app) -> Optional['db_module.CambiosStats']:
+    """Dónde contar los cambios de stats_counters de una escritura, o None sin stream."""
+    return db_module.CambiosStats() if 'stats_stream' in app.extensions else None
+
+
+def stats_cambiados(app, cambios: Optional['db_module.CambiosStats']):
+    """Publica los cambios de una escritura ya confirmada."""
+    publisher = app.extensions.get('stats_stream')
+    if publisher is not None and cambios:
+        publisher.sumar(cambios)
+
+
+def lead_guardado(app, datos: Dict[str, Any]):
+    """Publica el lead recién confirmado."""
+    publisher = app.extensions.get('stats_stream')
+    if publisher is not None:
+        publisher.publicar('lead', datos)
+
+
+def init_app(app):
+    if not app.config.get('STATS_STREAM_ENABLED', True):
+        return
+    import atexit
+    conn = db_module.get_connection(app.config['DATABASE'], app.config['DB_BUSY_TIMEOUT_MS'])
+    publisher = StatsPublisher(
+        lambda: db_module.get_stats(conn),
+        max_subscribers=app.config['STATS_STREAM_MAX_SUBSCRIBERS'],
+        buffer_size=app.config['STATS_STREAM_BUFFER'],
+        min_interval=app.config['STATS_STREAM_MIN_INTERVAL']
+    )
+    app.extensions['stats_stream'] = publisher
+    atexit.register(publisher.close)
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.add_collector(publisher.render_metrics)
@@ -0,0 +1,84 @@
+"""
+app.export
+Exportación en streaming de leads con sus citas, en CSV o NDJSON.
+La usan la ruta GET /api/export y este mismo módulo como línea de comandos:
+
+    python -m app.export --format csv --output leads.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Iterable, Iterator, Tuple
+
+from . import db as db_module
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Filas agrupadas por fragmento emitido; evita un write/yield por fila
+CHUNK_ROWS = 500
+
+
+def generar_csv(rows: Iterable[Tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(db_module.EXPORT_COLUMNS)
+    pendientes = 0
+    for row in rows:
+        writer.writerow(row)
+        pendientes += 1
+        if pendientes >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    yield buffer.getvalue()
+
+
+def generar_ndjson(rows: Iterable[Tuple]) -> Iterator[str]:
+    columnas = db_module.EXPORT_COLUMNS
+    lineas = []
+    for row in rows:
+        lineas.append(json.dumps(dict(zip(columnas, row)), ensure_ascii=False))
+        if len(lineas) >= CHUNK_ROWS:
+            yield '\n'.join(lineas) + '\n'
+            lineas = []
+    if lineas:
+        yield '\n'.join(lineas) + '\n'
+
+
+def generar_export(conn, formato: str) -> Iterator[str]:
+    if formato not in FORMATS:
+        raise ValueError(f'Formato no soportado: {formato}')
+    rows = db_module.iter_export_rows(conn)
+    return generar_csv(rows) if formato == 'csv' else generar_ndjson(rows)
+
+
+def main(argv=None):
+    default_db = os.path.join(os.path.dirname(__file__), '..', 'datos_academia', 'data.db')
+    parser = argparse.ArgumentParser(description='Exporta leads y citas a CSV o NDJSON.')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', '-o', help='Archivo de salida (por defecto, la salida estándar)')
+    parser.add_argument('--database', default=default_db, help='Ruta de la base SQLite')
+    args = parser.parse_args(argv)
+
+    conn = db_module.init_db(args.database)
+    try:
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                for fragmento in generar_export(conn, args.format):
+                    f.write(fragmento)
+        else:
+            for fragmento in generar_export(conn, args.format):
+                sys.stdout.write(fragmento)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
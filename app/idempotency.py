@@ -0,0 +1,211 @@
+"""
+app.idempotency
+Soporte de la cabecera Idempotency-Key en POST /api/lead.
+
+El navegador y las integraciones reintentan el POST ante errores de red; con la misma
+clave, el reintento recibe la respuesta guardada de la primera vez (cabecera
+Idempotent-Replayed: true) sin volver a insertar el lead ni la cita.
+
+Las respuestas (< 500) se guardan en la tabla idempotency_keys, para que sobrevivan a
+un reinicio, y en una caché LRU en memoria de IDEMPOTENCY_CACHE_SIZE entradas. La vista
+que guarda un lead escribe la respuesta con guardar_en_transaccion() (o la pasa al
+escritor diferido) antes del commit, así el lead y su clave se confirman juntos y un
+corte entre ambos no deja un lead sin clave que el reintento volvería a insertar. Ambas
+caducan a los IDEMPOTENCY_TTL_SECONDS. Reutilizar una clave con otro cuerpo responde
+422 y repetirla mientras la primera petición sigue en curso responde 409.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import List, NamedTuple, Optional, Tuple
+
+from flask import current_app, g, jsonify, request, Response
+
+from . import db as db_module
+
+HEADER = 'Idempotency-Key'
+MAX_LONGITUD_CLAVE = 255
+# Cada cuántas respuestas guardadas se borran de la tabla las claves caducadas
+PURGAR_CADA = 100
+
+
+class Entrada(NamedTuple):
+    fingerprint: str
+    status: int
+    body: str
+    created_at: float
+
+
+class IdempotencyCache:
+    def __init__(self, max_items: int, ttl_seconds: float):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: 'OrderedDict[str, Entrada]' = OrderedDict()
+        self._en_curso = set()
+        self._guardadas = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, key: str) -> bool:
+        """Marca la clave como en curso; False si otra petición ya la tiene."""
+        with self._lock:
+            if key in self._en_curso:
+                return False
+            self._en_curso.add(key)
+            return True
+
+    def liberar(self, key: str):
+        with self._lock:
+            self._en_curso.discard(key)
+
+    def _vigente(self, entrada: Entrada) -> bool:
+        return time.time() - entrada.created_at < self.ttl_seconds
+
+    def _recordar(self, key: str, entrada: Entrada):
+        # Llamar con self._lock tomado
+        self._items[key] = entrada
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, conn, key: str) -> Optional[Entrada]:
+        """Respuesta guardada para `key` (memoria y, si no está, la tabla) o None."""
+        with self._lock:
+            entrada = self._items.get(key)
+            if entrada is not None:
+                if self._vigente(entrada):
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return entrada
+                del self._items[key]
+                self.expirations += 1
+        fila = db_module.get_idempotency_key(conn, key)
+        entrada = Entrada(*fila) if fila is not None else None
+        with self._lock:
+            if entrada is None or not self._vigente(entrada):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._recordar(key, entrada)
+        return entrada
+
+    def put(self, conn, key: str, entrada: Entrada, en_base: bool = False):
+        """`en_base`: la vista ya la escribió en la tabla junto con el lead."""
+        if not en_base:
+            db_module.save_idempotency_key(conn, key, *entrada)
+        with self._lock:
+            self._recordar(key, entrada)
+            self._guardadas += 1
+            purgar = self._guardadas % PURGAR_CADA == 0
+        if purgar:
+            borradas = db_module.purge_idempotency_keys(conn, time.time() - self.ttl_seconds)
+            with self._lock:
+                self.expirations += borradas
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._items)
+            }
+
+    def render_metrics(self) -> List[str]:
+        datos = self.stats()
+        lineas = []
+        for nombre, ayuda in (('hits', 'Reintentos respondidos con la respuesta guardada.'),
+                              ('misses', 'Claves de idempotencia nuevas o caducadas.'),
+                              ('evictions', 'Entradas expulsadas de la caché en memoria por tamaño.'),
+                              ('expirations', 'Entradas descartadas por superar el TTL.')):
+            lineas.append(f'# HELP idempotency_cache_{nombre}_total {ayuda}')
+            lineas.append(f'# TYPE idempotency_cache_{nombre}_total counter')
+            lineas.append(f'idempotency_cache_{nombre}_total {datos[nombre]}')
+        lineas.append('# HELP idempotency_cache_size Entradas en la caché en memoria.')
+        lineas.append('# TYPE idempotency_cache_size gauge')
+        lineas.append(f'idempotency_cache_size {datos["size"]}')
+        return lineas
+
+
+def _error(mensaje: str, status: int):
+    resp = jsonify({'error': mensaje})
+    resp.status_code = status
+    return resp
+
+
+def pendiente() -> Optional[Tuple[str, str]]:
+    """(clave, huella) de la petición en curso si trae Idempotency-Key; si no, None."""
+    return g.get('_idempotencia')
+
+
+def guardada(status: int, body: str) -> Entrada:
+    """Avisa a idempotente() que la respuesta ya está en la tabla (p. ej. la escribió el
+    escritor diferido junto con el lead) y sólo falta recordarla en memoria."""
+    entrada = Entrada(g.pop('_idempotencia')[1], status, body, time.time())
+    g._idempotencia_guardada = entrada
+    return entrada
+
+
+def guardar_en_transaccion(conn, status: int, body: str):
+    """Escribe la respuesta de la petición en curso en la transacción abierta de `conn`,
+    sin confirmarla: la vista lo llama antes del commit del lead."""
+    actual = pendiente()
+    if actual is None:
+        return
+    db_module.save_idempotency_key(conn, actual[0], *guardada(status, body), commit=False)
+
+
+def idempotente(vista):
+    """Decorador: con Idempotency-Key, repite la respuesta guardada en vez de ejecutar la vista."""
+    @wraps(vista)
+    def envuelta(*args, **kwargs):
+        cache = current_app.extensions.get('idempotency')
+        key = request.headers.get(HEADER)
+        if cache is None or not key:
+            return vista(*args, **kwargs)
+        if len(key) > MAX_LONGITUD_CLAVE:
+            return _error(f'{HEADER} admite como máximo {MAX_LONGITUD_CLAVE} caracteres', 400)
+        if not cache.reservar(key):
+            return _error('Ya hay una petición en curso con esta Idempotency-Key', 409)
+        try:
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            conn = db_module.get_db()
+            guardada = cache.get(conn, key)
+            if guardada is not None:
+                if guardada.fingerprint != fingerprint:
+                    return _error('La Idempotency-Key ya se usó con otro contenido', 422)
+                resp = Response(guardada.body, status=guardada.status, mimetype='application/json')
+                resp.headers['Idempotent-Replayed'] = 'true'
+                return resp
+
+            g._idempotencia = (key, fingerprint)
+            resp = current_app.make_response(vista(*args, **kwargs))
+            entrada = g.pop('_idempotencia_guardada', None)
+            if entrada is not None:
+                cache.put(conn, key, entrada, en_base=True)
+            # Los 5xx son transitorios: el reintento debe volver a intentarlo
+            elif resp.status_code < 500:
+                cache.put(conn, key, Entrada(fingerprint, resp.status_code, resp.get_data(as_text=True), time.time()))
+            return resp
+        finally:
+            g.pop('_idempotencia', None)
+            g.pop('_idempotencia_guardada', None)
+            cache.liberar(key)
+    return envuelta
+
+
+def init_app(app):
+    if not app.config.get('IDEMPOTENCY_ENABLED', True):
+        return
+    cache = IdempotencyCache(app.config['IDEMPOTENCY_CACHE_SIZE'], app.config['IDEMPOTENCY_TTL_SECONDS'])
+    app.extensions['idempotency'] = cache
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.add_collector(cache.render_metrics)
@@ -0,0 +1,266 @@
+"""
+app.importer
+Importa a SQLite los datos de la app de escritorio (datos_academia/leads.json y
+citas.json de versiones anteriores, o los diarios leads.jsonl y citas.jsonl) sin
+cargar los archivos completos en memoria.
+
+Uso:
+    python -m app.importer [--dir datos_academia] [--database ruta.db] [--batch-size 1000]
+
+Cada lote se confirma junto con el avance (tabla import_progress), de modo que
+una importación interrumpida continúa donde quedó y repetirla no duplica datos.
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from sqlite3 import Connection
+from typing import Any, Dict, IO, Iterator, Optional
+
+from . import agent as agent_module
+from . import db as db_module
+from .journal import iter_jsonl
+
+# Categorías de escritorio que difieren de las de app.agent
+INTERESES_ESCRITORIO = {
+    'Desarrollo Personal': 'Desarrollo personal',
+    'Interés no especificado': 'Otros',
+}
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(f: IO[str], chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """Recorre los elementos de un arreglo JSON leyendo el archivo por fragmentos."""
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def leer_mas() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def saltar_espacios():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or not leer_mas():
+                return
+
+    saltar_espacios()
+    if pos >= len(buffer):
+        return
+    if buffer[pos] != '[':
+        raise ValueError('Se esperaba un arreglo JSON')
+    pos += 1
+    saltar_espacios()
+    if pos < len(buffer) and buffer[pos] == ']':
+        return
+    while True:
+        while True:
+            try:
+                item, fin = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento cortado al final del fragmento: leer más y reintentar
+                if not leer_mas():
+                    raise
+                continue
+            # Un número justo al final del fragmento podría continuar en el siguiente
+            if fin == len(buffer) and leer_mas():
+                continue
+            break
+        pos = fin
+        yield item
+        saltar_espacios()
+        if pos >= len(buffer):
+            raise ValueError('Arreglo JSON incompleto')
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] != ',':
+            raise ValueError(f'Separador inesperado {buffer[pos]!r} en el arreglo JSON')
+        pos += 1
+        saltar_espacios()
+
+
+def _fecha_iso(valor: Optional[str]) -> Optional[str]:
+    """'2024-05-01 10:30:00' -> '2024-05-01T10:30:00' (formato de app.db)."""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d %H:%M:%S').isoformat()
+    except ValueError:
+        return valor
+
+
+def _hora_24(valor: Optional[str]) -> Optional[str]:
+    """'10:00 AM' -> '10:00'."""
+    if not valor:
+        return valor
+    try:
+        return datetime.strptime(valor.strip(), '%I:%M %p').strftime('%H:%M')
+    except ValueError:
+        return valor
+
+
+def _interes(valor: Optional[str]) -> str:
+    return INTERESES_ESCRITORIO.get(valor, valor) if valor else 'Otros'
+
+
+def mapear_lead(item: Dict[str, Any]) -> Dict[str, Any]:
+    interes = _interes(item.get('interes'))
+    return {
+        'name': item.get('nombre'),
+        'phone': item.get('telefono'),
+        'interest': interes,
+        'qualification': item.get('calificacion') or agent_module.calificar_lead(interes),
+        'created_at': _fecha_iso(item.get('fecha'))
+    }
+
+
+def mapear_cita(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'date': item.get('fecha_cita'),
+        'time': _hora_24(item.get('hora')),
+        'type': _interes(item.get('tipo')),
+        'status': item.get('estado'),
+        'created_at': _fecha_iso(item.get('fecha_agendamiento'))
+    }
+
+
+def _init_progress(conn: Connection):
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS import_progress ('
+        'source TEXT PRIMARY KEY, items_done INTEGER NOT NULL, updated_at TEXT)'
+    )
+    conn.commit()
+
+
+def _items_done(conn: Connection, source: str) -> int:
+    row = conn.execute('SELECT items_done FROM import_progress WHERE source = ?', (source,)).fetchone()
+    return row[0] if row else 0
+
+
+def _guardar_avance(conn: Connection, source: str, items_done: int):
+    conn.execute(
+        'INSERT INTO import_progress (source, items_done, updated_at) VALUES (?, ?, ?) '
+        'ON CONFLICT (source) DO UPDATE SET items_done = excluded.items_done, updated_at = excluded.updated_at',
+        (source, items_done, datetime.now().isoformat())
+    )
+
+
+def _importar_lead(conn: Connection, item: Dict[str, Any], resumen: Dict[str, int]):
+    lead = mapear_lead(item)
+    if db_module.normalize_phone(lead['phone']) is None:
+        resumen['omitidos'] += 1
+        return
+    db_module.insert_lead(conn, lead, commit=False)
+    resumen['leads'] += 1
+
+
+def _importar_cita(conn: Connection, item: Dict[str, Any], resumen: Dict[str, int]):
+    lead_row = db_module.find_lead_by_phone(conn, item.get('telefono'))
+    if lead_row is None:
+        if db_module.normalize_phone(item.get('telefono')) is None:
+            resumen['omitidos'] += 1
+            return
+        # Cita sin lead importado: se crea el lead con los datos de la cita
+        lead_id = db_module.insert_lead(conn, mapear_lead({
+            'nombre': item.get('nombre'), 'telefono': item.get('telefono'),
+            'interes': item.get('tipo'), 'fecha': item.get('fecha_agendamiento')
+        }), commit=False)
+    else:
+        lead_id = lead_row['id']
+    cita = dict(mapear_cita(item), lead_id=lead_id)
+    if db_module.insert_appointment_if_missing(conn, cita) is None:
+        resumen['omitidos'] += 1
+    else:
+        resumen['citas'] += 1
+
+
+def importar_archivo(conn: Connection, path: str, tipo: str, batch_size: int = 1000) -> Dict[str, int]:
+    """Importa leads.json[l] (tipo 'leads') o citas.json[l] (tipo 'citas') por lotes.
+
+    Retoma desde el último lote confirmado para ese archivo; en un diario .jsonl que
+    siguió creciendo, repetir la importación agrega sólo los registros nuevos.
+    """
+    importar = _importar_lead if tipo == 'leads' else _importar_cita
+    source = f'{tipo}:{os.path.basename(path)}'
+    resumen = {'leads': 0, 'citas': 0, 'omitidos': 0, 'ya_importados': 0}
+    _init_progress(conn)
+    hechos = _items_done(conn, source)
+    resumen['ya_importados'] = hechos
+
+    jsonl = path.endswith('.jsonl')
+    with open(path, 'rb') if jsonl else open(path, 'r', encoding='utf-8') as f:
+        indice = 0
+        pendientes = 0
+        for indice, item in enumerate(iter_jsonl(f) if jsonl else iter_json_array(f), start=1):
+            if indice <= hechos:
+                continue
+            if isinstance(item, dict):
+                importar(conn, item, resumen)
+            else:
+                resumen['omitidos'] += 1
+            pendientes += 1
+            if pendientes >= batch_size:
+                _guardar_avance(conn, source, indice)
+                conn.commit()
+                pendientes = 0
+        if pendientes:
+            _guardar_avance(conn, source, indice)
+            conn.commit()
+    return resumen
+
+
+def importar_directorio(conn: Connection, directorio: str, batch_size: int = 1000) -> Dict[str, Dict[str, int]]:
+    """Importa los leads y luego las citas (las citas se enlazan por teléfono)."""
+    resultados = {}
+    for tipo, nombre in (('leads', 'leads.json'), ('leads', 'leads.jsonl'),
+                         ('citas', 'citas.json'), ('citas', 'citas.jsonl')):
+        path = os.path.join(directorio, nombre)
+        if os.path.exists(path):
+            resultados[nombre] = importar_archivo(conn, path, tipo, batch_size)
+    return resultados
+
+
+def archivar_importado(conn: Connection, directorio: str, nombre: str) -> str:
+    """Renombra un archivo ya importado a *.importado y olvida su avance, para que un
+    archivo nuevo con el mismo nombre se importe desde el principio."""
+    path = os.path.join(directorio, nombre)
+    destino = path + '.importado'
+    os.replace(path, destino)
+    tipo = 'leads' if nombre.startswith('leads') else 'citas'
+    conn.execute('DELETE FROM import_progress WHERE source = ?', (f'{tipo}:{nombre}',))
+    conn.commit()
+    return destino
+
+
+def main(argv=None):
+    base = os.path.join(os.path.dirname(__file__), '..', 'datos_academia')
+    parser = argparse.ArgumentParser(description='Importa los leads y citas de la app de escritorio a SQLite.')
+    parser.add_argument('--dir', default=base, help='Directorio con leads.json[l] y citas.json[l]')
+    parser.add_argument('--database', default=os.path.join(base, 'data.db'), help='Ruta de la base SQLite')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Elementos por transacción')
+    args = parser.parse_args(argv)
+
+    conn = db_module.init_db(args.database)
+    try:
+        resultados = importar_directorio(conn, args.dir, args.batch_size)
+    finally:
+        conn.close()
+    for nombre, resumen in resultados.items():
+        print(f"{nombre}: {resumen['leads']} leads, {resumen['citas']} citas, "
+              f"{resumen['omitidos']} omitidos, {resumen['ya_importados']} ya importados antes")
+    if not resultados:
+        print(f'No se encontraron leads.json[l] ni citas.json[l] en {args.dir}')
+
+
+if __name__ == '__main__':
+    main()
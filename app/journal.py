@@ -0,0 +1,114 @@
+"""
+app.journal
+Diario JSONL de sólo anexado para los datos de la app de escritorio
+(datos_academia/leads.jsonl y citas.jsonl): un registro JSON por línea.
+
+Guardar un lead o una cita escribe una sola línea al final del archivo, así que el costo
+no depende de cuántos registros haya. Si el proceso muere a mitad de una escritura, la
+última línea queda cortada: al cargar se descarta y el archivo se trunca hasta la última
+línea completa. compactar() reescribe el diario completo en un temporal y lo sustituye
+con os.replace (atómico), para migrar los leads.json/citas.json antiguos o limpiar
+líneas dañadas; no se llama en cada guardado.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, IO, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def iter_jsonl(f: IO[bytes]) -> Iterator[Any]:
+    """Registros de un archivo JSONL abierto en binario; ignora líneas vacías, dañadas o
+    una última línea sin terminar."""
+    for linea in f:
+        if not linea.endswith(b'\n'):
+            return
+        if linea.strip():
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                continue
+
+
+class Journal:
+    def __init__(self, path: str, fsync: bool = False):
+        """Con `fsync` cada registro se fuerza a disco (más lento, sobrevive a un corte de luz)."""
+        self.path = str(path)
+        self.fsync = fsync
+        self.registros = 0
+        # Líneas dañadas encontradas en la última carga (sólo la compactación las quita)
+        self.lineas_invalidas = 0
+        self.cola_descartada = False
+        self._archivo: Optional[IO[bytes]] = None
+
+    def existe(self) -> bool:
+        return os.path.exists(self.path)
+
+    def cargar(self) -> Iterator[Dict[str, Any]]:
+        """Recorre los registros del diario sin leerlo entero en memoria.
+
+        Una última línea cortada se descarta y se trunca del archivo al terminar.
+        """
+        self.registros = 0
+        self.lineas_invalidas = 0
+        self.cola_descartada = False
+        if not self.existe():
+            return
+        valido_hasta = 0
+        with open(self.path, 'rb') as f:
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    self.cola_descartada = True
+                    break
+                valido_hasta += len(linea)
+                if not linea.strip():
+                    continue
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    self.lineas_invalidas += 1
+                    continue
+                self.registros += 1
+                yield registro
+        if self.cola_descartada:
+            logger.warning('%s: se descartó una última línea incompleta', self.path)
+            os.truncate(self.path, valido_hasta)
+
+    def _abrir(self) -> IO[bytes]:
+        if self._archivo is None:
+            directorio = os.path.dirname(self.path)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._archivo = open(self.path, 'ab')
+        return self._archivo
+
+    def agregar(self, registro: Dict[str, Any]):
+        """Anexa un registro como una línea completa."""
+        f = self._abrir()
+        f.write(json.dumps(registro, ensure_ascii=False).encode('utf-8') + b'\n')
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+        self.registros += 1
+
+    def compactar(self, registros: Iterable[Dict[str, Any]]):
+        """Sustituye el diario por `registros` de forma atómica."""
+        self.cerrar()
+        temporal = self.path + '.tmp'
+        n = 0
+        with open(temporal, 'wb') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False).encode('utf-8') + b'\n')
+                n += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.path)
+        self.registros = n
+        self.lineas_invalidas = 0
+        self.cola_descartada = False
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
@@ -0,0 +1,170 @@
+"""
+app.metrics
+Métricas de latencia en proceso, expuestas en formato de texto Prometheus en /metrics.
+
+Registra por ruta un histograma de latencia, el número de peticiones y de errores,
+y las peticiones en curso; además histogramas por etapa interna de /api/lead
+(clasificación, insert_lead, insert_appointment, commit). Cada observación sólo
+busca su cubeta con bisect y suma bajo un lock propio del histograma.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, g, request, Response
+
+# Límites superiores (segundos) de las cubetas; la última cubeta es +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count', '_lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[list, float, int]:
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.stages: Dict[str, Histogram] = {}
+        # (método, ruta, código) -> peticiones
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.in_flight = 0
+        self.startup_seconds: Optional[float] = None
+        # Funciones que devuelven líneas ya formateadas de otros módulos (p. ej. admisión)
+        self.collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def _histogram(self, mapa: dict, clave) -> Histogram:
+        hist = mapa.get(clave)
+        if hist is None:
+            with self._lock:
+                hist = mapa.setdefault(clave, Histogram(self.buckets))
+        return hist
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float):
+        self._histogram(self.latency, (method, route)).observe(seconds)
+        clave = (method, route, status)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[clave] = self.requests.get(clave, 0) + 1
+            if status >= 500:
+                self.errors[(method, route)] = self.errors.get((method, route), 0) + 1
+
+    def observe_stage(self, stage: str, seconds: float):
+        self._histogram(self.stages, stage).observe(seconds)
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Texto en formato de exposición de Prometheus (versión 0.0.4)."""
+        lineas = []
+        with self._lock:
+            requests = dict(self.requests)
+            errors = dict(self.errors)
+            in_flight = self.in_flight
+            latency = dict(self.latency)
+            stages = dict(self.stages)
+
+        lineas.append('# HELP http_requests_total Peticiones HTTP atendidas.')
+        lineas.append('# TYPE http_requests_total counter')
+        for (method, route, status), n in sorted(requests.items()):
+            lineas.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+        lineas.append('# HELP http_request_errors_total Peticiones HTTP con respuesta 5xx.')
+        lineas.append('# TYPE http_request_errors_total counter')
+        for (method, route), n in sorted(errors.items()):
+            lineas.append(f'http_request_errors_total{{method="{method}",route="{route}"}} {n}')
+        lineas.append('# HELP http_requests_in_flight Peticiones HTTP en curso.')
+        lineas.append('# TYPE http_requests_in_flight gauge')
+        lineas.append(f'http_requests_in_flight {in_flight}')
+        if self.startup_seconds is not None:
+            lineas.append('# HELP app_startup_seconds Tiempo de arranque y precalentamiento de create_app.')
+            lineas.append('# TYPE app_startup_seconds gauge')
+            lineas.append(f'app_startup_seconds {self.startup_seconds:.6f}')
+
+        lineas.append('# HELP http_request_duration_seconds Latencia de las peticiones HTTP.')
+        lineas.append('# TYPE http_request_duration_seconds histogram')
+        for (method, route), hist in sorted(latency.items()):
+            self._render_histogram(lineas, 'http_request_duration_seconds', f'method="{method}",route="{route}"', hist)
+        lineas.append('# HELP lead_stage_duration_seconds Latencia de las etapas internas de /api/lead.')
+        lineas.append('# TYPE lead_stage_duration_seconds histogram')
+        for stage, hist in sorted(stages.items()):
+            self._render_histogram(lineas, 'lead_stage_duration_seconds', f'stage="{stage}"', hist)
+        for collector in self.collectors:
+            lineas.extend(collector())
+        return '\n'.join(lineas) + '\n'
+
+    def _render_histogram(self, lineas: list, nombre: str, etiquetas: str, hist: Histogram):
+        counts, total, count = hist.snapshot()
+        acumulado = 0
+        for limite, n in zip(self.buckets, counts):
+            acumulado += n
+            lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+        lineas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {count}')
+        lineas.append(f'{nombre}_sum{{{etiquetas}}} {total:.6f}')
+        lineas.append(f'{nombre}_count{{{etiquetas}}} {count}')
+
+
+def get_registry() -> Optional[MetricsRegistry]:
+    return current_app.extensions.get('metrics')
+
+
+def observe_stage(stage: str, seconds: float):
+    """Registra la duración de una etapa interna; no hace nada si las métricas están apagadas."""
+    registry = current_app.extensions.get('metrics')
+    if registry is not None:
+        registry.observe_stage(stage, seconds)
+
+
+def init_app(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    registry = MetricsRegistry()
+    app.extensions['metrics'] = registry
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = perf_counter()
+        registry.request_started()
+
+    @app.after_request
+    def _metrics_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_finish(exc=None):
+        t0 = g.pop('_metrics_t0', None)
+        if t0 is None:
+            return
+        status = 500 if exc is not None else g.pop('_metrics_status', 500)
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        registry.request_finished(request.method, route, status, perf_counter() - t0)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,290 @@
+"""
+app.notifications
+Confirmaciones de cita por SMS/WhatsApp fuera del camino de la petición.
+
+/api/lead sólo inserta el mensaje en la tabla outbox, en la misma transacción que la
+cita (db.insert_appointment con 'notification'); un hilo Dispatcher toma los mensajes
+vencidos en lotes de NOTIFY_BATCH_SIZE, los entrega a la pasarela configurada y guarda
+el resultado. Los fallos se reintentan con espera exponencial (NOTIFY_BACKOFF_SECONDS,
+duplicándose hasta NOTIFY_BACKOFF_MAX_SECONDS) y tras NOTIFY_MAX_ATTEMPTS intentos el
+mensaje queda como 'failed'.
+
+Pasarelas (NOTIFY_GATEWAY):
+    None  (por defecto) sin pasarela: no se despacha nada y los mensajes quedan 'pending'
+    http  POST JSON con el lote a NOTIFY_HTTP_URL; ver HttpGateway
+    stub  no entrega nada, sólo simula envíos correctos (pruebas); hay que pedirlo explícitamente
+
+El despachador también puede correr aparte del servidor web:
+    python -m app.notifications --database datos_academia/data.db --url http://pasarela/enviar
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+from . import db as db_module
+
+logger = logging.getLogger(__name__)
+
+
+def mensaje_confirmacion(lead: Dict[str, str], cita: Dict[str, str], canal: str) -> Optional[Dict[str, str]]:
+    """Notificación para la cita de `lead`, o None si el teléfono no tiene dígitos."""
+    destinatario = db_module.normalize_phone(lead.get('phone'))
+    if destinatario is None:
+        return None
+    nombre = (lead.get('name') or '').split(' ')[0]
+    return {
+        'channel': canal,
+        'recipient': destinatario,
+        'body': (f"Hola {nombre}, su cita con Academia Sin Fronteras quedó agendada para el "
+                 f"{cita['date']} a las {cita['time']}. ¡Le esperamos!")
+    }
+
+
+class Gateway:
+    """Interfaz de pasarela: entrega un lote y devuelve, por mensaje, None si se
+    envió o el texto del error. Una excepción cuenta como fallo de todo el lote."""
+
+    def send_batch(self, mensajes: Sequence[Dict]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+
+class StubGateway(Gateway):
+    def __init__(self, latencia: float = 0.0, max_enviados: int = 1000):
+        """Sólo conserva los últimos `max_enviados` mensajes "enviados"."""
+        self.latencia = latencia
+        self.enviados: Deque[Dict] = deque(maxlen=max_enviados)
+        # Errores a devolver en los próximos envíos, uno por mensaje (p. ej. para pruebas)
+        self.fallos: List[str] = []
+        self._lock = threading.Lock()
+
+    def send_batch(self, mensajes: Sequence[Dict]) -> List[Optional[str]]:
+        if self.latencia:
+            time.sleep(self.latencia)
+        resultados: List[Optional[str]] = []
+        with self._lock:
+            for mensaje in mensajes:
+                if self.fallos:
+                    resultados.append(self.fallos.pop(0))
+                else:
+                    self.enviados.append(dict(mensaje))
+                    resultados.append(None)
+        return resultados
+
+
+class HttpGateway(Gateway):
+    """POST {"messages": [{id, channel, recipient, body}, ...]} a `url`.
+
+    Se espera 2xx con {"results": [{"id": ..., "error": null | "texto"}, ...]};
+    un id ausente de la respuesta cuenta como enviado.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0, token: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.token = token
+
+    def send_batch(self, mensajes: Sequence[Dict]) -> List[Optional[str]]:
+        cuerpo = json.dumps({'messages': [
+            {'id': m['id'], 'channel': m['channel'], 'recipient': m['recipient'], 'body': m['body']} for m in mensajes
+        ]}).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        peticion = urllib.request.Request(self.url, data=cuerpo, headers=headers, method='POST')
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            datos = json.loads(respuesta.read() or b'{}')
+        errores = {r.get('id'): r.get('error') for r in datos.get('results', [])}
+        return [errores.get(m['id']) for m in mensajes]
+
+
+class Dispatcher:
+    """Hilo que vacía el outbox en lotes con su propia conexión."""
+
+    def __init__(self, db_path: str, gateway: Gateway, batch_size: int = 50, max_attempts: int = 5,
+                 backoff_seconds: float = 2.0, backoff_max_seconds: float = 300.0,
+                 poll_seconds: float = 1.0, lease_seconds: float = 60.0, busy_timeout_ms: int = 5000):
+        self.gateway = gateway
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self._conn = db_module.get_connection(db_path, busy_timeout_ms)
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def despertar(self):
+        """Avisa de mensajes nuevos para no esperar al siguiente sondeo."""
+        self._despertar.set()
+
+    def close(self, timeout: Optional[float] = 5.0):
+        if self._parar.is_set():
+            return
+        self._parar.set()
+        self._despertar.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._conn.close()
+
+    def espera_reintento(self, intentos: int) -> float:
+        """Espera exponencial con ±20 % de variación para no reintentar todos a la vez."""
+        base = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (intentos - 1))
+        return base * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while not self._parar.is_set():
+            try:
+                procesados = self.procesar_lote()
+            except Exception:
+                logger.exception('Error despachando el outbox')
+                procesados = 0
+            # Lote lleno: probablemente quedan más, seguir sin esperar
+            if procesados < self.batch_size:
+                self._despertar.wait(self.poll_seconds)
+                self._despertar.clear()
+
+    def procesar_lote(self) -> int:
+        """Envía un lote de mensajes vencidos y guarda el resultado; devuelve cuántos tomó."""
+        ahora = time.time()
+        mensajes = [dict(fila) for fila in db_module.claim_notifications(
+            self._conn, ahora, self.lease_seconds, self.batch_size)]
+        if not mensajes:
+            return 0
+        try:
+            resultados = self.gateway.send_batch(mensajes)
+        except Exception as e:
+            resultados = [f'{type(e).__name__}: {e}'] * len(mensajes)
+
+        enviados, reintentos, fallidos = [], [], []
+        for mensaje, error in zip(mensajes, resultados):
+            if error is None:
+                enviados.append(mensaje['id'])
+            elif mensaje['attempts'] >= self.max_attempts:
+                fallidos.append((error, mensaje['id']))
+            else:
+                reintentos.append((time.time() + self.espera_reintento(mensaje['attempts']), error, mensaje['id']))
+        db_module.record_deliveries(self._conn, enviados, reintentos, fallidos)
+        with self._lock:
+            self.batches += 1
+            self.sent += len(enviados)
+            self.retried += len(reintentos)
+            self.failed += len(fallidos)
+        return len(mensajes)
+
+    def render_metrics(self) -> List[str]:
+        with self._lock:
+            datos = {'sent': self.sent, 'retried': self.retried, 'failed': self.failed, 'batches': self.batches}
+        lineas = [
+            '# HELP outbox_deliveries_total Resultados de entrega de confirmaciones (retried = se reintentará).',
+            '# TYPE outbox_deliveries_total counter',
+        ]
+        lineas.extend(f'outbox_deliveries_total{{result="{r}"}} {datos[r]}' for r in ('sent', 'retried', 'failed'))
+        lineas += [
+            '# HELP outbox_batches_total Lotes entregados a la pasarela.',
+            '# TYPE outbox_batches_total counter',
+            f"outbox_batches_total {datos['batches']}",
+        ]
+        return lineas
+
+
+def crear_gateway(config) -> Optional[Gateway]:
+    """Pasarela según NOTIFY_GATEWAY; None si no hay ninguna configurada."""
+    tipo = config.get('NOTIFY_GATEWAY')
+    if not tipo:
+        return None
+    if tipo == 'stub':
+        return StubGateway()
+    if tipo == 'http':
+        if not config.get('NOTIFY_HTTP_URL'):
+            raise ValueError('NOTIFY_GATEWAY=http requiere NOTIFY_HTTP_URL')
+        return HttpGateway(config['NOTIFY_HTTP_URL'], timeout=config['NOTIFY_HTTP_TIMEOUT'],
+                           token=config.get('NOTIFY_HTTP_TOKEN'))
+    raise ValueError(f'Pasarela de notificaciones desconocida: {tipo!r}')
+
+
+def crear_dispatcher(db_path: str, gateway: Gateway, config) -> Dispatcher:
+    return Dispatcher(
+        db_path, gateway,
+        batch_size=config['NOTIFY_BATCH_SIZE'],
+        max_attempts=config['NOTIFY_MAX_ATTEMPTS'],
+        backoff_seconds=config['NOTIFY_BACKOFF_SECONDS'],
+        backoff_max_seconds=config['NOTIFY_BACKOFF_MAX_SECONDS'],
+        poll_seconds=config['NOTIFY_POLL_SECONDS'],
+        busy_timeout_ms=config['DB_BUSY_TIMEOUT_MS']
+    )
+
+
+def despertar(app):
+    dispatcher = app.extensions.get('notifier')
+    if dispatcher is not None:
+        dispatcher.despertar()
+
+
+def init_app(app):
+    """Arranca el despachador en segundo plano (si NOTIFY_ENABLED y NOTIFY_DISPATCHER)."""
+    if not (app.config['NOTIFY_ENABLED'] and app.config['NOTIFY_DISPATCHER']):
+        return
+    gateway = crear_gateway(app.config)
+    if gateway is None:
+        # Sin pasarela no se marca nada como enviado: los mensajes esperan en el outbox
+        logger.info('NOTIFY_GATEWAY sin configurar: las confirmaciones quedan pendientes en el outbox')
+        return
+    import atexit
+    dispatcher = crear_dispatcher(app.config['DATABASE'], gateway, app.config).start()
+    app.extensions['notifier'] = dispatcher
+    atexit.register(dispatcher.close)
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.add_collector(dispatcher.render_metrics)
+
+
+def main(argv=None):
+    from . import create_app
+    parser = argparse.ArgumentParser(description='Despachador del outbox de confirmaciones.')
+    parser.add_argument('--database', help='Ruta de la base SQLite (por defecto datos_academia/data.db)')
+    parser.add_argument('--url', help='URL de la pasarela HTTP (o NOTIFY_GATEWAY=http y NOTIFY_HTTP_URL en la configuración)')
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args(argv)
+
+    config = {'NOTIFY_DISPATCHER': False}
+    if args.database:
+        config['DATABASE'] = args.database
+    app = create_app(config)
+    if args.url:
+        app.config.update(NOTIFY_GATEWAY='http', NOTIFY_HTTP_URL=args.url)
+    if args.batch_size:
+        app.config['NOTIFY_BATCH_SIZE'] = args.batch_size
+    gateway = crear_gateway(app.config)
+    if gateway is None:
+        parser.error('no hay pasarela configurada: indique --url')
+    dispatcher = crear_dispatcher(app.config['DATABASE'], gateway, app.config).start()
+    logging.basicConfig(level=logging.INFO)
+    logger.info('Despachando el outbox de %s', app.config['DATABASE'])
+    try:
+        while True:
+            time.sleep(60)
+            logger.info('Enviados %d, reintentos %d, fallidos %d', dispatcher.sent, dispatcher.retried, dispatcher.failed)
+    except KeyboardInterrupt:
+        dispatcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+app.profiling
+Perfilado opcional de peticiones, para investigar regresiones de latencia en el servicio
+en marcha.
+
+Se activa con PROFILE_ENABLED=True en la configuración o con la variable de entorno
+ASISTENTE_PROFILE=1. Se guarda un perfil de cada petición que cumpla cualquiera de las
+dos condiciones, por separado:
+
+- es 1 de cada PROFILE_SAMPLE_RATE (0 = sin muestreo): se perfila con cProfile;
+- tardó PROFILE_THRESHOLD_MS o más (0 = sin umbral): todas las peticiones se cronometran,
+  y mientras están en curso un hilo anota su pila cada PROFILE_STACK_INTERVAL_MS.
+
+cProfile admite un solo perfilador activo por proceso. Si otra petición ya lo ocupa, la
+muestra no se pierde: se guardan sus pilas muestreadas. Un perfil de cProfile se guarda
+como .prof (legible con pstats o snakeviz) y uno de pilas como .folded (pilas plegadas,
+para flamegraph.pl o speedscope). Los dos van con un .json de resumen.
+
+Un hilo de fondo escribe los perfiles en PROFILE_DIR: el volcado, el resumen y la
+rotación (se conservan los PROFILE_MAX_FILES más recientes) no corren en el hilo de la
+petición. Si ese hilo se atrasa más de PROFILE_WRITE_QUEUE perfiles, los nuevos se
+descartan y se cuentan en /metrics. GET /debug/profiles lista los más lentos con sus
+funciones principales.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import queue
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import g, jsonify, request
+
+TOP_FUNCIONES = 10
+# Marcos como máximo por pila muestreada (los más cercanos a la raíz se descartan)
+MAX_PROFUNDIDAD = 128
+
+# Un solo cProfile activo por proceso; se toma sin bloquear en _profile_start
+_PERFILANDO = threading.Lock()
+
+
+def _resumen_funciones(profile: cProfile.Profile, limite: int = TOP_FUNCIONES) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    stats.sort_stats('cumulative')
+    funciones = []
+    for func in stats.fcn_list[:limite]:
+        _, ncalls, tottime, cumtime, _ = stats.stats[func]
+        archivo, linea, nombre = func
+        funciones.append({
+            'function': f'{os.path.basename(archivo)}:{linea}({nombre})',
+            'ncalls': ncalls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3)
+        })
+    return funciones
+
+
+def _resumen_pilas(pilas: Counter, intervalo_ms: float, limite: int = TOP_FUNCIONES) -> List[Dict[str, Any]]:
+    # Tiempo acumulado estimado: muestras en que la función estaba en la pila
+    muestras: Counter = Counter()
+    propias: Counter = Counter()
+    for pila, n in pilas.items():
+        marcos = pila.split(';')
+        for marco in set(marcos):
+            muestras[marco] += n
+        propias[marcos[-1]] += n
+    return [{
+        'function': marco,
+        'samples': n,
+        'tottime_ms': round(propias[marco] * intervalo_ms, 3),
+        'cumtime_ms': round(n * intervalo_ms, 3)
+    } for marco, n in muestras.most_common(limite)]
+
+
+def _rotar(directorio: str, max_archivos: int):
+    resumenes = sorted(f for f in os.listdir(directorio) if f.endswith('.json'))
+    for nombre in resumenes[:max(0, len(resumenes) - max_archivos)]:
+        base = os.path.join(directorio, nombre[:-len('.json')])
+        for ext in ('.json', '.prof', '.folded'):
+            try:
+                os.remove(base + ext)
+            except FileNotFoundError:
+                pass
+
+
+def _base(directorio: str, resumen: Dict[str, Any]) -> str:
+    os.makedirs(directorio, exist_ok=True)
+    ruta = re.sub(r'[^A-Za-z0-9]+', '_', resumen['route']).strip('_') or 'root'
+    return os.path.join(directorio, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{resumen['method']}_{ruta}")
+
+
+def _escribir_resumen(base: str, resumen: Dict[str, Any]):
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(resumen, f, ensure_ascii=False)
+
+
+def guardar_perfil(directorio: str, profile: cProfile.Profile, resumen: Dict[str, Any], max_archivos: int):
+    base = _base(directorio, resumen)
+    profile.dump_stats(base + '.prof')
+    _escribir_resumen(base, dict(resumen, kind='cprofile', profile=os.path.basename(base + '.prof'),
+                                 top_functions=_resumen_funciones(profile)))
+    _rotar(directorio, max_archivos)
+
+
+def guardar_pilas(directorio: str, pilas: Counter, intervalo_ms: float, resumen: Dict[str, Any],
+                  max_archivos: int):
+    base = _base(directorio, resumen)
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        for pila, n in pilas.most_common():
+            f.write(f'{pila} {n}\n')
+    _escribir_resumen(base, dict(resumen, kind='stacks', profile=os.path.basename(base + '.folded'),
+                                 samples=sum(pilas.values()), interval_ms=intervalo_ms,
+                                 top_functions=_resumen_pilas(pilas, intervalo_ms)))
+    _rotar(directorio, max_archivos)
+
+
+class MuestreadorPilas:
+    """Hilo que cada `intervalo` segundos anota la pila de los hilos registrados."""
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self._pilas: Dict[int, Counter] = {}
+        self._nombres: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def iniciar(self, hilo: int):
+        with self._lock:
+            self._pilas[hilo] = Counter()
+
+    def terminar(self, hilo: int) -> Counter:
+        with self._lock:
+            return self._pilas.pop(hilo, None) or Counter()
+
+    def _nombre(self, code) -> str:
+        nombre = self._nombres.get(code)
+        if nombre is None:
+            nombre = self._nombres[code] = f'{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})'
+        return nombre
+
+    def _run(self):
+        while not self._parar.wait(self.intervalo):
+            with self._lock:
+                if not self._pilas:
+                    continue
+                marcos = sys._current_frames()
+                for hilo, pilas in self._pilas.items():
+                    frame = marcos.get(hilo)
+                    pila = []
+                    while frame is not None and len(pila) < MAX_PROFUNDIDAD:
+                        pila.append(self._nombre(frame.f_code))
+                        frame = frame.f_back
+                    if pila:
+                        pilas[';'.join(reversed(pila))] += 1
+                del marcos
+
+    def close(self):
+        self._parar.set()
+
+
+class EscritorPerfiles:
+    """Hilo que guarda los perfiles en disco, fuera del hilo de la petición."""
+
+    def __init__(self, max_pendientes: int = 16):
+        self.saved = 0
+        self.dropped = 0
+        self.failed = 0
+        self._cola: 'queue.Queue[Optional[Callable[[], None]]]' = queue.Queue(max_pendientes)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='profile-writer', daemon=True)
+        self._thread.start()
+
+    def encolar(self, guardar: Callable[[], None]) -> bool:
+        """Encola sin bloquear; False (y se cuenta) si el escritor va atrasado."""
+        try:
+            self._cola.put_nowait(guardar)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def esperar(self):
+        """Bloquea hasta escribir todo lo encolado."""
+        self._cola.join()
+
+    def _run(self):
+        while True:
+            guardar = self._cola.get()
+            try:
+                if guardar is None:
+                    return
+                guardar()
+                with self._lock:
+                    self.saved += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self._cola.task_done()
+
+    def close(self, timeout: Optional[float] = 5.0):
+        self._cola.put(None)
+        self._thread.join(timeout)
+
+    def render_metrics(self) -> List[str]:
+        with self._lock:
+            guardados, descartados, fallidos = self.saved, self.dropped, self.failed
+        return [
+            '# HELP profiles_saved_total Perfiles de petición guardados en PROFILE_DIR.',
+            '# TYPE profiles_saved_total counter',
+            f'profiles_saved_total {guardados}',
+            '# HELP profiles_dropped_total Perfiles descartados con la cola del escritor llena.',
+            '# TYPE profiles_dropped_total counter',
+            f'profiles_dropped_total {descartados}',
+            '# HELP profiles_failed_total Perfiles que no se pudieron escribir.',
+            '# TYPE profiles_failed_total counter',
+            f'profiles_failed_total {fallidos}',
+        ]
+
+
+def listar_perfiles(directorio: str, limite: int = 20) -> List[Dict[str, Any]]:
+    """Resúmenes guardados, del más lento al más rápido."""
+    if not os.path.isdir(directorio):
+        return []
+    perfiles = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.json'):
+            try:
+                with open(os.path.join(directorio, nombre), encoding='utf-8') as f:
+                    perfiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    perfiles.sort(key=lambda p: p['elapsed_ms'], reverse=True)
+    return perfiles[:limite]
+
+
+def init_app(app):
+    enabled = app.config.get('PROFILE_ENABLED') or os.environ.get('ASISTENTE_PROFILE') == '1'
+    if not enabled:
+        return
+    import atexit
+    sample_rate = int(os.environ.get('ASISTENTE_PROFILE_SAMPLE_RATE', app.config['PROFILE_SAMPLE_RATE']))
+    threshold_ms = float(os.environ.get('ASISTENTE_PROFILE_THRESHOLD_MS', app.config['PROFILE_THRESHOLD_MS']))
+    intervalo_ms = float(app.config['PROFILE_STACK_INTERVAL_MS'])
+    directorio = app.config['PROFILE_DIR']
+    max_archivos = app.config['PROFILE_MAX_FILES']
+    contador = itertools.count(1)
+    escritor = EscritorPerfiles(app.config['PROFILE_WRITE_QUEUE'])
+    muestreador = MuestreadorPilas(intervalo_ms / 1000)
+    app.extensions['profiling'] = escritor
+    atexit.register(escritor.close)
+    atexit.register(muestreador.close)
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.add_collector(escritor.render_metrics)
+
+    @app.before_request
+    def _profile_start():
+        g._profile_t0 = perf_counter()
+        muestreada = sample_rate > 0 and next(contador) % sample_rate == 0
+        if muestreada and _PERFILANDO.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                g._profile = profile
+                return
+            except ValueError:
+                # Otra herramienta (depurador, coverage) ya ocupa el perfilador del intérprete
+                _PERFILANDO.release()
+        if muestreada or threshold_ms > 0:
+            g._profile_muestreada = muestreada
+            g._profile_hilo = threading.get_ident()
+            muestreador.iniciar(g._profile_hilo)
+
+    @app.teardown_request
+    def _profile_finish(exc=None):
+        t0 = g.pop('_profile_t0', None)
+        if t0 is None:
+            return
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            try:
+                profile.disable()
+            finally:
+                _PERFILANDO.release()
+            muestreada = True
+        else:
+            hilo = g.pop('_profile_hilo', None)
+            if hilo is None:
+                return
+            pilas = muestreador.terminar(hilo)
+            muestreada = g.pop('_profile_muestreada')
+        elapsed_ms = (perf_counter() - t0) * 1000
+        lenta = threshold_ms > 0 and elapsed_ms >= threshold_ms
+        if not (muestreada or lenta):
+            return
+        resumen = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule is not None else request.path,
+            'path': request.full_path.rstrip('?'),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'reason': 'threshold' if lenta else 'sample',
+            'captured_at': datetime.now().isoformat()
+        }
+        if profile is not None:
+            escritor.encolar(lambda: guardar_perfil(directorio, profile, resumen, max_archivos))
+        else:
+            escritor.encolar(lambda: guardar_pilas(directorio, pilas, intervalo_ms, resumen, max_archivos))
+
+    @app.route('/debug/profiles', methods=['GET'])
+    def debug_profiles():
+        limite = request.args.get('limit', default=20, type=int)
+        return jsonify({'profiles': listar_perfiles(directorio, limite)})
@@ -3,64 +3,465 @@ app.routes
 Rutas HTTP para la aplicación del Agente de Voz.
 Provee la página principal y endpoints REST para lead/agendamiento.
 """
-from flask import render_template, request, jsonify, current_app
+from flask import render_template, request, jsonify, current_app, Response, stream_with_context
 from . import db as db_module
 from . import agent as agent_module
+from . import events as events_module
+from . import export as export_module
+from . import metrics as metrics_module
+from . import admission as admission_module
+from . import idempotency as idempotency_module
+from . import notifications as notifications_module
+from . import scheduler as scheduler_module
+import atexit
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import perf_counter
+
+
+def validar_lead(data) -> str:
+    """Devuelve un mensaje de error si el lead no es válido, o '' si lo es."""
+    if not isinstance(data, dict):
+        return 'Cada lead debe ser un objeto JSON'
+    if not data.get('name') or not data.get('phone'):
+        return 'Faltan campos name o phone'
+    if db_module.normalize_phone(data.get('phone')) is None:
+        return 'El campo phone debe contener dígitos'
+    return ''
+
+
+def crear_cita_payload(lead_id, lead_payload, cita=None) -> dict:
+    """Payload de la cita; con NOTIFY_ENABLED lleva el mensaje de confirmación que
+    db.insert_appointment encola en el outbox."""
+    cita = cita or agent_module.proponer_cita()
+    appt_payload = {
+        'lead_id': lead_id,
+        'date': cita['date'],
+        'time': cita['time'],
+        'type': lead_payload['interest'],
+        'status': 'Confirmada',
+        'created_at': datetime.now().isoformat()
+    }
+    if current_app.config['NOTIFY_ENABLED']:
+        appt_payload['notification'] = notifications_module.mensaje_confirmacion(
+            lead_payload, appt_payload, current_app.config['NOTIFY_CHANNEL'])
+    return appt_payload
+
+
+# Reintentos cuando otra instancia llena el turno apartado antes de guardar la cita
+MAX_INTENTOS_CITA = 5
+AVISO_SIN_TURNOS = 'No hay turnos disponibles; el lead se guardó sin cita'
+
+
+def agendar_cita(conn, scheduler, lead_id, lead_payload):
+    """Aparta un turno y guarda la cita en la transacción abierta de `conn` (sin commit).
+
+    Devuelve (payload, id) o (None, None) si no quedan cupos. Quien llama confirma o
+    libera el turno en el scheduler según termine la transacción.
+    """
+    for _ in range(MAX_INTENTOS_CITA):
+        try:
+            cita = agent_module.proponer_cita(scheduler, conn)
+        except scheduler_module.SinCuposError:
+            return None, None
+        appt_payload = crear_cita_payload(lead_id, lead_payload, cita)
+        try:
+            appt_id = db_module.insert_appointment(conn, appt_payload, commit=False, capacity=scheduler.capacidad)
+        except db_module.SlotUnavailableError:
+            scheduler.liberar(cita['date'], cita['time'])
+            scheduler.refrescar(conn, cita['date'])
+            continue
+        return appt_payload, appt_id
+    return None, None
+
+
+def respuesta_lead(lead_payload, wants_schedule: bool, appt_payload, lead_id, appt_id) -> dict:
+    """Cuerpo de la respuesta de POST /api/lead."""
+    response = {'lead_id': lead_id, 'qualification': lead_payload['qualification'], 'interest': lead_payload['interest']}
+    if appt_payload is not None:
+        response['appointment'] = {'id': appt_id, 'date': appt_payload['date'], 'time': appt_payload['time']}
+    elif wants_schedule:
+        response['appointment'] = None
+        response['warning'] = AVISO_SIN_TURNOS
+    return response
+
+
+def guardar_lead_diferido(writer, scheduler, lead_payload, wants_schedule: bool, timeout: float,
+                          idempotencia=None):
+    """Como agendar_cita pero a través del escritor diferido; devuelve (lead_id, payload, appt_id).
+
+    `idempotencia`: (clave, huella) de la petición; la respuesta se guarda en la misma
+    transacción que el lead.
+    """
+    for intento in range(MAX_INTENTOS_CITA + 1):
+        appt_payload = None
+        # En el último intento se guarda el lead sin cita antes que perderlo
+        if wants_schedule and intento < MAX_INTENTOS_CITA:
+            try:
+                appt_payload = crear_cita_payload(None, lead_payload, agent_module.proponer_cita(scheduler, db_module.get_db()))
+            except scheduler_module.SinCuposError:
+                pass
+        registro = None
+        if idempotencia is not None:
+            def cuerpo(lead_id, appt_id, appt_payload=appt_payload):
+                return json.dumps(respuesta_lead(lead_payload, wants_schedule, appt_payload, lead_id, appt_id))
+            registro = idempotencia + (cuerpo,)
+        try:
+            lead_id, appt_id = writer.submit_lead(lead_payload, appt_payload, registro).result(timeout=timeout)
+        except db_module.SlotUnavailableError:
+            scheduler.liberar(appt_payload['date'], appt_payload['time'])
+            scheduler.refrescar(db_module.get_db(), appt_payload['date'])
+            continue
+        except Exception:
+            if appt_payload is not None:
+                scheduler.liberar(appt_payload['date'], appt_payload['time'])
+            raise
+        if appt_payload is not None:
+            scheduler.confirmar(appt_payload['date'], appt_payload['time'])
+        return lead_id, appt_payload, appt_id
+
+
+def liberar_citas(scheduler, appointments):
+    for appt in appointments:
+        scheduler.liberar(appt['date'], appt['time'])
+
+
+def leer_filtros_listado(args) -> dict:
+    """Lee paginación y filtros de la query string de /api/leads y /api/appointments.
+
+    `from` y `to` son fechas YYYY-MM-DD, ambas inclusive. Lanza ValueError si algún
+    parámetro no es válido.
+    """
+    limit = args.get('limit', default=50, type=int)
+    if limit is None or not 1 <= limit <= 500:
+        raise ValueError('limit debe estar entre 1 y 500')
+    cursor = args.get('cursor')
+    filtros = {
+        'limit': limit,
+        'cursor': int(cursor) if cursor else None,
+        'interest': args.get('interest') or None,
+        'qualification': args.get('qualification') or None,
+        'date_from': None,
+        'date_to': None
+    }
+    if args.get('from'):
+        filtros['date_from'] = datetime.strptime(args['from'], '%Y-%m-%d').strftime('%Y-%m-%d')
+    if args.get('to'):
+        hasta = datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1)
+        filtros['date_to'] = hasta.strftime('%Y-%m-%d')
+    return filtros
+
+
+def setup_database(app):
+    """Crea/migra la base, el pool de conexiones y, si se pidió, el escritor diferido."""
+    db_path = app.config['DATABASE']
+    # Inicializar DB si es necesario
+    db_module.init_db(db_path).close()
+    # Pool de conexiones; cada petición toma una con db_module.get_db()
+    app.extensions['db_pool'] = db_module.ConnectionPool(
+        db_path,
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS']
+    )
+    # Turnos de cita con su ocupación por día en memoria
+    app.extensions['scheduler'] = scheduler_module.crear_scheduler(app.config, db_module.count_appointments_by_slot)
+    # Modo opcional de escritura diferida con commit agrupado
+    if app.config['DB_WRITE_BEHIND']:
+        writer = db_module.WriteBehindWriter(
+            db_path,
+            batch_size=app.config['DB_WRITE_BATCH_SIZE'],
+            flush_interval_ms=app.config['DB_WRITE_FLUSH_MS'],
+            max_queue=app.config['DB_WRITE_QUEUE_SIZE'],
+            busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS'],
+            observe=app.extensions['metrics'].observe_stage if 'metrics' in app.extensions else None,
+            slot_capacity=app.config['SCHEDULE_SLOT_CAPACITY'],
+            # El stream de estadísticas recibe lo que cambió en cada commit agrupado
+            on_commit=(lambda cambios: events_module.stats_cambiados(app, cambios))
+            if app.config['STATS_STREAM_ENABLED'] else None
+        )
+        app.extensions['db_writer'] = writer
+        # Confirmar lo pendiente al apagar el proceso
+        atexit.register(writer.close)
+
+
+def warm_up(app):
+    """Precalienta lo que de otro modo pagaría la primera petición real."""
+    # Clasificador y reglas de calificación
+    agent_module.calificar_lead(agent_module.clasificar_interes('warm-up'))
+    # Compilar y cachear la plantilla principal
+    app.jinja_env.get_template('index.html')
+    # Compilar el mapa de URLs y preparar el parseo/serialización JSON sin despachar
+    # una petición real (no cuenta en métricas ni toca la base)
+    app.url_map.bind('localhost').match('/api/lead', method='POST')
+    with app.test_request_context('/api/lead', method='POST', json={'name': 'warm-up'}):
+        request.get_json()
+        jsonify({'status': 'ok'})
+    # Abrir una conexión del pool y tocar las tablas
+    pool = app.extensions['db_pool']
+    conn = pool.acquire()
+    try:
+        db_module.get_stats(conn)
+    finally:
+        pool.release(conn)
 
 
 def init_app(app):
-    @app.before_first_request
-    def setup_database():
-        db_path = app.config['DATABASE']
-        # Inicializar DB si es necesario
-        conn = db_module.init_db(db_path)
-        # Guardar conexión en app para uso posterior
-        app.config['DB_CONN'] = conn
+    setup_database(app)
+
+    app.teardown_appcontext(db_module.close_db)
+
+    @app.errorhandler(db_module.PoolExhaustedError)
+    @app.errorhandler(db_module.WriteQueueFullError)
+    def db_saturada(error):
+        return jsonify({'error': 'Servicio saturado, intente de nuevo'}), 503
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        """Liveness: el proceso responde."""
+        return jsonify({'status': 'ok'})
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        """Readiness: arranque y precalentamiento terminados y la base responde."""
+        if not app.extensions.get('ready'):
+            return jsonify({'status': 'starting'}), 503
+        try:
+            db_module.get_db().execute('SELECT 1').fetchone()
+        except Exception as e:
+            return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+        return jsonify({'status': 'ready', 'startup_seconds': round(app.extensions['startup_seconds'], 4)})
 
     @app.route('/')
     def index():
         return render_template('index.html')
 
     @app.route('/api/lead', methods=['POST'])
+    @admission_module.limitar
+    @idempotency_module.idempotente
     def api_lead():
         """Recibe un lead, lo califica y opcionalmente agenda.
         JSON esperado: {name, phone, interest_text, schedule (bool)}
+        Con la cabecera Idempotency-Key, un reintento repite la primera respuesta.
         """
         data = request.get_json(force=True)
+        error = validar_lead(data)
+        if error:
+            return jsonify({'error': error}), 400
+
         name = data.get('name')
         phone = data.get('phone')
         interest_text = data.get('interest_text', '')
         wants_schedule = bool(data.get('schedule', False))
 
-        if not name or not phone:
-            return jsonify({'error': 'Faltan campos name o phone'}), 400
-
-        # Crear payload y guardar lead
+        # Crear payload y guardar lead (y la cita, si se pidió) con un solo commit
+        t0 = perf_counter()
         lead_payload = agent_module.crear_lead_payload(name, phone, interest_text)
-        conn = current_app.config.get('DB_CONN')
-        lead_id = db_module.insert_lead(conn, lead_payload)
-
-        response = {'lead_id': lead_id, 'qualification': lead_payload['qualification'], 'interest': lead_payload['interest']}
-
-        if wants_schedule:
-            cita = agent_module.proponer_cita()
-            appt_payload = {
-                'lead_id': lead_id,
-                'date': cita['date'],
-                'time': cita['time'],
-                'type': lead_payload['interest'],
-                'status': 'Confirmada',
-                'created_at': datetime.now().isoformat()
-            }
-            appt_id = db_module.insert_appointment(conn, appt_payload)
-            response['appointment'] = {'id': appt_id, 'date': appt_payload['date'], 'time': appt_payload['time']}
-
-        return jsonify(response)
+        t1 = perf_counter()
+        metrics_module.observe_stage('crear_lead_payload', t1 - t0)
+
+        # Con Idempotency-Key la respuesta se guarda en la misma transacción que el lead
+        idempotencia = idempotency_module.pendiente()
+        scheduler = current_app.extensions['scheduler']
+        writer = current_app.extensions.get('db_writer')
+        if writer is not None:
+            lead_id, appt_payload, appt_id = guardar_lead_diferido(
+                writer, scheduler, lead_payload, wants_schedule, current_app.config['DB_WRITE_TIMEOUT'],
+                idempotencia)
+            metrics_module.observe_stage('write_behind_wait', perf_counter() - t1)
+            response = respuesta_lead(lead_payload, wants_schedule, appt_payload, lead_id, appt_id)
+            body = json.dumps(response)
+            if idempotencia is not None:
+                idempotency_module.guardada(200, body)
+        else:
+            conn = db_module.get_db()
+            appt_payload = appt_id = None
+            cambios = events_module.contador_cambios(current_app)
+            try:
+                lead_id = db_module.insert_lead(conn, lead_payload, commit=False, cambios=cambios)
+                t2 = perf_counter()
+                metrics_module.observe_stage('insert_lead', t2 - t1)
+                if wants_schedule:
+                    appt_payload, appt_id = agendar_cita(conn, scheduler, lead_id, lead_payload)
+                    if appt_payload is not None and cambios is not None:
+                        db_module.contar_cita(cambios, appt_payload)
+                    t3 = perf_counter()
+                    metrics_module.observe_stage('insert_appointment', t3 - t2)
+                    t2 = t3
+                response = respuesta_lead(lead_payload, wants_schedule, appt_payload, lead_id, appt_id)
+                body = json.dumps(response)
+                idempotency_module.guardar_en_transaccion(conn, 200, body)
+                conn.commit()
+            except Exception:
+                if appt_payload is not None:
+                    scheduler.liberar(appt_payload['date'], appt_payload['time'])
+                raise
+            if appt_payload is not None:
+                scheduler.confirmar(appt_payload['date'], appt_payload['time'])
+            metrics_module.observe_stage('commit', perf_counter() - t2)
+            events_module.stats_cambiados(current_app, cambios)
+        if appt_payload is not None:
+            notifications_module.despertar(current_app)
+        events_module.lead_guardado(current_app, dict(response))
+
+        return Response(body, mimetype='application/json')
+
+    @app.route('/api/leads/batch', methods=['POST'])
+    @admission_module.limitar
+    def api_leads_batch():
+        """Recibe un arreglo de leads y los guarda en una sola transacción.
+        JSON esperado: [{name, phone, interest_text, schedule (bool)}, ...]
+        Responde con un resultado por elemento: ids creados o el error de validación; un lead
+        que pidió cita y se quedó sin turno lleva appointment null y warning, como en /api/lead.
+        """
+        data = request.get_json(force=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'Se esperaba un arreglo de leads'}), 400
+        max_items = current_app.config['BATCH_MAX_ITEMS']
+        if len(data) > max_items:
+            return jsonify({'error': f'Máximo {max_items} leads por lote'}), 413
+
+        results = []
+        leads = []
+        # (posición del lead en `leads`, payload del lead) de los que piden cita
+        con_cita = []
+        for index, item in enumerate(data):
+            error = validar_lead(item)
+            if error:
+                results.append({'index': index, 'error': error})
+                continue
+            lead_payload = agent_module.crear_lead_payload(item['name'], item['phone'], item.get('interest_text', ''))
+            result = {'index': index, 'qualification': lead_payload['qualification'], 'interest': lead_payload['interest']}
+            if bool(item.get('schedule', False)):
+                con_cita.append((len(leads), lead_payload))
+                result['appointment'] = None
+            leads.append(lead_payload)
+            results.append(result)
+
+        conn = db_module.get_db()
+        scheduler = current_app.extensions['scheduler']
+        for intento in range(MAX_INTENTOS_CITA + 1):
+            appointments = []
+            cambios = events_module.contador_cambios(current_app)
+            # En el último intento se guardan los leads sin citas antes que perderlos
+            if intento < MAX_INTENTOS_CITA:
+                for lead_index, lead_payload in con_cita:
+                    try:
+                        cita = agent_module.proponer_cita(scheduler, conn)
+                    except scheduler_module.SinCuposError:
+                        break
+                    appt_payload = crear_cita_payload(None, lead_payload, cita)
+                    appt_payload['lead_index'] = lead_index
+                    appointments.append(appt_payload)
+            try:
+                lead_ids, appt_ids = db_module.insert_leads_batch(conn, leads, appointments,
+                                                                  capacity=scheduler.capacidad, cambios=cambios)
+            except db_module.SlotUnavailableError:
+                liberar_citas(scheduler, appointments)
+                for fecha in {a['date'] for a in appointments}:
+                    scheduler.refrescar(conn, fecha)
+                continue
+            except Exception:
+                liberar_citas(scheduler, appointments)
+                raise
+            for appt_payload in appointments:
+                scheduler.confirmar(appt_payload['date'], appt_payload['time'])
+            break
+        if appointments:
+            notifications_module.despertar(current_app)
+        events_module.stats_cambiados(current_app, cambios)
+
+        valid = [r for r in results if 'error' not in r]
+        for result, lead_id in zip(valid, lead_ids):
+            result['lead_id'] = lead_id
+        for appt_payload, appt_id in zip(appointments, appt_ids):
+            result = valid[appt_payload['lead_index']]
+            result['appointment'] = {'id': appt_id, 'date': appt_payload['date'], 'time': appt_payload['time']}
+        # Los que pidieron cita y no la obtuvieron reciben el mismo aviso que /api/lead
+        for result in valid:
+            if 'appointment' in result and result['appointment'] is None:
+                result['warning'] = AVISO_SIN_TURNOS
+
+        return jsonify({
+            'results': results,
+            'created': len(lead_ids),
+            'errors': len(results) - len(valid)
+        })
+
+    @app.route('/api/leads', methods=['GET'])
+    def api_leads():
+        """Lista leads del más reciente al más antiguo.
+        Query: limit, cursor (next_cursor de la página anterior), interest, qualification, from, to
+        """
+        try:
+            filtros = leer_filtros_listado(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        items, next_cursor = db_module.list_leads(db_module.get_db(), **filtros)
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+
+    @app.route('/api/appointments', methods=['GET'])
+    def api_appointments():
+        """Lista citas de la más reciente a la más antigua (mismos parámetros que /api/leads;
+        interest filtra por tipo de cita y from/to por la fecha de la cita)."""
+        try:
+            filtros = leer_filtros_listado(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        items, next_cursor = db_module.list_appointments(db_module.get_db(), **filtros)
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+
+    @app.route('/api/export', methods=['GET'])
+    def api_export():
+        """Exporta todos los leads con sus citas en streaming (format=csv|ndjson)."""
+        formato = request.args.get('format', 'csv')
+        if formato not in export_module.FORMATS:
+            return jsonify({'error': 'format debe ser csv o ndjson'}), 400
+        fragmentos = export_module.generar_export(db_module.get_db(), formato)
+        filename = f"leads_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+        return Response(
+            stream_with_context(fragmentos),
+            mimetype=export_module.FORMATS[formato],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+    @app.route('/api/stats/stream', methods=['GET'])
+    def api_stats_stream():
+        """Server-Sent Events con un snapshot inicial y luego los cambios (ver app/events.py)."""
+        publisher = app.extensions.get('stats_stream')
+        if publisher is None:
+            return jsonify({'error': 'Stream de estadísticas desactivado'}), 404
+        sus = publisher.suscribir()
+        if sus is None:
+            resp = jsonify({'error': 'Demasiados clientes conectados al stream'})
+            resp.status_code = 503
+            resp.headers['Retry-After'] = '5'
+            return resp
+        heartbeat = app.config['STATS_STREAM_HEARTBEAT_SECONDS']
+
+        def eventos():
+            try:
+                # EventSource reconecta a los 3 s si se corta (p. ej. tras un `dropped`)
+                yield 'retry: 3000\n\n'
+                while True:
+                    mensaje = sus.siguiente(heartbeat)
+                    if mensaje is events_module.FIN:
+                        break
+                    # Un comentario periódico detecta los clientes que ya se fueron
+                    yield ': ping\n\n' if mensaje is None else mensaje
+            finally:
+                publisher.cancelar(sus)
+
+        return Response(eventos(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
     @app.route('/api/stats', methods=['GET'])
     def api_stats():
-        conn = current_app.config.get('DB_CONN')
-        stats = db_module.get_stats(conn)
+        conn = db_module.get_db()
+        days = request.args.get('days', default=30, type=int)
+        stats = db_module.get_stats(conn, days=max(1, min(days, 366)))
+        cache = app.extensions.get('idempotency')
+        if cache is not None:
+            stats['idempotency'] = cache.stats()
         return jsonify(stats)
@@ -0,0 +1,195 @@
+"""
+app.scheduler
+Asignación de citas por cupos: horario de atención, duración del turno y número de
+asesores (capacidad) por turno.
+
+SlotScheduler mantiene en memoria la ocupación de cada día ya consultado (se carga una
+vez por día con cargar_dia, p. ej. db.count_appointments_by_slot) y, por día, la lista
+ordenada de turnos con cupo: el primer turno libre desde una hora se busca con bisect
+en O(log n) y ocupar o liberar un turno no recorre la tabla appointments.
+
+El índice en memoria es sólo una optimización: lo que impide sobrevender un turno
+entre hilos o procesos es el INSERT condicionado de db.insert_appointment(capacity=...).
+Quien reserva con reservar() debe llamar después a confirmar() (la cita quedó guardada)
+o a liberar() (no se guardó); si la base rechaza el turno porque otra instancia lo
+llenó, refrescar() vuelve a leer ese día.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Lunes (0) a sábado (5); el domingo no se atiende
+HORARIO_POR_DEFECTO: Dict[int, Tuple[str, str]] = {
+    0: ('09:00', '18:00'),
+    1: ('09:00', '18:00'),
+    2: ('09:00', '18:00'),
+    3: ('09:00', '18:00'),
+    4: ('09:00', '18:00'),
+    5: ('09:00', '13:00'),
+}
+
+
+class SinCuposError(Exception):
+    """No queda ningún turno libre dentro del horizonte de días configurado."""
+
+
+class HorarioAtencion:
+    """Turnos 'HH:MM' de cada día de la semana según apertura, cierre y duración."""
+
+    def __init__(self, horas: Dict[int, Tuple[str, str]], duracion_min: int):
+        if duracion_min <= 0:
+            raise ValueError('La duración del turno debe ser positiva')
+        self.duracion_min = duracion_min
+        self._turnos: Dict[int, Tuple[str, ...]] = {}
+        for dia_semana, (apertura, cierre) in horas.items():
+            inicio = datetime.strptime(apertura, '%H:%M')
+            fin = datetime.strptime(cierre, '%H:%M')
+            turnos = []
+            while inicio + timedelta(minutes=duracion_min) <= fin:
+                turnos.append(inicio.strftime('%H:%M'))
+                inicio += timedelta(minutes=duracion_min)
+            self._turnos[int(dia_semana)] = tuple(turnos)
+
+    def turnos(self, fecha: date) -> Tuple[str, ...]:
+        return self._turnos.get(fecha.weekday(), ())
+
+    def primer_turno(self, desde: date, dias_maximos: int = 14) -> Tuple[str, str]:
+        """Primer turno del horario a partir de `desde`, sin mirar la ocupación."""
+        for offset in range(dias_maximos + 1):
+            fecha = desde + timedelta(days=offset)
+            turnos = self.turnos(fecha)
+            if turnos:
+                return fecha.isoformat(), turnos[0]
+        raise SinCuposError('El horario de atención no tiene turnos')
+
+
+class _Dia:
+    __slots__ = ('turnos', 'ocupacion', 'pendientes', 'libres')
+
+    def __init__(self, turnos: Tuple[str, ...], ocupados: Dict[str, int], pendientes: Dict[int, int],
+                 capacidad: int):
+        self.turnos = turnos
+        self.pendientes = pendientes
+        self.ocupacion = [ocupados.get(t, 0) + pendientes.get(i, 0) for i, t in enumerate(turnos)]
+        self.libres = [i for i, n in enumerate(self.ocupacion) if n < capacidad]
+
+
+class SlotScheduler:
+    def __init__(self, horario: HorarioAtencion, capacidad: int,
+                 cargar_dia: Callable[[Any, str], Dict[str, int]],
+                 dias_minimos: int = 1, dias_maximos: int = 60):
+        """`cargar_dia(conn, 'YYYY-MM-DD')` devuelve {hora: citas ya guardadas}."""
+        if capacidad < 1:
+            raise ValueError('La capacidad por turno debe ser al menos 1')
+        self.horario = horario
+        self.capacidad = capacidad
+        self.cargar_dia = cargar_dia
+        self.dias_minimos = dias_minimos
+        self.dias_maximos = dias_maximos
+        self._dias: Dict[str, _Dia] = {}
+        self._hoy: Optional[date] = None
+        self._lock = threading.Lock()
+
+    def _dia(self, conn, fecha: date) -> _Dia:
+        # Llamar con self._lock tomado
+        clave = fecha.isoformat()
+        dia = self._dias.get(clave)
+        if dia is None:
+            turnos = self.horario.turnos(fecha)
+            ocupados = self.cargar_dia(conn, clave) if turnos else {}
+            dia = self._dias[clave] = _Dia(turnos, ocupados, {}, self.capacidad)
+        return dia
+
+    def _olvidar_pasados(self, hoy: date):
+        if self._hoy == hoy:
+            return
+        self._hoy = hoy
+        limite = hoy.isoformat()
+        for clave in [c for c in self._dias if c < limite]:
+            del self._dias[clave]
+
+    def reservar(self, conn=None, ahora: Optional[datetime] = None) -> Tuple[str, str]:
+        """Aparta el primer turno con cupo y devuelve (fecha, hora)."""
+        ahora = ahora or datetime.now()
+        with self._lock:
+            self._olvidar_pasados(ahora.date())
+            for offset in range(self.dias_minimos, self.dias_maximos + 1):
+                fecha = ahora.date() + timedelta(days=offset)
+                dia = self._dia(conn, fecha)
+                if not dia.libres:
+                    continue
+                pos = 0
+                if offset == 0:
+                    # Hoy sólo sirven los turnos que aún no empezaron
+                    desde = bisect_right(dia.turnos, ahora.strftime('%H:%M'))
+                    pos = bisect_left(dia.libres, desde)
+                    if pos == len(dia.libres):
+                        continue
+                i = dia.libres[pos]
+                dia.ocupacion[i] += 1
+                dia.pendientes[i] = dia.pendientes.get(i, 0) + 1
+                if dia.ocupacion[i] >= self.capacidad:
+                    del dia.libres[pos]
+                return fecha.isoformat(), dia.turnos[i]
+        raise SinCuposError(f'Sin cupos en los próximos {self.dias_maximos} días')
+
+    def _indice(self, fecha: str, hora: str) -> Tuple[Optional[_Dia], int]:
+        dia = self._dias.get(fecha)
+        if dia is None:
+            return None, -1
+        i = bisect_left(dia.turnos, hora)
+        if i == len(dia.turnos) or dia.turnos[i] != hora:
+            return None, -1
+        return dia, i
+
+    def _quitar_pendiente(self, dia: _Dia, i: int):
+        n = dia.pendientes.get(i, 0)
+        if n <= 1:
+            dia.pendientes.pop(i, None)
+        else:
+            dia.pendientes[i] = n - 1
+
+    def confirmar(self, fecha: str, hora: str):
+        """La cita reservada ya está guardada en la base."""
+        with self._lock:
+            dia, i = self._indice(fecha, hora)
+            if dia is not None:
+                self._quitar_pendiente(dia, i)
+
+    def liberar(self, fecha: str, hora: str):
+        """La cita reservada no llegó a guardarse: el cupo vuelve a estar libre."""
+        with self._lock:
+            dia, i = self._indice(fecha, hora)
+            if dia is None or i not in dia.pendientes:
+                return
+            self._quitar_pendiente(dia, i)
+            dia.ocupacion[i] -= 1
+            if dia.ocupacion[i] == self.capacidad - 1:
+                insort(dia.libres, i)
+
+    def refrescar(self, conn, fecha: str):
+        """Relee el día desde la base conservando las reservas propias aún sin confirmar."""
+        with self._lock:
+            dia = self._dias.get(fecha)
+            if dia is None:
+                return
+            ocupados = self.cargar_dia(conn, fecha)
+            self._dias[fecha] = _Dia(dia.turnos, ocupados, dia.pendientes, self.capacidad)
+
+    def ocupacion(self, fecha: str) -> Dict[str, int]:
+        """Ocupación conocida en memoria del día (vacío si aún no se consultó)."""
+        with self._lock:
+            dia = self._dias.get(fecha)
+            return dict(zip(dia.turnos, dia.ocupacion)) if dia is not None else {}
+
+
+def crear_scheduler(config, cargar_dia: Callable[[Any, str], Dict[str, int]]) -> SlotScheduler:
+    """SlotScheduler a partir de las claves SCHEDULE_* de la configuración de la app."""
+    return SlotScheduler(
+        HorarioAtencion(config['SCHEDULE_BUSINESS_HOURS'], config['SCHEDULE_SLOT_MINUTES']),
+        capacidad=config['SCHEDULE_SLOT_CAPACITY'],
+        cargar_dia=cargar_dia,
+        dias_minimos=config['SCHEDULE_MIN_DAYS_AHEAD'],
+        dias_maximos=config['SCHEDULE_MAX_DAYS_AHEAD']
+    )
@@ -0,0 +1,111 @@
+"""
+app.serve
+Punto de entrada de producción: sirve la app de create_app con waitress, un servidor
+WSGI multihilo en Python puro (funciona también en Windows).
+
+Uso:
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--threads N]
+                        [--max-in-flight 4] [--max-queue 64]
+                        [--connection-limit 200] [--backlog 1024] [--keep-alive 120]
+                        [--database RUTA] [--write-behind]
+
+Cada opción puede darse también por variable de entorno (ASISTENTE_HOST,
+ASISTENTE_PORT, ASISTENTE_THREADS, ASISTENTE_MAX_IN_FLIGHT, ASISTENTE_MAX_QUEUE,
+ASISTENTE_CONNECTION_LIMIT, ASISTENTE_BACKLOG, ASISTENTE_KEEP_ALIVE,
+ASISTENTE_DATABASE, ASISTENTE_WRITE_BEHIND=1).
+
+Las escrituras admitidas y las que esperan en la cola de admisión ocupan cada una un
+hilo de waitress. Sin --threads se arrancan max_in_flight + max_queue + HILOS_LIBRES
+hilos, de modo que la cola de admisión se puede llenar y lo que sobra recibe enseguida
+un 429 en un hilo libre, en vez de esperar en la cola interna de waitress. Con un
+--threads menor se acorta la cola de admisión para que quepa. El pool de conexiones
+SQLite tiene una conexión por hilo.
+"""
+import argparse
+import os
+import sys
+from typing import Tuple
+
+from . import create_app
+
+# Hilos que quedan fuera del control de admisión: lecturas, sondas y clientes de
+# /api/stats/stream (STATS_STREAM_MAX_SUBSCRIBERS), y los que responden los 429
+HILOS_LIBRES = 8
+
+
+def _env(nombre: str, default):
+    valor = os.environ.get(f'ASISTENTE_{nombre}')
+    return type(default)(valor) if valor is not None else default
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Servidor de producción del Agente de Voz (waitress).')
+    parser.add_argument('--host', default=_env('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=_env('PORT', 8000))
+    parser.add_argument('--threads', type=int, default=_env('THREADS', 0),
+                        help='Hilos que atienden peticiones en paralelo '
+                             '(0 = max-in-flight + max-queue + %d)' % HILOS_LIBRES)
+    parser.add_argument('--max-in-flight', type=int, default=_env('MAX_IN_FLIGHT', 4),
+                        help='Escrituras en curso a la vez (ADMISSION_MAX_IN_FLIGHT)')
+    parser.add_argument('--max-queue', type=int, default=_env('MAX_QUEUE', 64),
+                        help='Escrituras esperando turno antes de responder 429 (ADMISSION_MAX_QUEUE)')
+    parser.add_argument('--connection-limit', type=int, default=_env('CONNECTION_LIMIT', 200),
+                        help='Conexiones abiertas simultáneas (incluidas las keep-alive ociosas)')
+    parser.add_argument('--backlog', type=int, default=_env('BACKLOG', 1024),
+                        help='Cola de conexiones pendientes de aceptar en el socket (listen backlog)')
+    parser.add_argument('--keep-alive', type=int, default=_env('KEEP_ALIVE', 120),
+                        help='Segundos que una conexión keep-alive ociosa se mantiene abierta')
+    parser.add_argument('--database', default=os.environ.get('ASISTENTE_DATABASE'),
+                        help='Ruta de la base SQLite (por defecto datos_academia/data.db)')
+    parser.add_argument('--write-behind', action='store_true', default=_env('WRITE_BEHIND', 0) == 1,
+                        help='Activa la escritura diferida con commit agrupado (DB_WRITE_BEHIND)')
+    return parser
+
+
+def dimensionar(args) -> Tuple[int, int, int]:
+    """(hilos, escrituras en curso, cola de admisión) coherentes entre sí."""
+    if args.threads > 0:
+        max_in_flight = max(1, min(args.max_in_flight, args.threads - HILOS_LIBRES))
+        max_queue = max(0, min(args.max_queue, args.threads - HILOS_LIBRES - max_in_flight))
+        return args.threads, max_in_flight, max_queue
+    return args.max_in_flight + args.max_queue + HILOS_LIBRES, args.max_in_flight, args.max_queue
+
+
+def app_config(args) -> dict:
+    """Configuración de create_app coherente con el número de hilos."""
+    hilos, max_in_flight, max_queue = dimensionar(args)
+    config = {
+        # Un hilo nunca debe esperar por una conexión mientras otro hilo la tiene libre
+        'DB_POOL_SIZE': hilos,
+        'DB_WRITE_BEHIND': args.write_behind,
+        'ADMISSION_MAX_IN_FLIGHT': max_in_flight,
+        'ADMISSION_MAX_QUEUE': max_queue,
+    }
+    if args.database:
+        config['DATABASE'] = args.database
+    return config
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        from waitress import serve
+    except ImportError:
+        sys.exit('Falta waitress: pip install -r requirements.txt')
+
+    config = app_config(args)
+    app = create_app(config)
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=config['DB_POOL_SIZE'],
+        connection_limit=args.connection_limit,
+        backlog=args.backlog,
+        channel_timeout=args.keep_alive,
+        ident='asistente-de-voz'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+app.storage
+Almacenamiento de la app de escritorio detrás de una interfaz común (Almacen).
+
+AlmacenSQLite (por defecto) guarda en la misma base que la app web
+(datos_academia/data.db, vía app.db): memoria constante con cualquier cantidad de leads,
+las tablas leen por páginas con orden y filtro resueltos en SQL, paginando por la clave
+(columna, id) sobre los índices de leads en vez de OFFSET, y los turnos ocupados por la
+web y por el escritorio se ven en ambos lados. El lead de una llamada y su cita se
+guardan juntos en una transacción. Al abrirla importa una vez los diarios o JSON de
+versiones anteriores (app.importer) y los renombra a *.importado.
+
+AlmacenDiario conserva el formato de archivos JSONL (app.journal): al abrir recorre los
+diarios sin cargarlos en listas y guarda en memoria sólo las filas de las tablas y los
+conteos por día y por turno; se elige con ASISTENTE_DESKTOP_STORAGE=jsonl. Los dos
+renombran los archivos que ya pasaron a otro formato a *.importado.
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import db as db_module
+from . import importer as importer_module
+from .journal import Journal
+from .virtual_table import FuentePaginada, IndiceTabla
+
+COLUMNAS_LEADS = ('nombre', 'telefono', 'interes', 'calificacion', 'fecha')
+COLUMNAS_CITAS = ('nombre', 'telefono', 'fecha_cita', 'hora', 'tipo', 'estado')
+
+# Columnas de la app de escritorio -> expresiones SQL
+_SQL_LEADS = {'nombre': 'name', 'telefono': 'phone', 'interes': 'interest',
+              'calificacion': 'qualification', 'fecha': 'created_at'}
+_SQL_CITAS = {'nombre': 'l.name', 'telefono': 'l.phone', 'fecha_cita': 'a.date', 'hora': 'a.time',
+              'tipo': 'a.type', 'estado': 'a.status'}
+_DESDE_CITAS = 'appointments a LEFT JOIN leads l ON l.id = a.lead_id'
+_ID_CITAS = 'a.id'
+
+
+class Almacen:
+    """Interfaz de almacenamiento de leads y citas de la app de escritorio."""
+
+    def cargar(self) -> List[str]:
+        """Prepara los datos al iniciar; devuelve avisos para el log."""
+        return []
+
+    def guardar_lead(self, lead: Dict[str, Any], cita: Optional[Dict[str, Any]] = None) -> bool:
+        """Guarda el lead de una llamada y, si hay, su cita, juntos.
+
+        Lanza db.SlotUnavailableError (sin guardar nada) si el turno de la cita ya está
+        lleno. Devuelve False si el lead se fusionó con uno existente (mismo teléfono).
+        """
+        raise NotImplementedError
+
+    def fuente_leads(self):
+        """Fuente de filas (COLUMNAS_LEADS) para TablaVirtual."""
+        raise NotImplementedError
+
+    def fuente_citas(self):
+        raise NotImplementedError
+
+    def reservas_por_turno(self, fecha: str) -> Dict[str, int]:
+        """{hora: citas} del día, para el SlotScheduler."""
+        raise NotImplementedError
+
+    def resumen(self) -> Dict[str, int]:
+        """{'leads', 'citas', 'leads_hoy'}."""
+        raise NotImplementedError
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenDiario(Almacen):
+    def __init__(self, directorio: str, fsync: bool = False):
+        self.directorio = str(directorio)
+        self.diario_leads = Journal(os.path.join(self.directorio, 'leads.jsonl'), fsync=fsync)
+        self.diario_citas = Journal(os.path.join(self.directorio, 'citas.jsonl'), fsync=fsync)
+        # En memoria sólo lo que usan las vistas: las filas de las tablas y los conteos de
+        # resumen() y reservas_por_turno(); los registros completos quedan en los diarios
+        self._indice_leads = IndiceTabla(COLUMNAS_LEADS)
+        self._indice_citas = IndiceTabla(COLUMNAS_CITAS)
+        self._leads_por_dia: Dict[str, int] = {}
+        self._turnos: Dict[str, Dict[str, int]] = {}
+        self._citas = 0
+
+    def _recorrer_diario(self, diario: Journal, nombre_antiguo: str, avisos: List[str]) -> Iterator[Dict[str, Any]]:
+        # Si aún no hay diario y existe el JSON de versiones anteriores, se migra y se renombra
+        antiguo = os.path.join(self.directorio, nombre_antiguo)
+        if not diario.existe() and os.path.exists(antiguo):
+            with open(antiguo, 'r', encoding='utf-8') as f:
+                diario.compactar(importer_module.iter_json_array(f))
+            os.replace(antiguo, antiguo + '.importado')
+        yield from diario.cargar()
+        if diario.cola_descartada:
+            avisos.append(f'Se descartó un registro incompleto al final de {diario.path}')
+        if diario.lineas_invalidas:
+            # Reescribir sin las líneas dañadas (cargar() las salta)
+            diario.compactar(diario.cargar())
+
+    def _contar_lead(self, lead: Dict[str, Any]) -> List[Any]:
+        dia = (lead.get('fecha') or '')[:10]
+        self._leads_por_dia[dia] = self._leads_por_dia.get(dia, 0) + 1
+        return [lead.get(c, '') for c in COLUMNAS_LEADS]
+
+    def _contar_cita(self, cita: Dict[str, Any]) -> List[Any]:
+        turnos = self._turnos.setdefault(cita.get('fecha_cita'), {})
+        turnos[cita.get('hora')] = turnos.get(cita.get('hora'), 0) + 1
+        self._citas += 1
+        return [cita.get(k, '') for k in COLUMNAS_CITAS]
+
+    def cargar(self) -> List[str]:
+        avisos: List[str] = []
+        self._leads_por_dia, self._turnos, self._citas = {}, {}, 0
+        self._indice_leads.cargar(self._contar_lead(l) for l in self._recorrer_diario(self.diario_leads, 'leads.json', avisos))
+        self._indice_citas.cargar(self._contar_cita(c) for c in self._recorrer_diario(self.diario_citas, 'citas.json', avisos))
+        return avisos
+
+    def guardar_lead(self, lead: Dict[str, Any], cita: Optional[Dict[str, Any]] = None) -> bool:
+        # Las filas de las tablas las agrega TablaVirtual.agregar
+        if cita is not None:
+            self.diario_citas.agregar(cita)
+            self._contar_cita(cita)
+        self.diario_leads.agregar(lead)
+        self._contar_lead(lead)
+        return True
+
+    def fuente_leads(self):
+        return self._indice_leads
+
+    def fuente_citas(self):
+        return self._indice_citas
+
+    def reservas_por_turno(self, fecha: str) -> Dict[str, int]:
+        return dict(self._turnos.get(fecha, {}))
+
+    def resumen(self) -> Dict[str, int]:
+        hoy = datetime.now().strftime('%Y-%m-%d')
+        return {
+            'leads': sum(self._leads_por_dia.values()),
+            'citas': self._citas,
+            'leads_hoy': self._leads_por_dia.get(hoy, 0)
+        }
+
+    def cerrar(self):
+        self.diario_leads.cerrar()
+        self.diario_citas.cerrar()
+
+
+def _minusculas(valor) -> str:
+    # lower() de SQLite sólo convierte letras ASCII ('ÁLVARO' -> 'Álvaro'); el texto
+    # buscado se pasa a minúsculas con str.lower, así que las columnas también
+    return '' if valor is None else str(valor).lower()
+
+
+def _where(columnas_sql: Dict[str, str], filtro: str, exactos: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    condiciones, params = [], []
+    if filtro:
+        # instr(minusculas(...)) en vez de LIKE para no tratar % y _ del texto como comodines
+        condiciones.append('(' + ' OR '.join(f'instr(minusculas({c}), ?) > 0'
+                                             for c in columnas_sql.values()) + ')')
+        params.extend([filtro] * len(columnas_sql))
+    for columna, valor in exactos.items():
+        condiciones.append(f'{columnas_sql[columna]} = ?')
+        params.append(valor)
+    return (' WHERE ' + ' AND '.join(condiciones)) if condiciones else '', params
+
+
+def _fecha_escritorio(valor: Optional[str]) -> str:
+    """'2024-05-01T10:30:00.123' -> '2024-05-01 10:30:00' (formato de la app de escritorio)."""
+    return (valor or '')[:19].replace('T', ' ')
+
+
+class AlmacenSQLite(Almacen):
+    def __init__(self, db_path: str, directorio_heredado: Optional[str] = None, capacidad: Optional[int] = None):
+        """`capacidad`: asesores por turno; la base rechaza citas que la excedan."""
+        self.db_path = db_path
+        self.directorio_heredado = directorio_heredado
+        self.capacidad = capacidad
+        self._conn = None
+        # La conversación escribe desde su hilo y la interfaz lee desde el de Tk
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = db_module.init_db(self.db_path)
+            self._conn.create_function('minusculas', 1, _minusculas, deterministic=True)
+        return self._conn
+
+    def cargar(self) -> List[str]:
+        avisos: List[str] = []
+        if not self.directorio_heredado:
+            return avisos
+        with self._lock:
+            for nombre, resumen in importer_module.importar_directorio(self.conn, self.directorio_heredado).items():
+                importer_module.archivar_importado(self.conn, self.directorio_heredado, nombre)
+                avisos.append(f"{nombre}: {resumen['leads']} leads y {resumen['citas']} citas importados a {self.db_path}")
+        return avisos
+
+    def guardar_lead(self, lead: Dict[str, Any], cita: Optional[Dict[str, Any]] = None) -> bool:
+        with self._lock:
+            conn = self.conn
+            try:
+                nuevo = db_module.find_lead_by_phone(conn, lead.get('telefono')) is None
+                lead_id = db_module.insert_lead(conn, importer_module.mapear_lead(lead), commit=False)
+                if cita is not None:
+                    db_module.insert_appointment(conn, dict(importer_module.mapear_cita(cita), lead_id=lead_id),
+                                                 commit=False, capacity=self.capacidad)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return nuevo
+
+    def _contar(self, desde: str, total: str, columnas_sql: Dict[str, str], filtro: str,
+                exactos: Dict[str, Any]) -> int:
+        with self._lock:
+            if not filtro and not exactos:
+                # Sin filtros el total sale de stats_counters, sin recorrer la tabla
+                fila = self.conn.execute(
+                    "SELECT count FROM stats_counters WHERE dimension = 'total' AND value = ?", (total,)
+                ).fetchone()
+                return fila[0] if fila else 0
+            where, params = _where(columnas_sql, filtro, exactos)
+            return self.conn.execute(f'SELECT COUNT(*) FROM {desde}{where}', params).fetchone()[0]
+
+    def _leer(self, desde: str, id_sql: str, columnas_sql: Dict[str, str], columnas: Sequence[str],
+              ancla: Optional[Tuple], saltar: int, cantidad: int, orden: Optional[str], descendente: bool,
+              filtro: str, exactos: Dict[str, Any]) -> List[Tuple[Tuple, Tuple]]:
+        where, params = _where(columnas_sql, filtro, exactos)
+        sentido, op = ('DESC', '<') if descendente else ('ASC', '>')
+        clave_sql = columnas_sql[orden] if orden else id_sql
+        select = ', '.join([clave_sql, id_sql] + [columnas_sql[c] for c in columnas])
+        # Tramos (condición, parámetros, ORDER BY) en el orden en que se muestran
+        if orden is None:
+            tramos = [(f'{id_sql} {op} ?' if ancla else None, [ancla[1]] if ancla else [], f'{id_sql} {sentido}')]
+        else:
+            # SQLite ordena los NULL antes que cualquier valor (primero en ASC, al final en
+            # DESC). Los tramos NULL y no NULL se leen por separado para que los dos busquen
+            # en el índice (columna, id) desde el ancla en vez de recorrerlo.
+            orden_indice = f'{clave_sql} {sentido}, {id_sql} {sentido}'
+            nulos = (f'{clave_sql} IS NULL', [], orden_indice)
+            valores = (f'{clave_sql} IS NOT NULL', [], orden_indice)
+            if ancla is not None and ancla[0] is None:
+                nulos = (f'{clave_sql} IS NULL AND {id_sql} {op} ?', [ancla[1]], nulos[2])
+                valores = None if descendente else valores
+            elif ancla is not None:
+                valores = (f'{clave_sql} {op}= ? AND ({clave_sql} {op} ? OR {id_sql} {op} ?)',
+                           [ancla[0], ancla[0], ancla[1]], valores[2])
+                nulos = nulos if descendente else None
+            tramos = [t for t in ((valores, nulos) if descendente else (nulos, valores)) if t is not None]
+
+        consultas, todos = [], []
+        for condicion, extra, order_by in tramos:
+            condiciones = ' AND '.join(c for c in (where[len(' WHERE '):], condicion) if c)
+            consultas.append(f"SELECT * FROM (SELECT {select} FROM {desde}"
+                             f"{' WHERE ' + condiciones if condiciones else ''} ORDER BY {order_by} LIMIT ?)")
+            todos += params + extra + [saltar + cantidad]
+        with self._lock:
+            filas = self.conn.execute(' UNION ALL '.join(consultas) + ' LIMIT ? OFFSET ?',
+                                      todos + [cantidad, saltar]).fetchall()
+        return [((f[0], f[1]), tuple(f[2:])) for f in filas]
+
+    def fuente_leads(self):
+        def leer(ancla, saltar, cantidad, orden, descendente, filtro, exactos):
+            filas = self._leer('leads', 'id', _SQL_LEADS, COLUMNAS_LEADS, ancla, saltar, cantidad,
+                               orden, descendente, filtro, exactos)
+            return [(clave, f[:4] + (_fecha_escritorio(f[4]),)) for clave, f in filas]
+        return FuentePaginada(COLUMNAS_LEADS,
+                              lambda filtro, exactos: self._contar('leads', 'leads', _SQL_LEADS, filtro, exactos),
+                              leer)
+
+    def fuente_citas(self):
+        def leer(ancla, saltar, cantidad, orden, descendente, filtro, exactos):
+            return self._leer(_DESDE_CITAS, _ID_CITAS, _SQL_CITAS, COLUMNAS_CITAS, ancla, saltar, cantidad,
+                              orden, descendente, filtro, exactos)
+        return FuentePaginada(COLUMNAS_CITAS,
+                              lambda filtro, exactos: self._contar(_DESDE_CITAS, 'appointments', _SQL_CITAS,
+                                                                   filtro, exactos),
+                              leer)
+
+    def reservas_por_turno(self, fecha: str) -> Dict[str, int]:
+        with self._lock:
+            return db_module.count_appointments_by_slot(self.conn, fecha)
+
+    def resumen(self) -> Dict[str, int]:
+        hoy = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            stats = db_module.get_stats(self.conn, days=0)
+            fila = self.conn.execute(
+                "SELECT count FROM stats_counters WHERE dimension = 'lead_day' AND value = ?", (hoy,)
+            ).fetchone()
+        return {
+            'leads': stats['total_leads'],
+            'citas': stats['total_appointments'],
+            'leads_hoy': fila[0] if fila else 0
+        }
+
+    def cerrar(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def crear_almacen(directorio: str, tipo: Optional[str] = None, capacidad: Optional[int] = None) -> Almacen:
+    """Almacén de la app de escritorio: 'sqlite' (por defecto) o 'jsonl'.
+
+    Sin `tipo` se lee la variable de entorno ASISTENTE_DESKTOP_STORAGE.
+    """
+    tipo = tipo or os.environ.get('ASISTENTE_DESKTOP_STORAGE', 'sqlite')
+    if tipo == 'jsonl':
+        return AlmacenDiario(directorio)
+    if tipo == 'sqlite':
+        return AlmacenSQLite(os.path.join(str(directorio), 'data.db'), directorio_heredado=str(directorio),
+                             capacidad=capacidad)
+    raise ValueError(f'Almacenamiento desconocido: {tipo!r} (use sqlite o jsonl)')
@@ -0,0 +1,343 @@
+"""
+app.virtual_table
+Tablas grandes en un ttk.Treeview sin materializar todas las filas.
+
+IndiceTabla guarda las filas (tuplas de valores por columna) y la lista ordenada de las
+que pasan el filtro: agregar una fila la inserta con bisect en O(log n) + el
+desplazamiento de la lista, ordenar o filtrar recorre las filas una sola vez (acción
+del usuario, no por cada lead nuevo) y el filtro de texto busca en una cadena en
+minúsculas precalculada por fila.
+
+FuentePaginada ofrece la misma interfaz sin guardar las filas: las pide por páginas
+(p. ej. a SQLite, con el orden y el filtro resueltos en la consulta) paginando por la
+clave de orden en vez de OFFSET, y sólo conserva unas pocas en memoria.
+
+TablaVirtual mantiene en el Treeview sólo las filas de la ventana visible (`alto` items
+que se reutilizan) y maneja la barra de desplazamiento a mano, así que el costo de
+agregar, desplazarse u ordenar en pantalla es O(alto) aunque haya 100 000 filas.
+No importa tkinter: recibe el Treeview y la Scrollbar ya creados.
+"""
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def _clave_orden(valor: Any) -> Tuple[int, Any]:
+    # Vacíos al final y números antes que textos, sin comparar tipos distintos
+    if valor is None or valor == '':
+        return (2, '')
+    if isinstance(valor, (int, float)):
+        return (0, valor)
+    return (1, str(valor).lower())
+
+
+class IndiceTabla:
+    def __init__(self, columnas: Sequence[str]):
+        self.columnas = tuple(columnas)
+        self.filas: List[Tuple] = []
+        self._textos: List[str] = []
+        self.orden: Optional[str] = None
+        self._col_orden = -1
+        self.descendente = False
+        self.filtro = ''
+        self.filtros_exactos: Dict[str, Any] = {}
+        # Filas visibles ordenadas por (clave de la columna de orden, posición de alta)
+        self._claves: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+    @property
+    def total(self) -> int:
+        return len(self.filas)
+
+    def _clave(self, i: int) -> Tuple:
+        if self.orden is None:
+            return (i,)
+        return (_clave_orden(self.filas[i][self._col_orden]), i)
+
+    def _pasa(self, i: int) -> bool:
+        if self.filtro and self.filtro not in self._textos[i]:
+            return False
+        fila = self.filas[i]
+        return all(fila[self.columnas.index(c)] == v for c, v in self.filtros_exactos.items())
+
+    def agregar(self, fila: Sequence[Any]) -> Optional[int]:
+        """Agrega una fila; devuelve su posición en la vista o None si el filtro la oculta."""
+        i = len(self.filas)
+        self.filas.append(tuple(fila))
+        self._textos.append(' '.join('' if v is None else str(v) for v in fila).lower())
+        if not self._pasa(i):
+            return None
+        clave = self._clave(i)
+        if self.orden is None:
+            self._claves.append(clave)
+            pos = len(self._claves) - 1
+        else:
+            insort(self._claves, clave)
+            pos = bisect_left(self._claves, clave)
+        return len(self._claves) - 1 - pos if self.descendente else pos
+
+    def cargar(self, filas: Sequence[Sequence[Any]]):
+        """Reemplaza todas las filas (p. ej. al iniciar la app)."""
+        self.filas = [tuple(f) for f in filas]
+        self._textos = [' '.join('' if v is None else str(v) for v in f).lower() for f in self.filas]
+        self._reconstruir()
+
+    def _reconstruir(self):
+        self._claves = sorted(self._clave(i) for i in range(len(self.filas)) if self._pasa(i))
+
+    def ordenar(self, columna: Optional[str], descendente: bool = False):
+        if columna is not None and columna not in self.columnas:
+            raise ValueError(f'Columna desconocida: {columna}')
+        cambia_clave = columna != self.orden
+        self.orden = columna
+        self._col_orden = self.columnas.index(columna) if columna is not None else -1
+        self.descendente = descendente
+        if cambia_clave:
+            self._reconstruir()
+
+    def filtrar(self, texto: str = '', **exactos):
+        """Filtra por texto (en cualquier columna, sin distinguir mayúsculas) y por
+        igualdad en columnas concretas (p. ej. calificacion='Alta')."""
+        desconocidas = set(exactos) - set(self.columnas)
+        if desconocidas:
+            raise ValueError(f'Columnas desconocidas: {sorted(desconocidas)}')
+        texto = (texto or '').strip().lower()
+        # Refinar un filtro de texto sólo necesita revisar las filas ya visibles
+        refina = (not exactos and not self.filtros_exactos and self.filtro and texto.startswith(self.filtro))
+        self.filtro = texto
+        self.filtros_exactos = {c: v for c, v in exactos.items() if v not in (None, '')}
+        if refina:
+            self._claves = [c for c in self._claves if texto in self._textos[c[-1]]]
+        else:
+            self._reconstruir()
+
+    def fila(self, pos: int) -> Tuple:
+        """Fila en la posición `pos` de la vista (ya ordenada y filtrada)."""
+        if self.descendente:
+            pos = len(self._claves) - 1 - pos
+        return self.filas[self._claves[pos][-1]]
+
+    def ventana(self, inicio: int, cantidad: int) -> List[Tuple]:
+        fin = min(len(self._claves), inicio + cantidad)
+        return [self.fila(p) for p in range(max(0, inicio), fin)]
+
+
+class FuentePaginada:
+    """Filas leídas bajo demanda con paginación por clave (keyset).
+
+    `contar(filtro, exactos)` -> total de filas, y
+    `leer(ancla, saltar, cantidad, orden, descendente, filtro, exactos)` -> lista de
+    (clave, fila): las `cantidad` filas que siguen a la clave `ancla` (None = desde el
+    principio) saltándose `saltar`. La clave de la última fila de cada página se
+    recuerda como ancla de la siguiente, así que recorrer la tabla no usa OFFSET; sólo un
+    salto a una página lejana (arrastrar la barra) salta filas desde el ancla conocida
+    más cercana.
+    """
+
+    def __init__(self, columnas: Sequence[str], contar: Callable[[str, Dict[str, Any]], int],
+                 leer: Callable[..., List[Tuple[Any, Tuple]]], tam_pagina: int = 200, max_paginas: int = 8,
+                 max_conteos: int = 16):
+        self.columnas = tuple(columnas)
+        self.contar = contar
+        self.leer = leer
+        self.tam_pagina = tam_pagina
+        self.max_paginas = max_paginas
+        self.max_conteos = max_conteos
+        self.orden: Optional[str] = None
+        self.descendente = False
+        self.filtro = ''
+        self.filtros_exactos: Dict[str, Any] = {}
+        self._paginas: 'OrderedDict[int, List[Tuple]]' = OrderedDict()
+        # Página -> clave de la última fila de la página anterior
+        self._anclas: Dict[int, Any] = {}
+        # Totales por filtro ya contados (volver a un filtro anterior no vuelve a contar)
+        self._conteos: 'OrderedDict[Tuple, int]' = OrderedDict()
+
+    def _clave_filtro(self) -> Tuple:
+        return (self.filtro, tuple(sorted(self.filtros_exactos.items())))
+
+    def __len__(self) -> int:
+        clave = self._clave_filtro()
+        total = self._conteos.get(clave)
+        if total is None:
+            total = self._conteos[clave] = self.contar(self.filtro, self.filtros_exactos)
+            if len(self._conteos) > self.max_conteos:
+                self._conteos.popitem(last=False)
+        else:
+            self._conteos.move_to_end(clave)
+        return total
+
+    def invalidar(self):
+        self._conteos.clear()
+        self._paginas.clear()
+        self._anclas.clear()
+
+    def agregar(self, fila: Sequence[Any]) -> Optional[int]:
+        """La fila ya está guardada en el origen (y es nueva, no una fila actualizada);
+        devuelve su posición si se conoce sin consultar (orden de llegada sin filtros) o 0
+        para forzar el redibujado."""
+        clave = self._clave_filtro()
+        if self.orden is None and not self.descendente and not self.filtro and not self.filtros_exactos \
+                and clave in self._conteos:
+            total = self._conteos[clave] + 1
+            # Los totales de otros filtros pueden haber cambiado
+            self._conteos.clear()
+            self._conteos[clave] = total
+            self._paginas.pop((total - 1) // self.tam_pagina, None)
+            return total - 1
+        self.invalidar()
+        return 0
+
+    def ordenar(self, columna: Optional[str], descendente: bool = False):
+        if columna is not None and columna not in self.columnas:
+            raise ValueError(f'Columna desconocida: {columna}')
+        self.orden = columna
+        self.descendente = descendente
+        self._paginas.clear()
+        self._anclas.clear()
+
+    def filtrar(self, texto: str = '', **exactos):
+        desconocidas = set(exactos) - set(self.columnas)
+        if desconocidas:
+            raise ValueError(f'Columnas desconocidas: {sorted(desconocidas)}')
+        self.filtro = (texto or '').strip().lower()
+        self.filtros_exactos = {c: v for c, v in exactos.items() if v not in (None, '')}
+        self._paginas.clear()
+        self._anclas.clear()
+
+    def _pagina(self, numero: int) -> List[Tuple]:
+        pagina = self._paginas.get(numero)
+        if pagina is not None:
+            self._paginas.move_to_end(numero)
+            return pagina
+        # Ancla conocida más cercana por debajo (la página 0 empieza sin ancla)
+        desde = numero
+        while desde > 0 and desde not in self._anclas:
+            desde -= 1
+        leidas = self.leer(self._anclas.get(desde), (numero - desde) * self.tam_pagina, self.tam_pagina,
+                           self.orden, self.descendente, self.filtro, self.filtros_exactos)
+        pagina = [fila for _clave, fila in leidas]
+        if len(leidas) == self.tam_pagina:
+            self._anclas[numero + 1] = leidas[-1][0]
+        self._paginas[numero] = pagina
+        if len(self._paginas) > self.max_paginas:
+            self._paginas.popitem(last=False)
+        return pagina
+
+    def ventana(self, inicio: int, cantidad: int) -> List[Tuple]:
+        fin = min(len(self), inicio + cantidad)
+        filas: List[Tuple] = []
+        pos = max(0, inicio)
+        while pos < fin:
+            numero, desde = divmod(pos, self.tam_pagina)
+            pagina = self._pagina(numero)
+            if desde >= len(pagina):
+                break
+            tomar = pagina[desde:desde + fin - pos]
+            filas.extend(tomar)
+            pos += len(tomar)
+        return filas
+
+
+class TablaVirtual:
+    """Une un IndiceTabla (o una FuentePaginada) a un Treeview mostrando sólo `alto` filas a la vez."""
+
+    def __init__(self, tree, scrollbar, columnas: Sequence[str], alto: int = 15,
+                 formato: Optional[Callable[[Dict[str, Any]], Sequence[Any]]] = None, fuente=None):
+        """`formato(registro)` convierte un registro (dict) en los valores de las columnas;
+        por defecto toma registro[columna]. Sin `fuente` las filas se guardan en un IndiceTabla."""
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.indice = fuente if fuente is not None else IndiceTabla(columnas)
+        self.alto = alto
+        self.formato = formato or (lambda registro: [registro.get(c, '') for c in columnas])
+        self.inicio = 0
+        self._items: List[str] = []
+        scrollbar.configure(command=self.yview)
+        tree.bind('<MouseWheel>', self._rueda)
+        tree.bind('<Button-4>', lambda _e: self.desplazar(-3))
+        tree.bind('<Button-5>', lambda _e: self.desplazar(3))
+        for columna in columnas:
+            tree.heading(columna, command=lambda c=columna: self.alternar_orden(c))
+
+    # --- datos ---------------------------------------------------------
+
+    def cargar(self, registros: Sequence[Dict[str, Any]]):
+        self.indice.cargar([self.formato(r) for r in registros])
+        self.inicio = 0
+        self.refrescar()
+
+    def recargar(self):
+        """Vuelve a leer la ventana (p. ej. si otro proceso escribió en la fuente)."""
+        if hasattr(self.indice, 'invalidar'):
+            self.indice.invalidar()
+        self.refrescar()
+
+    def agregar(self, registro: Dict[str, Any]):
+        """Agrega un registro redibujando sólo si cae dentro o antes de la ventana."""
+        pos = self.indice.agregar(self.formato(registro))
+        if pos is not None and pos < self.inicio + self.alto:
+            self.refrescar()
+        else:
+            self._actualizar_barra()
+
+    def alternar_orden(self, columna: str):
+        """Clic en el encabezado: ascendente, descendente y vuelta al orden de llegada."""
+        if self.indice.orden != columna:
+            self.indice.ordenar(columna)
+        elif not self.indice.descendente:
+            self.indice.ordenar(columna, descendente=True)
+        else:
+            self.indice.ordenar(None)
+        self.inicio = 0
+        self.refrescar()
+
+    def filtrar(self, texto: str = '', **exactos):
+        self.indice.filtrar(texto, **exactos)
+        self.inicio = 0
+        self.refrescar()
+
+    # --- ventana visible -----------------------------------------------
+
+    def _maximo_inicio(self) -> int:
+        return max(0, len(self.indice) - self.alto)
+
+    def refrescar(self):
+        """Vuelca al Treeview las filas de la ventana actual, reutilizando sus items."""
+        self.inicio = min(self.inicio, self._maximo_inicio())
+        filas = self.indice.ventana(self.inicio, self.alto)
+        while len(self._items) < len(filas):
+            self._items.append(self.tree.insert('', 'end', values=()))
+        while len(self._items) > len(filas):
+            self.tree.delete(self._items.pop())
+        for iid, fila in zip(self._items, filas):
+            self.tree.item(iid, values=fila)
+        self._actualizar_barra()
+
+    def _actualizar_barra(self):
+        total = len(self.indice)
+        if total <= self.alto:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.inicio / total, min(1.0, (self.inicio + self.alto) / total))
+
+    def desplazar(self, filas: int):
+        nuevo = max(0, min(self._maximo_inicio(), self.inicio + filas))
+        if nuevo != self.inicio:
+            self.inicio = nuevo
+            self.refrescar()
+
+    def yview(self, accion: str, cantidad, unidad: Optional[str] = None):
+        """Comando de la Scrollbar: ('moveto', fraccion) o ('scroll', n, 'units'|'pages')."""
+        if accion == 'moveto':
+            self.inicio = max(0, min(self._maximo_inicio(), int(float(cantidad) * len(self.indice))))
+            self.refrescar()
+        elif accion == 'scroll':
+            paso = self.alto if unidad == 'pages' else 1
+            self.desplazar(int(cantidad) * paso)
+
+    def _rueda(self, evento):
+        self.desplazar(-3 if evento.delta > 0 else 3)
+        return 'break'
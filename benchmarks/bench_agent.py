@@ -0,0 +1,43 @@
+"""
+Microbenchmarks de app.agent: clasificación, payload del lead y extracción de
+nombre y teléfono (usados también por la app de escritorio).
+"""
+import pytest
+
+from app import agent
+
+from benchmarks.sinteticos import RELLENO
+
+TEXTOS = {
+    'corto': 'Me interesa un curso de marketing digital',
+    'corto_otros': 'Quisiera información de horarios',
+    'largo_otros': 'hola buenas tardes quería saber sobre los precios' + RELLENO * 40,
+}
+
+
+@pytest.mark.parametrize('caso', sorted(TEXTOS))
+def test_clasificar_interes(bench, caso):
+    texto = TEXTOS[caso]
+    bench(f'agent.clasificar_interes[{caso}]', lambda: agent.clasificar_interes(texto))
+
+
+def test_crear_lead_payload(bench):
+    bench('agent.crear_lead_payload', lambda: agent.crear_lead_payload(
+        'María Pérez', '+57 300 123 4567', TEXTOS['corto']))
+
+
+@pytest.mark.parametrize('caso, texto', [
+    ('patron', 'mi nombre es juan carlos rodriguez'),
+    ('pocas_palabras', 'maría pérez'),
+    ('sin_nombre', 'no le entendí bien la pregunta que me hizo'),
+])
+def test_extraer_nombre(bench, caso, texto):
+    bench(f'agent.extraer_nombre[{caso}]', lambda: agent.extraer_nombre(texto))
+
+
+@pytest.mark.parametrize('caso, texto', [
+    ('dictado', 'mi número es tres cero cero 300 123 45 67'),
+    ('formateado', '+57 (300) 123-4567'),
+])
+def test_extraer_telefono(bench, caso, texto):
+    bench(f'agent.extraer_telefono[{caso}]', lambda: agent.extraer_telefono(texto))
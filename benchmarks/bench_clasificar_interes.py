@@ -0,0 +1,63 @@
+"""
+benchmarks.bench_clasificar_interes
+Compara el clasificador precompilado de app.agent con el bucle original
+(diccionario reconstruido en cada llamada) sobre transcripciones cortas y largas.
+
+Uso:
+    python -m benchmarks.bench_clasificar_interes [--repeticiones 20000]
+"""
+import argparse
+import timeit
+
+from app import agent
+
+
+def clasificar_interes_original(texto: str) -> str:
+    # Copia de la implementación anterior, sólo como referencia de rendimiento
+    texto = texto.lower() if texto else ''
+    categorias = {
+        "Idiomas": ["inglés", "español", "francés", "alemán", "portugués", "chino", "idioma", "lengua"],
+        "Tecnologia": ["programación", "python", "java", "web", "desarrollo", "software", "tecnología", "computación"],
+        "Negocios": ["administración", "contabilidad", "marketing", "ventas", "negocio", "emprendimiento"],
+        "Desarrollo personal": ["liderazgo", "comunicación", "coaching", "desarrollo personal", "habilidades"]
+    }
+    for cat, keys in categorias.items():
+        for k in keys:
+            if k in texto:
+                return cat
+    return "Otros"
+
+
+RELLENO = 'hola buenas tardes quería saber sobre los horarios y precios de los cursos para adultos '
+
+CASOS = {
+    'corto_idiomas': 'Quiero aprender inglés',
+    'corto_negocios': 'Me interesa un curso de marketing digital',
+    'corto_otros': 'Quisiera información de horarios',
+    'largo_desarrollo_personal': RELLENO * 40 + 'y también liderazgo',
+    'largo_otros': RELLENO * 40,
+}
+
+
+def medir(funcion, texto: str, repeticiones: int) -> float:
+    """Devuelve microsegundos por llamada (mejor de 3 rondas)."""
+    tiempos = timeit.repeat(lambda: funcion(texto), number=repeticiones, repeat=3)
+    return min(tiempos) / repeticiones * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    print(f"{'caso':<28}{'chars':>7}{'original µs':>14}{'actual µs':>12}{'ratio':>8}")
+    for nombre, texto in CASOS.items():
+        reps = args.repeticiones if len(texto) < 200 else max(1, args.repeticiones // 20)
+        assert clasificar_interes_original(texto) == agent.clasificar_interes(texto), nombre
+        original = medir(clasificar_interes_original, texto, reps)
+        actual = medir(agent.clasificar_interes, texto, reps)
+        print(f"{nombre:<28}{len(texto):>7}{original:>14.2f}{actual:>12.2f}{original / actual:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
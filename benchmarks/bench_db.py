@@ -0,0 +1,82 @@
+"""
+Microbenchmarks de app.db sobre bases de 10k, 100k y 1M leads (ASISTENTE_BENCH_FILAS).
+
+Cada base se genera una vez en benchmarks/.cache (un tercio de los leads con cita,
+repartidos en los últimos 90 días) y se copia a un directorio temporal por sesión,
+porque test_insert_lead la modifica.
+"""
+import itertools
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from app import agent, db
+
+from benchmarks.sinteticos import iter_leads
+
+CACHE_DIR = Path(__file__).resolve().parent / '.cache'
+LOTE = 10000
+
+
+def construir_base(ruta: Path, filas: int):
+    conn = db.init_db(str(ruta))
+    leads = iter_leads(seed=filas)
+    inicio = datetime.now() - timedelta(days=90)
+    paso = timedelta(days=90) / filas
+    try:
+        for desde in range(0, filas, LOTE):
+            lote, citas = [], []
+            for i in range(desde, min(filas, desde + LOTE)):
+                datos = next(leads)
+                lead = agent.crear_lead_payload(datos['name'], f'57{i:010d}', datos['interest_text'])
+                lead['created_at'] = (inicio + paso * i).isoformat()
+                lote.append(lead)
+                if i % 3 == 0:
+                    citas.append({
+                        'lead_index': len(lote) - 1, 'date': lead['created_at'][:10], 'time': '10:00',
+                        'type': 'Asesoría', 'status': 'Pendiente', 'created_at': lead['created_at'],
+                    })
+            db.insert_leads_batch(conn, lote, citas)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='session')
+def base(filas, tmp_path_factory):
+    # El nombre incluye el número de migraciones: un cambio de esquema invalida la caché
+    nombre = f'leads_{filas}_m{len(db.MIGRATIONS)}.db'
+    origen = CACHE_DIR / nombre
+    if not origen.exists():
+        CACHE_DIR.mkdir(exist_ok=True)
+        parcial = origen.with_suffix('.parcial')
+        parcial.unlink(missing_ok=True)
+        construir_base(parcial, filas)
+        parcial.replace(origen)
+    copia = tmp_path_factory.mktemp('bench_db') / nombre
+    shutil.copyfile(origen, copia)
+    conn = db.get_connection(str(copia))
+    yield conn
+    conn.close()
+
+
+def test_insert_lead(bench, base, filas):
+    telefonos = itertools.count(9_000_000_000)
+    interes = agent.crear_lead_payload('Ana Gómez', '0', 'Quiero aprender inglés')
+
+    def insertar():
+        interes['phone'] = f'+57 {next(telefonos)}'
+        db.insert_lead(base, interes)
+
+    bench(f'db.insert_lead[{filas}]', insertar)
+
+
+def test_insert_lead_existente(bench, base, filas):
+    # Llamada repetida del mismo número: recorre la rama ON CONFLICT del upsert
+    lead = agent.crear_lead_payload('Ana Gómez', f'57{filas // 2:010d}', 'Quiero aprender inglés')
+    bench(f'db.insert_lead_existente[{filas}]', lambda: db.insert_lead(base, lead))
+
+
+def test_get_stats(bench, base, filas):
+    bench(f'db.get_stats[{filas}]', lambda: db.get_stats(base))
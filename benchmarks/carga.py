@@ -0,0 +1,243 @@
+"""
+benchmarks.carga
+Generador de carga local para las rutas calientes del backend. Arranca la app con
+create_app sobre una base temporal, la sirve en un puerto libre y la ataca con N
+clientes keep-alive que mezclan:
+
+    lead        POST /api/lead sin agendar
+    lead_cita   POST /api/lead con schedule=true
+    stats       GET /api/stats
+
+Imprime (o guarda con --output) un JSON con req/s, latencias p50/p95/p99 y errores,
+global y por operación, para poder comparar ejecuciones con un simple diff.
+
+Uso:
+    python -m benchmarks.carga [--concurrencia 16] [--duracion 10]
+                               [--mezcla lead=45,lead_cita=15,stats=40]
+                               [--servidor waitress|dev] [--hilos 8] [--write-behind]
+                               [--url http://host:puerto]  # contra un servidor ya levantado
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from app import create_app
+
+from .sinteticos import generar_lead
+
+OPERACIONES = ('lead', 'lead_cita', 'stats')
+MEZCLA_POR_DEFECTO = 'lead=45,lead_cita=15,stats=40'
+
+
+def parse_mezcla(texto: str) -> Dict[str, int]:
+    """'lead=45,stats=40' -> {'lead': 45, 'stats': 40}; los pesos son relativos."""
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        nombre = nombre.strip()
+        if nombre not in OPERACIONES:
+            raise ValueError(f'Operación desconocida en la mezcla: {nombre!r}')
+        mezcla[nombre] = int(peso)
+    if sum(mezcla.values()) <= 0:
+        raise ValueError('La mezcla necesita al menos un peso positivo')
+    return mezcla
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    rango = math.ceil(p / 100 * len(ordenados))
+    return ordenados[min(max(rango, 1), len(ordenados)) - 1]
+
+
+def resumir(latencias: List[float], errores: int, segundos: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        'requests': len(ordenadas) + errores,
+        'errors': errores,
+        'req_per_sec': round((len(ordenadas) + errores) / segundos, 1) if segundos else 0.0,
+        'p50_ms': round(percentil(ordenadas, 50) * 1000, 3),
+        'p95_ms': round(percentil(ordenadas, 95) * 1000, 3),
+        'p99_ms': round(percentil(ordenadas, 99) * 1000, 3),
+    }
+
+
+class Servidor:
+    """Sirve create_app en 127.0.0.1 con un puerto libre, en un hilo en segundo plano."""
+
+    def __init__(self, config: dict, tipo: str = 'waitress', hilos: int = 8):
+        self.app = create_app(config)
+        self.tipo = tipo
+        self._cerrado = threading.Event()
+        if tipo == 'waitress':
+            from waitress.server import create_server
+            self._server = create_server(self.app, host='127.0.0.1', port=0, threads=hilos)
+            self.port = self._server.effective_port
+            # Con la cola de tareas llena a propósito, el aviso por petición sólo añade ruido
+            logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+            objetivo = self._servir_waitress
+        else:
+            from werkzeug.serving import make_server
+            self._server = make_server('127.0.0.1', 0, self.app, threaded=True)
+            self.port = self._server.server_port
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            objetivo = self._server.serve_forever
+        self._hilo = threading.Thread(target=objetivo, daemon=True)
+
+    def _servir_waitress(self):
+        # waitress no tiene parada desde otro hilo: se gira su bucle por pasos y se
+        # cierran los sockets en este mismo hilo
+        from waitress import wasyncore
+        while not self._cerrado.is_set():
+            wasyncore.loop(timeout=0.05, map=self._server._map, count=1)
+        self._server.task_dispatcher.shutdown()
+        wasyncore.close_all(self._server._map)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._cerrado.set()
+        if self.tipo != 'waitress':
+            self._server.shutdown()
+        self._hilo.join(timeout=5)
+        writer = self.app.extensions.get('db_writer')
+        if writer is not None:
+            writer.close()
+        self.app.extensions['db_pool'].close_all()
+
+
+class Cliente(threading.Thread):
+    """Un cliente keep-alive que elige operaciones según la mezcla hasta `fin`."""
+
+    def __init__(self, host: str, port: int, mezcla: Dict[str, int], fin: float, seed: int):
+        super().__init__(daemon=True)
+        self.host, self.port, self.fin = host, port, fin
+        self.rng = random.Random(seed)
+        self.nombres = list(mezcla)
+        self.pesos = list(mezcla.values())
+        self.latencias: Dict[str, List[float]] = {op: [] for op in mezcla}
+        self.errores: Dict[str, int] = {op: 0 for op in mezcla}
+
+    def _peticion(self, conn: http.client.HTTPConnection, op: str):
+        if op == 'stats':
+            conn.request('GET', '/api/stats')
+        else:
+            lead = generar_lead(self.rng)
+            lead['schedule'] = op == 'lead_cita'
+            conn.request('POST', '/api/lead', json.dumps(lead), {'Content-Type': 'application/json'})
+        respuesta = conn.getresponse()
+        respuesta.read()
+        return respuesta.status
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        while time.perf_counter() < self.fin:
+            op = self.rng.choices(self.nombres, self.pesos)[0]
+            t0 = time.perf_counter()
+            try:
+                status = self._peticion(conn, op)
+            except (OSError, http.client.HTTPException):
+                self.errores[op] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                continue
+            if status == 200:
+                self.latencias[op].append(time.perf_counter() - t0)
+            else:
+                self.errores[op] += 1
+        conn.close()
+
+
+def ejecutar(host: str, port: int, concurrencia: int, duracion: float,
+             mezcla: Dict[str, int], seed: int = 0) -> dict:
+    fin = time.perf_counter() + duracion
+    clientes = [Cliente(host, port, mezcla, fin, seed * 10007 + i) for i in range(concurrencia)]
+    inicio = time.perf_counter()
+    for c in clientes:
+        c.start()
+    for c in clientes:
+        c.join()
+    segundos = time.perf_counter() - inicio
+
+    por_operacion = {}
+    todas, errores_totales = [], 0
+    for op in mezcla:
+        latencias = [l for c in clientes for l in c.latencias[op]]
+        errores = sum(c.errores[op] for c in clientes)
+        por_operacion[op] = resumir(latencias, errores, segundos)
+        todas.extend(latencias)
+        errores_totales += errores
+    return {
+        'concurrency': concurrencia,
+        'duration_s': round(segundos, 3),
+        'mix': mezcla,
+        'total': resumir(todas, errores_totales, segundos),
+        'operations': por_operacion,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrencia', type=int, default=16, help='Clientes simultáneos')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de medición')
+    parser.add_argument('--calentamiento', type=float, default=1.0,
+                        help='Segundos de carga previa que no se miden')
+    parser.add_argument('--mezcla', type=parse_mezcla, default=parse_mezcla(MEZCLA_POR_DEFECTO),
+                        help=f'Pesos relativos por operación (por defecto {MEZCLA_POR_DEFECTO})')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--servidor', choices=('waitress', 'dev'), default='waitress')
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos del servidor waitress')
+    parser.add_argument('--write-behind', action='store_true', help='Activa DB_WRITE_BEHIND')
+    parser.add_argument('--url', help='Atacar un servidor ya levantado en vez de arrancar uno')
+    parser.add_argument('--output', help='Archivo JSON de salida (por defecto stdout)')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+
+    def medir(host, port):
+        if args.calentamiento > 0:
+            ejecutar(host, port, args.concurrencia, args.calentamiento, args.mezcla, seed=args.seed + 1)
+        return ejecutar(host, port, args.concurrencia, args.duracion, args.mezcla, seed=args.seed)
+
+    if args.url:
+        partes = urlsplit(args.url)
+        resultado = medir(partes.hostname, partes.port or 80)
+        resultado['server'] = args.url
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {
+                'DATABASE': str(Path(tmp) / 'carga.db'),
+                'DB_POOL_SIZE': args.hilos,
+                'DB_WRITE_BEHIND': args.write_behind,
+                'PROFILE_ENABLED': False,
+            }
+            with Servidor(config, args.servidor, args.hilos) as servidor:
+                resultado = medir('127.0.0.1', servidor.port)
+        resultado['server'] = args.servidor
+        resultado['threads'] = args.hilos if args.servidor == 'waitress' else None
+        resultado['write_behind'] = args.write_behind
+
+    salida = json.dumps(resultado, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(salida + '\n', encoding='utf-8')
+    else:
+        sys.stdout.write(salida + '\n')
+
+
+if __name__ == '__main__':
+    main()
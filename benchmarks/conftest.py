@@ -0,0 +1,126 @@
+"""
+Arnés de microbenchmarks con línea base versionada.
+
+Los archivos bench_*.py sólo se recogen cuando se pide la carpeta explícitamente:
+
+    python -m pytest benchmarks                      # compara contra baseline.json
+    ASISTENTE_BENCH_UPDATE=1 python -m pytest benchmarks   # reescribe la línea base
+
+Variables de entorno:
+    ASISTENTE_BENCH_TOLERANCE  margen sobre la línea base antes de fallar; por defecto 1.0
+                               (el doble de lento): el ruido entre ejecuciones en una máquina
+                               compartida llega al 50-75 %, y un 10x se detecta igual
+    ASISTENTE_BENCH_UPDATE     1 para guardar los tiempos medidos como nueva línea base
+    ASISTENTE_BENCH_FILAS      tamaños de base para bench_db (por defecto 10000,100000,1000000)
+"""
+import json
+import os
+import timeit
+from pathlib import Path
+from typing import Callable, Dict
+
+import pytest
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / 'baseline.json'
+FILAS_POR_DEFECTO = '10000,100000,1000000'
+
+
+def _tolerancia() -> float:
+    return float(os.environ.get('ASISTENTE_BENCH_TOLERANCE', '1.0'))
+
+
+def _actualizar() -> bool:
+    return os.environ.get('ASISTENTE_BENCH_UPDATE') == '1'
+
+
+def _pedido_explicitamente(config) -> bool:
+    # Un `python -m pytest` sin argumentos no debe ejecutar los benchmarks
+    for arg in config.args:
+        ruta = (config.invocation_params.dir / arg.split('::')[0]).resolve()
+        if ruta == BENCH_DIR or BENCH_DIR in ruta.parents:
+            return True
+    return False
+
+
+def pytest_collect_file(file_path, parent):
+    if (file_path.suffix == '.py' and file_path.name.startswith('bench_')
+            and _pedido_explicitamente(parent.config)):
+        return pytest.Module.from_parent(parent, path=file_path)
+    return None
+
+
+def pytest_generate_tests(metafunc):
+    if 'filas' in metafunc.fixturenames:
+        tamanos = [int(t) for t in os.environ.get('ASISTENTE_BENCH_FILAS', FILAS_POR_DEFECTO).split(',')]
+        metafunc.parametrize('filas', tamanos, ids=[f'{t}' for t in tamanos], scope='session')
+
+
+class Registro:
+    """Tiempos medidos en la sesión y comparación contra la línea base."""
+
+    def __init__(self):
+        self.baseline: Dict[str, float] = {}
+        if BASELINE_PATH.exists():
+            self.baseline = json.loads(BASELINE_PATH.read_text(encoding='utf-8'))['us_per_op']
+        self.medidos: Dict[str, float] = {}
+
+    def guardar(self):
+        datos = dict(self.baseline)
+        datos.update(self.medidos)
+        contenido = {'us_per_op': {k: datos[k] for k in sorted(datos)}}
+        BASELINE_PATH.write_text(json.dumps(contenido, indent=2) + '\n', encoding='utf-8')
+
+
+_REGISTRO = pytest.StashKey[Registro]()
+
+
+def pytest_configure(config):
+    config.stash[_REGISTRO] = Registro()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    reg = session.config.stash.get(_REGISTRO, None)
+    if reg is not None and _actualizar() and reg.medidos:
+        reg.guardar()
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    reg = config.stash.get(_REGISTRO, None)
+    if reg is None or not reg.medidos:
+        return
+    terminalreporter.section('microbenchmarks (µs por operación, relación contra la línea base)')
+    for nombre in sorted(reg.medidos):
+        base = reg.baseline.get(nombre)
+        relacion = f'{reg.medidos[nombre] / base:6.2f}x' if base else '  nuevo'
+        terminalreporter.write_line(f'{nombre:<48}{reg.medidos[nombre]:>12.2f}{relacion:>10}')
+
+
+@pytest.fixture
+def bench(request) -> Callable[..., float]:
+    """bench(nombre, funcion) -> µs por llamada (mejor de `rondas`), comparado con la línea base.
+
+    timeit.autorange calibra las llamadas por ronda para que cada ronda dure al menos 0,2 s.
+    """
+    registro = request.config.stash[_REGISTRO]
+
+    def medir(nombre: str, funcion: Callable[[], object], rondas: int = 5) -> float:
+        temporizador = timeit.Timer(funcion)
+        numero, _ = temporizador.autorange()
+        mejor = min(temporizador.repeat(repeat=rondas, number=numero)) / numero * 1e6
+        registro.medidos[nombre] = round(mejor, 3)
+
+        if _actualizar():
+            return mejor
+        base = registro.baseline.get(nombre)
+        if base is None:
+            pytest.skip(f'{nombre}: sin línea base (ejecute con ASISTENTE_BENCH_UPDATE=1)')
+        limite = base * (1 + _tolerancia())
+        assert mejor <= limite, (
+            f'{nombre}: {mejor:.2f} µs/op supera la línea base {base:.2f} µs/op '
+            f'con tolerancia {_tolerancia():.0%} (límite {limite:.2f})'
+        )
+        return mejor
+
+    return medir
+
@@ -0,0 +1,81 @@
+"""
+benchmarks.sinteticos
+Generador determinista de leads sintéticos en español para pruebas de carga y
+microbenchmarks. Reparte las transcripciones entre todas las categorías de
+app.agent.CATEGORIAS (más "Otros"), con y sin tildes y con relleno variable.
+"""
+import random
+from typing import Dict, Iterator, Optional
+
+from app import agent
+
+NOMBRES = ['María', 'José', 'Lucía', 'Andrés', 'Camila', 'Juan', 'Valentina', 'Mateo',
+           'Sofía', 'Santiago', 'Daniela', 'Sebastián', 'Isabella', 'Nicolás', 'Mariana']
+APELLIDOS = ['García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez',
+             'Ramírez', 'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Muñoz']
+
+PLANTILLAS = [
+    'Quiero información sobre {clave}',
+    'Hola, me interesa un curso de {clave}',
+    'Buenas tardes, quisiera saber precios y horarios de {clave}',
+    'Estoy buscando algo de {clave} para los fines de semana',
+    'Me gustaría inscribirme en {clave} lo antes posible',
+]
+# Frases sin ninguna palabra clave: deben terminar en "Otros"
+SIN_CATEGORIA = [
+    'Quisiera información de horarios',
+    'Llamo para preguntar por las formas de pago',
+    '¿Tienen sede en el centro de la ciudad?',
+    'Me recomendaron la academia y quería saber más',
+]
+RELLENO = ' y también quería preguntar si hay descuentos para estudiantes'
+
+CATEGORIAS_SINTETICAS = tuple(agent.CATEGORIAS) + ('Otros',)
+# Sólo las claves que el clasificador asigna a su propia categoría
+# ("desarrollo personal" contiene "desarrollo", que gana Tecnologia)
+_CLAVES = {
+    cat: [k for k in keys if agent.clasificar_interes(k) == cat]
+    for cat, keys in agent.CATEGORIAS.items()
+}
+
+
+def generar_interes(rng: random.Random, categoria: Optional[str] = None) -> str:
+    """Transcripción de interés para `categoria` (al azar si no se indica)."""
+    categoria = categoria or rng.choice(CATEGORIAS_SINTETICAS)
+    if categoria == 'Otros':
+        texto = rng.choice(SIN_CATEGORIA)
+    else:
+        clave = rng.choice(_CLAVES[categoria])
+        if rng.random() < 0.3:
+            clave = agent.quitar_tildes(clave)
+        texto = rng.choice(PLANTILLAS).format(clave=clave)
+    if rng.random() < 0.2:
+        texto += RELLENO * rng.randint(1, 5)
+    return texto
+
+
+def generar_telefono(rng: random.Random) -> str:
+    numero = f'3{rng.randint(0, 999999999):09d}'
+    formato = rng.random()
+    if formato < 0.4:
+        return numero
+    if formato < 0.7:
+        return f'+57 {numero[:3]} {numero[3:6]} {numero[6:]}'
+    return f'{numero[:3]}-{numero[3:6]}-{numero[6:]}'
+
+
+def generar_lead(rng: random.Random, categoria: Optional[str] = None) -> Dict[str, str]:
+    """Payload de /api/lead sin `schedule`: {name, phone, interest_text}."""
+    return {
+        'name': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+        'phone': generar_telefono(rng),
+        'interest_text': generar_interes(rng, categoria),
+    }
+
+
+def iter_leads(seed: int = 0) -> Iterator[Dict[str, str]]:
+    """Secuencia infinita que recorre las categorías en rueda, reproducible por `seed`."""
+    rng = random.Random(seed)
+    while True:
+        for categoria in CATEGORIAS_SINTETICAS:
+            yield generar_lead(rng, categoria)
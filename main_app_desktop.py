@@ -3,14 +3,23 @@ from tkinter import ttk, scrolledtext, messagebox
 import threading
 import queue
 import datetime
-import json
 import os
 from pathlib import Path
 import speech_recognition as sr
 import pyttsx3
-import re
 import time
 
+from app import agent, call_stats, conversation_log, db, scheduler, storage
+from app.virtual_table import TablaVirtual
+
+# Asesores que atienden a la vez en cada turno de 30 minutos
+ASESORES_POR_TURNO = 2
+# Líneas que conserva el log en pantalla y mensajes del log que se pintan por ciclo de after()
+MAX_LINEAS_LOG = 2000
+# Pausa al escribir en un campo de búsqueda antes de filtrar la tabla
+FILTRO_ESPERA_MS = 300
+MENSAJES_POR_CICLO = 200
+
 class AgenteVozApp:
     """
     Aplicación principal del Agente de Voz Automatizado para Academia Sin Fronteras.
@@ -33,13 +42,20 @@ class AgenteVozApp:
         # Variables de estado
         self.agente_activo = False
         self.historial_llamadas = []
-        self.leads_calificados = []
-        self.citas_agendadas = []
-        self.conversacion_actual = []
+        
+        # Cola para comunicación entre hilos: sólo el hilo de Tk toca los widgets
+        self.cola_mensajes = queue.Queue()
         
         # Configuración de archivos de datos
         self.directorio_datos = Path("datos_academia")
         self.directorio_datos.mkdir(exist_ok=True)
+        # Transcripción de la llamada en curso: cada mensaje se anexa a transcripciones/ al llegar
+        self.conversacion_actual = conversation_log.Transcripcion(self.directorio_datos)
+        # Leads y citas en app.db, compartidos con la app web (ASISTENTE_DESKTOP_STORAGE=jsonl
+        # para guardarlos en diarios JSONL locales)
+        self.almacen = storage.crear_almacen(self.directorio_datos, capacidad=ASESORES_POR_TURNO)
+        # Contadores del día y acumulados, actualizados con cada llamada
+        self.estadisticas = call_stats.EstadisticasLlamadas()
         
         # Configuración de voz
         self.engine_voz = pyttsx3.init()
@@ -49,9 +65,6 @@ class AgenteVozApp:
         self.reconocedor = sr.Recognizer()
         self.microfono = sr.Microphone()
         
-        # Cola para comunicación entre hilos
-        self.cola_mensajes = queue.Queue()
-        
         # Configurar interfaz
         self.configurar_interfaz()
         
@@ -61,8 +74,18 @@ class AgenteVozApp:
         # Ajustar el micrófono para ruido ambiental
         self.ajustar_microfono()
         
-        # Cargar datos existentes
+        # Cargar datos existentes y mostrarlos
         self.cargar_datos()
+        self.actualizar_treeview_leads()
+        self.actualizar_treeview_citas()
+        self.actualizar_estadisticas()
+        
+        # Turnos de cita según el horario de atención; la ocupación sale de las citas cargadas
+        self.agenda = scheduler.SlotScheduler(
+            scheduler.HorarioAtencion(scheduler.HORARIO_POR_DEFECTO, 30),
+            capacidad=ASESORES_POR_TURNO,
+            cargar_dia=lambda _conn, fecha: self.almacen.reservas_por_turno(fecha)
+        )
     
     def configurar_voz_femenina(self):
         """
@@ -162,6 +185,7 @@ class AgenteVozApp:
                                                   font=("Arial", 10), wrap=tk.WORD)
         self.texto_log.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.texto_log.config(state=tk.DISABLED)
+        self.vista_log = conversation_log.VistaLog(self.texto_log, max_lineas=MAX_LINEAS_LOG)
         
         frame_conversacion.columnconfigure(0, weight=1)
         frame_conversacion.rowconfigure(0, weight=1)
@@ -188,15 +212,17 @@ class AgenteVozApp:
         self.tree_leads.column('calificacion', width=100)
         self.tree_leads.column('fecha', width=120)
         
-        self.tree_leads.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.tree_leads.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Scrollbar para treeview
-        scrollbar_leads = ttk.Scrollbar(frame_leads, orient=tk.VERTICAL, command=self.tree_leads.yview)
-        scrollbar_leads.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.tree_leads.configure(yscrollcommand=scrollbar_leads.set)
+        # Scrollbar manejada por la tabla virtual: sólo las filas visibles existen en el Treeview
+        scrollbar_leads = ttk.Scrollbar(frame_leads, orient=tk.VERTICAL)
+        scrollbar_leads.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.tabla_leads = TablaVirtual(self.tree_leads, scrollbar_leads, columnas_leads, alto=15,
+                                        fuente=self.almacen.fuente_leads())
+        self.crear_filtro(frame_leads, self.tabla_leads)
         
         frame_leads.columnconfigure(0, weight=1)
-        frame_leads.rowconfigure(0, weight=1)
+        frame_leads.rowconfigure(1, weight=1)
         
         # Pestaña de citas agendadas
         frame_citas = ttk.Frame(notebook, padding="5")
@@ -222,15 +248,17 @@ class AgenteVozApp:
         self.tree_citas.column('tipo', width=150)
         self.tree_citas.column('estado', width=100)
         
-        self.tree_citas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.tree_citas.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Scrollbar para treeview de citas
-        scrollbar_citas = ttk.Scrollbar(frame_citas, orient=tk.VERTICAL, command=self.tree_citas.yview)
-        scrollbar_citas.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.tree_citas.configure(yscrollcommand=scrollbar_citas.set)
+        # Scrollbar manejada por la tabla virtual de citas
+        scrollbar_citas = ttk.Scrollbar(frame_citas, orient=tk.VERTICAL)
+        scrollbar_citas.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.tabla_citas = TablaVirtual(self.tree_citas, scrollbar_citas, columnas_citas, alto=15,
+                                        fuente=self.almacen.fuente_citas())
+        self.crear_filtro(frame_citas, self.tabla_citas)
         
         frame_citas.columnconfigure(0, weight=1)
-        frame_citas.rowconfigure(0, weight=1)
+        frame_citas.rowconfigure(1, weight=1)
         
         # Estadísticas
         stats_frame = ttk.Frame(main_frame)
@@ -248,51 +276,67 @@ class AgenteVozApp:
     
     def agregar_log(self, mensaje, tipo="info"):
         """
-        Agrega un mensaje al área de log con formato y timestamp.
+        Encola un mensaje para el log con su timestamp; se puede llamar desde cualquier hilo.
         
         Args:
             mensaje (str): Mensaje a mostrar en el log
-            tipo (str): Tipo de mensaje (info, agente, cliente, error)
+            tipo (str): Tipo de mensaje (info, agente, cliente, error, sistema)
+        """
+        self.cola_mensajes.put({
+            "tipo": "log",
+            "contenido": mensaje,
+            "subtipo": tipo,
+            "timestamp": datetime.datetime.now().strftime("%H:%M:%S")
+        })
+    
+    def en_interfaz(self, funcion, *args):
         """
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        
-        # Colores según el tipo de mensaje
-        colores = {
-            "info": "#2c3e50",
-            "agente": "#2980b9", 
-            "cliente": "#27ae60",
-            "error": "#e74c3c",
-            "sistema": "#8e44ad"
-        }
+        Pide al hilo de Tk que ejecute funcion(*args) (p. ej. actualizar una tabla).
         
-        color = colores.get(tipo, "#2c3e50")
-        mensaje_formateado = f"[{timestamp}] {mensaje}"
-        
-        self.texto_log.config(state=tk.NORMAL)
-        self.texto_log.insert(tk.END, mensaje_formateado + "\n", tipo)
-        self.texto_log.tag_configure(tipo, foreground=color)
-        self.texto_log.see(tk.END)
-        self.texto_log.config(state=tk.DISABLED)
-        
-        # Guardar en conversación actual
-        self.conversacion_actual.append({"timestamp": timestamp, "tipo": tipo, "mensaje": mensaje})
+        Args:
+            funcion: Método a ejecutar
+        """
+        self.cola_mensajes.put({"tipo": "actualizar_ui", "funcion": funcion, "args": args})
     
     def procesar_cola(self):
         """
-        Procesa los mensajes en la cola de manera asíncrona.
+        Procesa los mensajes en la cola de manera asíncrona, pintando el log por lotes.
         """
+        mensajes = conversation_log.drenar(self.cola_mensajes, MENSAJES_POR_CICLO)
+        lote = []
         try:
-            while True:
-                mensaje = self.cola_mensajes.get_nowait()
-                if mensaje["tipo"] == "log":
-                    self.agregar_log(mensaje["contenido"], mensaje["subtipo"])
-                elif mensaje["tipo"] == "actualizar_ui":
-                    if hasattr(self, mensaje["metodo"]):
-                        getattr(self, mensaje["metodo"])()
-        except queue.Empty:
-            pass
+            for mensaje in mensajes:
+                try:
+                    if mensaje["tipo"] == "log":
+                        lote.append((f"[{mensaje['timestamp']}] {mensaje['contenido']}", mensaje["subtipo"]))
+                    elif mensaje["tipo"] == "actualizar_ui":
+                        mensaje["funcion"](*mensaje["args"])
+                    self.registrar_en_transcripcion(mensaje)
+                except Exception as e:
+                    lote.append((f"Error actualizando la interfaz: {e}", "error"))
+            self.vista_log.escribir(lote)
         finally:
-            self.root.after(100, self.procesar_cola)
+            # Si quedaron mensajes pendientes se sigue enseguida
+            self.root.after(10 if len(mensajes) == MENSAJES_POR_CICLO else 100, self.procesar_cola)
+    
+    def registrar_en_transcripcion(self, mensaje):
+        """Pasa a la transcripción de la llamada un mensaje de la cola (log o fin de llamada)."""
+        if mensaje["tipo"] == "log":
+            self.conversacion_actual.agregar(mensaje["timestamp"], mensaje["subtipo"], mensaje["contenido"])
+        elif mensaje["tipo"] == "fin_llamada":
+            self.conversacion_actual.guardar(telefono=mensaje["telefono"], llamada=mensaje["llamada"])
+    
+    def vaciar_cola(self):
+        """
+        Al cerrar la ventana, pasa a la transcripción los mensajes que siguen en la cola
+        (sin tocar los widgets, ya destruidos) para que el guardado final no los pierda.
+        """
+        self.agente_activo = False
+        for mensaje in conversation_log.drenar(self.cola_mensajes, self.cola_mensajes.qsize()):
+            try:
+                self.registrar_en_transcripcion(mensaje)
+            except Exception as e:
+                print(f"Error guardando la transcripción: {e}")
     
     def hablar(self, texto):
         """
@@ -357,10 +401,8 @@ class AgenteVozApp:
     
     def limpiar_log(self):
         """Limpia el área de log."""
-        self.texto_log.config(state=tk.NORMAL)
-        self.texto_log.delete(1.0, tk.END)
-        self.texto_log.config(state=tk.DISABLED)
-        self.conversacion_actual = []
+        # La transcripción de la llamada en curso se conserva
+        self.vista_log.limpiar()
     
     def ejecutar_conversacion(self):
         """
@@ -368,9 +410,12 @@ class AgenteVozApp:
         Maneja la bienvenida, preguntas, calificación y agendamiento.
         """
         while self.agente_activo:
+            lead_guardado = cita_agendada = False
+            telefono = None
             try:
                 # Simular llamada entrante
                 self.agregar_log("📞 Llamada entrante detectada...", "sistema")
+                self.estadisticas.inicio_llamada()
                 time.sleep(2)
                 
                 # Mensaje de bienvenida
@@ -392,23 +437,20 @@ class AgenteVozApp:
                 # Calificar lead
                 calificacion = self.calificar_lead(interes)
                 
-                # Intentar agendar cita
-                cita_agendada = self.procesar_agendamiento(nombre, telefono, interes)
+                # Intentar agendar cita (el turno queda reservado hasta guardar)
+                cita = self.procesar_agendamiento(nombre, telefono, interes)
                 
-                # Guardar lead
+                # Guardar lead junto con su cita
                 lead = {
                     "nombre": nombre,
                     "telefono": telefono,
                     "interes": interes,
                     "calificacion": calificacion,
                     "fecha": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "cita_agendada": cita_agendada
+                    "cita_agendada": cita is not None
                 }
                 
-                self.leads_calificados.append(lead)
-                self.guardar_datos()
-                self.actualizar_treeview_leads()
-                self.actualizar_estadisticas()
+                lead_guardado, cita_agendada = self.guardar_lead(lead, cita)
                 
                 # Mensaje de despedida
                 if cita_agendada:
@@ -416,12 +458,21 @@ class AgenteVozApp:
                 else:
                     self.hablar("Gracias por su interés. Le enviaremos más información por mensaje. ¡Que tenga un excelente día!")
                 
+                llamada = self.estadisticas.fin_llamada(lead=lead_guardado, convertida=cita_agendada)
+                self.en_interfaz(self.actualizar_estadisticas)
                 self.agregar_log("Llamada finalizada", "sistema")
+                self.cola_mensajes.put({"tipo": "fin_llamada", "telefono": telefono, "llamada": llamada})
                 time.sleep(5)  # Esperar antes de la siguiente llamada
                 
             except Exception as e:
                 self.agregar_log(f"Error en conversación: {e}", "error")
                 time.sleep(5)
+            finally:
+                if self.estadisticas.en_llamada():
+                    # La llamada se cortó antes de la despedida (dato no obtenido o error)
+                    llamada = self.estadisticas.fin_llamada(lead=lead_guardado, convertida=cita_agendada)
+                    self.en_interfaz(self.actualizar_estadisticas)
+                    self.cola_mensajes.put({"tipo": "fin_llamada", "telefono": telefono, "llamada": llamada})
     
     def obtener_nombre(self):
         """
@@ -442,6 +493,7 @@ class AgenteVozApp:
                     return nombre
             
             if intento < 2:
+                self.estadisticas.reintento("nombre")
                 self.hablar("No logré entender su nombre completo. ¿Podría repetirlo por favor?")
         
         self.hablar("Lo siento, no pude registrar su nombre. Le pedimos que se comunique nuevamente.")
@@ -465,6 +517,7 @@ class AgenteVozApp:
                     return telefono
             
             if intento < 2:
+                self.estadisticas.reintento("telefono")
                 self.hablar("No logré entender su número de teléfono. ¿Podría repetirlo por favor?")
         
         self.hablar("Lo siento, no pude registrar su teléfono. Le pedimos que se comunique nuevamente.")
@@ -488,6 +541,7 @@ class AgenteVozApp:
                     return interes
             
             if intento < 2:
+                self.estadisticas.reintento("interes")
                 self.hablar("¿Podría especificar en qué área está interesado?")
         
         self.hablar("Le enviaremos información general de nuestros cursos.")
@@ -503,19 +557,7 @@ class AgenteVozApp:
         Returns:
             str: Nombre extraído o None si no se encuentra
         """
-        # Patrón para nombres (palabras que empiezan con mayúscula)
-        patron = r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b'
-        coincidencias = re.findall(patron, texto.title())
-        
-        if coincidencias:
-            return coincidencias[0]
-        
-        # Si no encuentra con el patrón, tomar las primeras 2-3 palabras
-        palabras = texto.split()
-        if 2 <= len(palabras) <= 3:
-            return ' '.join(palabras).title()
-        
-        return None
+        return agent.extraer_nombre(texto)
     
     def extraer_telefono(self, texto):
         """
@@ -527,14 +569,7 @@ class AgenteVozApp:
         Returns:
             str: Teléfono extraído o None si no es válido
         """
-        # Eliminar espacios y caracteres no numéricos
-        numeros = re.sub(r'\D', '', texto)
-        
-        # Validar longitud (8-15 dígitos)
-        if 8 <= len(numeros) <= 15:
-            return numeros
-        
-        return None
+        return agent.extraer_telefono(texto)
     
     def clasificar_interes(self, texto):
         """
@@ -589,104 +624,132 @@ class AgenteVozApp:
             interes (str): Interés del cliente
             
         Returns:
-            bool: True si se agendó la cita, False en caso contrario
+            dict: Cita aceptada por el cliente con su turno reservado (se guarda junto con
+            el lead en guardar_lead), o None si no se agendó
         """
         self.hablar("¿Le gustaría agendar una cita con uno de nuestros asesores para recibir información más detallada?")
         
         respuesta = self.escuchar()
         if respuesta and any(palabra in respuesta for palabra in ["sí", "si", "claro", "por supuesto", "ok"]):
             
-            # Proponer fecha
-            fecha = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime("%d de %B")
-            self.hablar(f"Perfecto, tenemos disponibilidad para el {fecha}. ¿Le parece bien?")
+            # Proponer el primer turno con asesores libres
+            try:
+                fecha_cita, hora = self.agenda.reservar()
+            except scheduler.SinCuposError:
+                self.hablar("En este momento no tenemos turnos disponibles. Un asesor le contactará.")
+                return None
+            fecha = datetime.datetime.strptime(fecha_cita, "%Y-%m-%d").strftime("%d de %B")
+            self.hablar(f"Perfecto, tenemos disponibilidad para el {fecha} a las {hora}. ¿Le parece bien?")
             
             confirmacion = self.escuchar()
             if confirmacion and any(palabra in confirmacion for palabra in ["sí", "si", "ok", "bien", "perfecto"]):
                 
                 # Crear cita
-                cita = {
+                return {
                     "nombre": nombre,
                     "telefono": telefono,
-                    "fecha_cita": (datetime.datetime.now() + datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
-                    "hora": "10:00 AM",
+                    "fecha_cita": fecha_cita,
+                    "hora": hora,
                     "tipo": interes,
                     "estado": "Confirmada",
                     "fecha_agendamiento": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
-                
-                self.citas_agendadas.append(cita)
-                self.guardar_datos()
-                self.actualizar_treeview_citas()
-                self.actualizar_estadisticas()
-                
-                self.agregar_log(f"Cita agendada para {nombre}", "sistema")
-                return True
+            
+            self.agenda.liberar(fecha_cita, hora)
         
-        return False
+        return None
+    
+    def crear_filtro(self, frame, tabla):
+        """
+        Agrega sobre la tabla un campo de búsqueda que filtra mientras se escribe.
+        
+        Args:
+            frame: Frame de la pestaña (la tabla ocupa la fila 1)
+            tabla (TablaVirtual): Tabla a filtrar
+        """
+        filtro_frame = ttk.Frame(frame)
+        filtro_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        ttk.Label(filtro_frame, text="Buscar:").pack(side=tk.LEFT, padx=(0, 5))
+        texto = tk.StringVar()
+        pendiente = [None]
+        
+        def filtrar(*_):
+            # Se filtra cuando se deja de escribir, no con cada tecla (cada filtro cuenta filas)
+            if pendiente[0] is not None:
+                self.root.after_cancel(pendiente[0])
+            pendiente[0] = self.root.after(FILTRO_ESPERA_MS, lambda: tabla.filtrar(texto.get()))
+        
+        texto.trace_add("write", filtrar)
+        ttk.Entry(filtro_frame, textvariable=texto, width=40).pack(side=tk.LEFT)
     
     def actualizar_treeview_leads(self):
-        """Actualiza el treeview con los leads calificados."""
-        for item in self.tree_leads.get_children():
-            self.tree_leads.delete(item)
-        
-        for lead in self.leads_calificados:
-            self.tree_leads.insert('', tk.END, values=(
-                lead['nombre'],
-                lead['telefono'],
-                lead['interes'],
-                lead['calificacion'],
-                lead['fecha']
-            ))
+        """Vuelve a leer la ventana visible de leads; los leads nuevos usan agregar."""
+        self.tabla_leads.recargar()
     
     def actualizar_treeview_citas(self):
-        """Actualiza el treeview con las citas agendadas."""
-        for item in self.tree_citas.get_children():
-            self.tree_citas.delete(item)
-        
-        for cita in self.citas_agendadas:
-            self.tree_citas.insert('', tk.END, values=(
-                cita['nombre'],
-                cita['telefono'],
-                cita['fecha_cita'],
-                cita['hora'],
-                cita['tipo'],
-                cita['estado']
-            ))
+        """Vuelve a leer la ventana visible de citas; las citas nuevas usan agregar."""
+        self.tabla_citas.recargar()
     
     def actualizar_estadisticas(self):
         """Actualiza las estadísticas en la interfaz."""
-        llamadas_hoy = len([lead for lead in self.leads_calificados 
-                           if lead['fecha'].startswith(datetime.datetime.now().strftime("%Y-%m-%d"))])
-        leads_totales = len(self.leads_calificados)
-        citas_totales = len(self.citas_agendadas)
-        
+        resumen = self.estadisticas.resumen()
+        hoy, total = resumen["hoy"], resumen["total"]
+        minutos, segundos = divmod(int(hoy["duracion_media"]), 60)
+        reintentos = hoy["reintentos_por_campo"]
         self.lbl_estadisticas.config(
-            text=f"Llamadas hoy: {llamadas_hoy} | Leads calificados: {leads_totales} | Citas agendadas: {citas_totales}"
+            text=f"Llamadas hoy: {hoy['llamadas']} | Leads hoy: {hoy['leads']} | "
+                 f"Leads calificados: {total['leads']} | Citas agendadas: {total['citas']}\n"
+                 f"Duración media: {minutos}:{segundos:02d} | Conversión a cita: {hoy['conversion']:.0%} | "
+                 f"Reintentos por llamada: nombre {reintentos['nombre']:.1f}, "
+                 f"teléfono {reintentos['telefono']:.1f}, interés {reintentos['interes']:.1f}"
         )
     
-    def guardar_datos(self):
-        """Guarda los datos en archivos JSON."""
-        try:
-            with open(self.directorio_datos / "leads.json", "w", encoding="utf-8") as f:
-                json.dump(self.leads_calificados, f, ensure_ascii=False, indent=2)
+    def guardar_lead(self, lead, cita=None):
+        """
+        Guarda el lead y su cita (en una sola transacción) y los agrega a las tablas.
+        
+        Args:
+            lead (dict): Lead calificado
+            cita (dict): Cita con el turno ya reservado en la agenda, o None
             
-            with open(self.directorio_datos / "citas.json", "w", encoding="utf-8") as f:
-                json.dump(self.citas_agendadas, f, ensure_ascii=False, indent=2)
-                
+        Returns:
+            tuple: (lead guardado, cita guardada)
+        """
+        try:
+            nuevo = self.almacen.guardar_lead(lead, cita)
+        except db.SlotUnavailableError:
+            # Otro asesor (o la web) llenó el turno mientras se confirmaba: se guarda el lead sin cita
+            self.agenda.liberar(cita["fecha_cita"], cita["hora"])
+            self.agenda.refrescar(None, cita["fecha_cita"])
+            self.hablar("Lo siento, ese turno acaba de ocuparse. Un asesor le contactará para reprogramar.")
+            lead["cita_agendada"] = False
+            return self.guardar_lead(lead)
         except Exception as e:
+            if cita is not None:
+                self.agenda.liberar(cita["fecha_cita"], cita["hora"])
             self.agregar_log(f"Error guardando datos: {e}", "error")
+            return False, False
+        if cita is not None:
+            self.agenda.confirmar(cita["fecha_cita"], cita["hora"])
+            self.estadisticas.cita_agendada()
+            self.en_interfaz(self.tabla_citas.agregar, cita)
+            self.agregar_log(f"Cita agendada para {lead['nombre']}", "sistema")
+        if nuevo:
+            self.en_interfaz(self.tabla_leads.agregar, lead)
+        else:
+            # Un llamante repetido actualiza su fila en vez de agregar otra
+            self.en_interfaz(self.tabla_leads.recargar)
+        return True, cita is not None
     
     def cargar_datos(self):
-        """Carga los datos desde archivos JSON."""
+        """Prepara el almacenamiento (importa los archivos de versiones anteriores si los hay)."""
         try:
-            if (self.directorio_datos / "leads.json").exists():
-                with open(self.directorio_datos / "leads.json", "r", encoding="utf-8") as f:
-                    self.leads_calificados = json.load(f)
-            
-            if (self.directorio_datos / "citas.json").exists():
-                with open(self.directorio_datos / "citas.json", "r", encoding="utf-8") as f:
-                    self.citas_agendadas = json.load(f)
-                    
+            for aviso in self.almacen.cargar():
+                self.agregar_log(aviso, "sistema")
+            # Única lectura de los conteos guardados; después se suman en memoria. Las
+            # llamadas de hoy salen de las transcripciones, que guardan una por llamada
+            self.estadisticas.sembrar(**self.almacen.resumen(),
+                                      llamadas_hoy=self.conversacion_actual.llamadas_del_dia())
         except Exception as e:
             self.agregar_log(f"Error cargando datos: {e}", "error")
 
@@ -698,6 +761,10 @@ def main():
         root = tk.Tk()
         app = AgenteVozApp(root)
         root.mainloop()
+        app.vaciar_cola()
+        app.conversacion_actual.guardar()
+        app.conversacion_actual.cerrar()
+        app.almacen.cerrar()
     except Exception as e:
         print(f"Error iniciando aplicación: {e}")
 
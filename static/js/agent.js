@@ -21,6 +21,32 @@ function appendLog(text, cls='info'){
   logEl.scrollTop = logEl.scrollHeight;
 }
 
+function nuevaClaveIdempotencia(){
+  if(window.crypto && crypto.randomUUID){ return crypto.randomUUID(); }
+  return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+// Envía el lead reintentando ante errores de red, 429 o 503 con la misma
+// Idempotency-Key: el servidor repite la primera respuesta en vez de duplicar el lead.
+async function enviarLead(payload, intentos=3){
+  const headers = {'Content-Type':'application/json', 'Idempotency-Key': nuevaClaveIdempotencia()};
+  const body = JSON.stringify(payload);
+  for(let intento = 1; ; intento++){
+    try{
+      const res = await fetch('/api/lead', {method:'POST', headers, body});
+      if((res.status === 429 || res.status === 503) && intento < intentos){
+        const espera = parseInt(res.headers.get('Retry-After') || '1', 10);
+        await new Promise(r => setTimeout(r, espera * 1000));
+        continue;
+      }
+      return res;
+    } catch(e){
+      if(intento >= intentos){ throw e; }
+      await new Promise(r => setTimeout(r, 500 * intento));
+    }
+  }
+}
+
 function speak(text){
   return new Promise((resolve) => {
     const synth = window.speechSynthesis;
@@ -101,7 +127,7 @@ async function conversationalFlow(){
   };
 
   try{
-    const res = await fetch('/api/lead', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(payload)});
+    const res = await enviarLead(payload);
     const data = await res.json();
     if(res.ok){
       appendLog('Servidor: ' + JSON.stringify(data), 'sistema');
@@ -142,7 +168,7 @@ document.getElementById('btnSend').addEventListener('click', async () => {
   };
   appendLog('Enviando manualmente: ' + JSON.stringify(payload), 'sistema');
   try{
-    const res = await fetch('/api/lead', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(payload)});
+    const res = await enviarLead(payload);
     const data = await res.json();
     if(res.ok){ appendLog('Guardado: ' + JSON.stringify(data), 'sistema'); alert('Lead guardado. Calificación: ' + data.qualification); }
     else { appendLog('Error: ' + JSON.stringify(data), 'error'); alert('Error al guardar lead'); }
@@ -0,0 +1,156 @@
+import http.client
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app import create_app, serve
+from benchmarks import carga
+from app.admission import AdmissionController, RateLimiter
+
+
+def test_rate_limiter_rafaga_y_espera():
+    limiter = RateLimiter(rate=10, burst=2)
+    assert limiter.consume('a') == 0
+    assert limiter.consume('a') == 0
+    espera = limiter.consume('a')
+    assert 0 < espera <= 0.1
+    # Cada cliente tiene su propio cubo
+    assert limiter.consume('b') == 0
+
+
+def test_rate_limiter_olvida_clientes_antiguos():
+    limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+    for clave in ('a', 'b', 'c'):
+        limiter.consume(clave)
+    assert list(limiter._buckets) == ['b', 'c']
+
+
+def test_admision_rechaza_sin_cola():
+    controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    assert controller.acquire()[0]
+    assert controller.acquire() == (False, 'saturated', 1)
+    controller.release()
+    assert controller.acquire()[0]
+    assert (controller.admitted, controller.rejected['saturated']) == (2, 1)
+
+
+def test_admision_cola_con_timeout():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    controller.acquire()
+    t0 = time.monotonic()
+    assert controller.acquire()[:2] == (False, 'queue_timeout')
+    assert time.monotonic() - t0 < 1
+    assert controller.queued == 1 and controller.waiting == 0
+
+
+def test_admision_cola_entra_al_liberar():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    controller.acquire()
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(controller.acquire()))
+    hilo.start()
+    while controller.waiting == 0:
+        time.sleep(0.001)
+    controller.release()
+    hilo.join(timeout=5)
+    assert resultado[0][0] is True
+    assert (controller.admitted, controller.queued, controller.in_flight) == (2, 1, 1)
+
+
+def test_serve_deja_hilos_para_la_cola_de_admision(tmp_path):
+    args = serve.build_parser().parse_args(['--database', str(tmp_path / 'test.db')])
+    app = create_app(dict(serve.app_config(args), TESTING=True))
+    controller = app.extensions['admission']
+    assert (controller.max_in_flight, controller.max_queue) == (4, 64)
+    assert serve.dimensionar(args)[0] == 4 + 64 + serve.HILOS_LIBRES
+    # Con --threads fijo la cola se acorta hasta caber junto a los hilos libres
+    args = serve.build_parser().parse_args(['--threads', '20'])
+    assert serve.dimensionar(args) == (20, 4, 8)
+    args = serve.build_parser().parse_args(['--threads', '4'])
+    assert serve.dimensionar(args) == (4, 1, 0)
+
+
+def test_429_con_mas_clientes_que_hilos(tmp_path):
+    pytest.importorskip('waitress')
+    db_path = str(tmp_path / 'test.db')
+    args = serve.build_parser().parse_args(['--max-in-flight', '1', '--max-queue', '2', '--database', db_path])
+    config = dict(serve.app_config(args), DB_BUSY_TIMEOUT_MS=20000)
+    hilos = config['DB_POOL_SIZE']
+    clientes = hilos * 2
+    respuestas = []
+
+    def enviar(n):
+        conn = http.client.HTTPConnection('127.0.0.1', servidor.port, timeout=30)
+        conn.request('POST', '/api/lead', json.dumps({'name': 'Ana', 'phone': f'300{n:04d}'}),
+                     {'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        respuestas.append((resp.status, resp.getheader('Retry-After'), json.loads(resp.read())))
+        conn.close()
+
+    with carga.Servidor(config, 'waitress', hilos) as servidor:
+        # La escritura admitida se queda esperando el bloqueo de escritura de SQLite
+        bloqueo = sqlite3.connect(db_path, isolation_level=None)
+        bloqueo.execute('BEGIN IMMEDIATE')
+        try:
+            hilos_clientes = [threading.Thread(target=enviar, args=(n,)) for n in range(clientes)]
+            for hilo in hilos_clientes:
+                hilo.start()
+            fin = time.monotonic() + 10
+            while len(respuestas) < clientes - 1 and time.monotonic() < fin:
+                time.sleep(0.05)
+            rechazadas = list(respuestas)
+        finally:
+            bloqueo.execute('ROLLBACK')
+            bloqueo.close()
+        for hilo in hilos_clientes:
+            hilo.join(timeout=30)
+
+    assert len(rechazadas) == clientes - 1
+    assert all(status == 429 and retry_after for status, retry_after, _ in rechazadas)
+    motivos = {cuerpo['reason'] for _, _, cuerpo in rechazadas}
+    assert 'saturated' in motivos and motivos <= {'saturated', 'queue_timeout'}
+    assert sorted(status for status, _, _ in respuestas) == [200] + [429] * (clientes - 1)
+
+
+def test_api_lead_429_por_saturacion(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'),
+                      'ADMISSION_MAX_IN_FLIGHT': 0, 'ADMISSION_MAX_QUEUE': 0})
+    client = app.test_client()
+    resp = client.post('/api/lead', json={'name': 'Ana', 'phone': '300111'})
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After'] == '1'
+    assert resp.get_json()['reason'] == 'saturated'
+    assert client.post('/api/leads/batch', json=[]).status_code == 429
+    # Las lecturas no pasan por el control de admisión
+    assert client.get('/api/stats').status_code == 200
+
+
+def test_api_lead_limite_por_token(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'),
+                      'ADMISSION_RATE_PER_TOKEN': 0.5, 'ADMISSION_BURST': 2})
+    client = app.test_client()
+
+    def enviar(token, n):
+        return client.post('/api/lead', json={'name': 'Ana', 'phone': f'300{n}'}, headers={'X-Client-Token': token})
+
+    assert [enviar('socio', n).status_code for n in range(2)] == [200, 200]
+    resp = enviar('socio', 3)
+    assert resp.status_code == 429
+    assert resp.get_json()['reason'] == 'rate_limited'
+    assert resp.headers['Retry-After'] == '2'
+    assert enviar('otro', 4).status_code == 200
+
+    texto = client.get('/metrics').get_data(as_text=True)
+    assert 'admission_admitted_total 3' in texto
+    assert 'admission_rejected_total{reason="rate_limited"} 1' in texto
+    assert 'admission_in_flight 0' in texto
+
+
+def test_admision_desactivada(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'ADMISSION_ENABLED': False,
+                      'ADMISSION_MAX_IN_FLIGHT': 0})
+    assert 'admission' not in app.extensions
+    assert app.test_client().post('/api/lead', json={'name': 'Ana', 'phone': '300111'}).status_code == 200
@@ -1,4 +1,5 @@
 import re
+from datetime import date, datetime
 from app import agent
 
 
@@ -25,7 +26,10 @@ def test_proponer_cita_format():
     cita = agent.proponer_cita()
     # date should match YYYY-MM-DD
     assert re.match(r"\d{4}-\d{2}-\d{2}", cita['date'])
-    assert cita['time'] == '10:00'
+    # Primer turno del horario por defecto, desde mañana y nunca en domingo
+    assert cita['time'] == '09:00'
+    fecha = datetime.strptime(cita['date'], '%Y-%m-%d').date()
+    assert fecha > date.today() and fecha.weekday() != 6
 
 
 def test_crear_lead_payload_contents():
@@ -35,3 +39,48 @@ def test_crear_lead_payload_contents():
     assert 'interest' in payload
     assert 'qualification' in payload
     assert 'created_at' in payload
+
+
+def test_clasificar_interes_sin_tildes_ni_mayusculas():
+    assert agent.clasificar_interes('quiero clases de ingles') == 'Idiomas'
+    assert agent.clasificar_interes('QUIERO CLASES DE INGLÉS') == 'Idiomas'
+    assert agent.clasificar_interes('Curso de Programacion') == 'Tecnologia'
+    assert agent.clasificar_interes('Ingle\u0301s con tilde combinada') == 'Idiomas'
+    assert agent.clasificar_interes('“Comunicación” ½ día') == 'Desarrollo personal'
+
+
+def test_tabla_latin1_equivale_a_quitar_tildes():
+    # La pasada por bytes.translate debe dar lo mismo que quitar_tildes(lower()) en
+    # cada carácter latin-1 que no se marca para el camino general
+    for b in range(256):
+        caracter = chr(b)
+        plano = caracter.encode('latin-1').translate(agent._LATIN1_SIN_TILDES, agent._LATIN1_BORRAR)
+        if plano != b'\0':
+            assert plano.decode('ascii') == agent.quitar_tildes(caracter.lower()), repr(caracter)
+
+
+def test_clasificar_interes_primera_categoria_gana():
+    # "desarrollo personal" contiene "desarrollo" (Tecnologia), que se evalúa antes
+    assert agent.clasificar_interes('Busco desarrollo personal') == 'Tecnologia'
+    assert agent.clasificar_interes('Liderazgo y python') == 'Tecnologia'
+    assert agent.clasificar_interes('Marketing y francés') == 'Idiomas'
+
+
+def test_clasificar_interes_otros():
+    assert agent.clasificar_interes('') == 'Otros'
+    assert agent.clasificar_interes(None) == 'Otros'
+    assert agent.clasificar_interes('Quiero información de horarios') == 'Otros'
+
+
+def test_extraer_nombre():
+    assert agent.extraer_nombre('me llamo juan perez') == 'Me Llamo Juan Perez'
+    assert agent.extraer_nombre('Ana María') == 'Ana María'
+    assert agent.extraer_nombre('hola') is None
+    assert agent.extraer_nombre('') is None
+
+
+def test_extraer_telefono():
+    assert agent.extraer_telefono('mi número es 300 123 4567') == '3001234567'
+    assert agent.extraer_telefono('+57 (300) 123-4567') == '573001234567'
+    assert agent.extraer_telefono('1234567') is None
+    assert agent.extraer_telefono('1' * 16) is None
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime
+
+import pytest
+from app.call_stats import EstadisticasLlamadas
+
+LUNES = datetime(2026, 10, 19, 10, 0)
+
+
+def llamada(stats, lead=True, convertida=False, ahora=LUNES):
+    stats.inicio_llamada()
+    stats.fin_llamada(lead=lead, convertida=convertida, ahora=ahora)
+
+
+def test_resumen_del_dia_y_acumulado():
+    stats = EstadisticasLlamadas(ahora=LUNES)
+    stats.sembrar(leads=100, citas=40, leads_hoy=3)
+    assert stats.resumen(LUNES)['hoy']['duracion_media'] == 0.0
+
+    stats.inicio_llamada()
+    stats.reintento('telefono', LUNES)
+    stats.reintento('telefono', LUNES)
+    stats.cita_agendada(LUNES)
+    assert stats.en_llamada()
+    time.sleep(0.01)
+    stats.fin_llamada(lead=True, convertida=True, ahora=LUNES)
+    llamada(stats, lead=False)
+    assert not stats.en_llamada()
+
+    hoy = stats.resumen(LUNES)['hoy']
+    assert (hoy['llamadas'], hoy['leads'], hoy['citas']) == (2, 4, 1)
+    assert hoy['conversion'] == 0.5
+    assert hoy['reintentos_por_campo'] == {'nombre': 0.0, 'telefono': 1.0, 'interes': 0.0}
+    assert hoy['duracion_media'] > 0.004
+    total = stats.resumen(LUNES)['total']
+    assert (total['llamadas'], total['leads'], total['citas']) == (2, 101, 41)
+
+
+def test_cambio_de_dia_a_medianoche():
+    stats = EstadisticasLlamadas(ahora=LUNES)
+    llamada(stats, convertida=True)
+    martes = datetime(2026, 10, 20, 0, 0, 1)
+    assert stats.resumen(martes)['hoy']['llamadas'] == 0
+    assert stats.ayer.llamadas == 1
+    llamada(stats, ahora=martes)
+    resumen = stats.resumen(martes)
+    assert (resumen['hoy']['llamadas'], resumen['total']['llamadas']) == (1, 2)
+    assert resumen['total']['conversion'] == 0.5
+
+    # Tras varios días sin actividad, `ayer` queda vacío
+    stats.resumen(datetime(2026, 10, 23, 9, 0))
+    assert stats.ayer.llamadas == 0
+
+
+def test_campo_desconocido():
+    with pytest.raises(KeyError):
+        EstadisticasLlamadas().reintento('correo')
+
+
+def test_sembrar_llamadas_de_hoy_de_sesiones_anteriores():
+    anterior = EstadisticasLlamadas(ahora=LUNES)
+    anterior.inicio_llamada()
+    anterior.reintento('nombre', LUNES)
+    primera = anterior.fin_llamada(lead=True, convertida=True, ahora=LUNES)
+    anterior.inicio_llamada()
+    segunda = anterior.fin_llamada(ahora=LUNES)
+    assert primera['reintentos'] == {'nombre': 1, 'telefono': 0, 'interes': 0}
+    assert segunda['reintentos']['nombre'] == 0 and not segunda['convertida']
+
+    stats = EstadisticasLlamadas(ahora=LUNES)
+    stats.sembrar(leads=10, citas=4, leads_hoy=1, llamadas_hoy=[primera, segunda])
+    llamada(stats, lead=False)
+    hoy = stats.resumen(LUNES)['hoy']
+    assert (hoy['llamadas'], hoy['leads'], hoy['citas']) == (3, 1, 1)
+    assert hoy['conversion'] == 1 / 3
+    assert hoy['reintentos_por_campo']['nombre'] == 1 / 3
+    # Lo acumulado de la sesión no incluye las llamadas de sesiones anteriores
+    assert stats.resumen(LUNES)['total']['llamadas'] == 1
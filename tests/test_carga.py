@@ -0,0 +1,50 @@
+import random
+from collections import Counter
+
+import pytest
+
+from app import agent
+from benchmarks import carga, sinteticos
+
+
+def test_generador_cubre_todas_las_categorias():
+    leads = sinteticos.iter_leads(seed=1)
+    vistas = Counter(agent.clasificar_interes(next(leads)['interest_text']) for _ in range(500))
+    assert set(vistas) == set(sinteticos.CATEGORIAS_SINTETICAS)
+    # La rueda reparte por igual entre categorías
+    assert len(set(vistas.values())) == 1
+
+
+def test_generador_respeta_la_categoria_pedida():
+    rng = random.Random(3)
+    for categoria in sinteticos.CATEGORIAS_SINTETICAS:
+        for _ in range(50):
+            assert agent.clasificar_interes(sinteticos.generar_interes(rng, categoria)) == categoria
+
+
+def test_generador_es_reproducible():
+    a = sinteticos.iter_leads(seed=7)
+    b = sinteticos.iter_leads(seed=7)
+    assert [next(a) for _ in range(20)] == [next(b) for _ in range(20)]
+
+
+def test_parse_mezcla_y_percentil():
+    assert carga.parse_mezcla('lead=3, stats=1') == {'lead': 3, 'stats': 1}
+    with pytest.raises(ValueError):
+        carga.parse_mezcla('borrar=1')
+    with pytest.raises(ValueError):
+        carga.parse_mezcla('lead=0')
+    datos = [float(i) for i in range(1, 101)]
+    assert (carga.percentil(datos, 50), carga.percentil(datos, 99)) == (50.0, 99.0)
+    assert carga.percentil([], 95) == 0.0
+
+
+def test_ejecucion_corta_contra_servidor_local(tmp_path):
+    config = {'DATABASE': str(tmp_path / 'carga.db')}
+    with carga.Servidor(config, tipo='dev') as servidor:
+        resultado = carga.ejecutar('127.0.0.1', servidor.port, concurrencia=2, duracion=0.3,
+                                   mezcla={'lead': 1, 'lead_cita': 1, 'stats': 1})
+    assert resultado['total']['errors'] == 0
+    assert resultado['total']['requests'] > 0
+    assert set(resultado['operations']) == {'lead', 'lead_cita', 'stats'}
+    assert resultado['total']['p50_ms'] <= resultado['total']['p99_ms']
@@ -0,0 +1,136 @@
+import json
+import queue
+
+from app.conversation_log import Transcripcion, VistaLog, drenar
+
+
+class TextoFalso:
+    """Lo mínimo de tk.Text que usa VistaLog (índices 'línea.columna' de líneas completas)."""
+
+    def __init__(self):
+        self.lineas = []
+        self.etiquetas = {}
+        self.inserts = 0
+        self.estado = 'disabled'
+
+    def tag_configure(self, tipo, foreground):
+        self.etiquetas[tipo] = foreground
+
+    def config(self, state):
+        self.estado = state
+
+    def insert(self, indice, *argumentos):
+        assert indice == 'end' and self.estado == 'normal'
+        self.inserts += 1
+        for texto, tipo in zip(argumentos[::2], argumentos[1::2]):
+            self.lineas.extend((linea, tipo) for linea in texto[:-1].split('\n'))
+
+    def delete(self, desde, hasta):
+        fin = len(self.lineas) + 1 if hasta == 'end' else int(hasta.split('.')[0])
+        del self.lineas[int(desde.split('.')[0]) - 1:fin - 1]
+
+    def see(self, indice):
+        pass
+
+
+def test_drenar_respeta_el_maximo():
+    cola = queue.Queue()
+    for i in range(5):
+        cola.put(i)
+    assert drenar(cola, 3) == [0, 1, 2]
+    assert drenar(cola, 3) == [3, 4]
+    assert drenar(cola, 3) == []
+
+
+def test_vista_escribe_por_lotes_y_recorta():
+    texto = TextoFalso()
+    vista = VistaLog(texto, max_lineas=10)
+    assert set(texto.etiquetas) == {'info', 'agente', 'cliente', 'error', 'sistema'}
+    vista.escribir([(f'linea {i}', 'agente') for i in range(4)])
+    assert texto.inserts == 1 and texto.estado == 'disabled'
+
+    for lote in range(5):
+        vista.escribir([(f'linea {lote}-{i}', 'desconocido') for i in range(4)])
+    assert len(texto.lineas) == 10 and vista.lineas == 10
+    assert texto.lineas[-1] == ('linea 4-3', 'info')
+    assert texto.lineas[0] == ('linea 2-2', 'info')
+
+    # Un lote mayor que el límite sólo inserta sus últimas líneas
+    vista.escribir([(f'x {i}', 'error') for i in range(25)])
+    assert [l for l, _ in texto.lineas] == [f'x {i}' for i in range(15, 25)]
+
+    # Los mensajes de varias líneas se recortan por líneas del widget, no por mensajes
+    vista.escribir([(f'y {i}\nsegunda\ntercera', 'cliente') for i in range(6)])
+    assert len(texto.lineas) == vista.lineas == 10
+    assert texto.lineas[0] == ('tercera', 'cliente')
+    assert texto.lineas[-3] == ('y 5', 'cliente')
+
+    vista.limpiar()
+    assert texto.lineas == [] and vista.lineas == 0
+    vista.escribir([])
+    assert texto.inserts == 8
+
+
+def test_transcripcion_se_guarda_completa_mensaje_a_mensaje(tmp_path):
+    transcripcion = Transcripcion(tmp_path, max_mensajes=3)
+    assert transcripcion.guardar() is None
+    for i in range(5):
+        transcripcion.agregar('10:00:00', 'cliente', f'mensaje {i}')
+    # Cada mensaje ya está en disco; en memoria sólo la cuenta
+    archivo, = (tmp_path / 'transcripciones').iterdir()
+    assert archivo.suffix == '.jsonl' and len(archivo.read_text(encoding='utf-8').splitlines()) == 5
+    assert len(transcripcion.mensajes) == 0 and transcripcion.total == 5
+    registro = transcripcion.guardar(telefono='3001112233')
+    assert (registro['total_mensajes'], registro['telefono']) == (5, '3001112233')
+    assert transcripcion.total == 0
+
+    transcripcion.agregar('10:05:00', 'agente', 'hola')
+    transcripcion.guardar()
+    # Una llamada que se cortó sin línea de cierre
+    transcripcion.agregar('10:09:00', 'agente', 'cortada')
+    transcripcion.cerrar()
+
+    primera, segunda, cortada = Transcripcion(tmp_path).transcripciones_del_dia()
+    assert [m['mensaje'] for m in primera['mensajes']] == [f'mensaje {i}' for i in range(5)]
+    assert primera['telefono'] == '3001112233' and primera['transcripcion'] != segunda['transcripcion']
+    assert segunda['mensajes'] == [{'timestamp': '10:05:00', 'tipo': 'agente', 'mensaje': 'hola'}]
+    assert 'fin' not in cortada and [m['mensaje'] for m in cortada['mensajes']] == ['cortada']
+
+
+def test_transcripciones_en_formato_anterior(tmp_path):
+    (tmp_path / 'transcripciones').mkdir()
+    anterior = {'inicio': '2030-01-01T10:00:00', 'fin': '2030-01-01T10:01:00', 'descartados': 0,
+                'mensajes': [{'timestamp': '10:00:00', 'tipo': 'info', 'mensaje': 'a'}],
+                'llamada': {'duracion': 60.0}}
+    (tmp_path / 'transcripciones' / '2030-01-01.jsonl').write_text(json.dumps(anterior) + '\n', encoding='utf-8')
+    transcripcion = Transcripcion(tmp_path)
+    assert list(transcripcion.transcripciones_del_dia('2030-01-01')) == [anterior]
+    assert list(transcripcion.llamadas_del_dia('2030-01-01')) == [{'duracion': 60.0}]
+
+
+def test_llamadas_del_dia_desde_las_transcripciones(tmp_path):
+    transcripcion = Transcripcion(tmp_path)
+    for i in range(3):
+        transcripcion.agregar('10:00:00', 'cliente', f'mensaje {i}')
+        transcripcion.guardar(telefono='300', llamada={'duracion': 60.0 + i, 'convertida': i == 0})
+    # Cerrar la app a mitad de llamada guarda la transcripción sin resumen
+    transcripcion.agregar('10:10:00', 'agente', 'hola')
+    transcripcion.guardar()
+    transcripcion.cerrar()
+
+    reabierta = Transcripcion(tmp_path)
+    assert [l['duracion'] for l in reabierta.llamadas_del_dia()] == [60.0, 61.0, 62.0]
+    assert list(reabierta.llamadas_del_dia('2000-01-01')) == []
+    assert list(Transcripcion().llamadas_del_dia()) == []
+
+
+def test_transcripcion_sin_directorio_solo_en_memoria():
+    transcripcion = Transcripcion(max_mensajes=2)
+    transcripcion.agregar('10:00:00', 'info', 'a')
+    assert transcripcion.guardar()['mensajes'] == [{'timestamp': '10:00:00', 'tipo': 'info', 'mensaje': 'a'}]
+    for i in range(5):
+        transcripcion.agregar('10:00:00', 'info', str(i))
+    registro = transcripcion.guardar()
+    assert [m['mensaje'] for m in registro['mensajes']] == ['3', '4']
+    assert (registro['total_mensajes'], registro['descartados']) == (5, 3)
+    assert list(transcripcion.transcripciones_del_dia()) == []
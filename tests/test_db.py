@@ -0,0 +1,277 @@
+import sqlite3
+import threading
+
+import pytest
+from app import db
+
+
+def test_get_connection_pragmas(tmp_path):
+    conn = db.get_connection(str(tmp_path / 'test.db'), busy_timeout_ms=1234)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 1234
+
+
+def test_pool_acotado_y_reutiliza(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    pool = db.ConnectionPool(db_path, size=2, timeout=0.05)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b
+    with pytest.raises(db.PoolExhaustedError):
+        pool.acquire()
+    pool.release(a)
+    assert pool.acquire() is a
+    pool.release(a)
+    pool.release(b)
+    pool.close_all()
+
+
+def test_pool_release_descarta_transaccion_abierta(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    pool = db.ConnectionPool(db_path, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO leads (name) VALUES ('sin commit')")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_pool_espera_conexion_liberada(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    pool = db.ConnectionPool(db_path, size=1, timeout=2)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(conn,)).start()
+    assert pool.acquire() is conn
+
+
+def test_write_behind_agrupa_y_resuelve_ids(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    writer = db.WriteBehindWriter(db_path, batch_size=16, flush_interval_ms=20)
+    futures = [
+        writer.submit_lead({'name': f'Lead {i}', 'phone': str(i)},
+                           {'date': '2030-01-01', 'time': '10:00'} if i % 2 else None)
+        for i in range(50)
+    ]
+    writer.close()
+    resultados = [f.result(timeout=1) for f in futures]
+    assert len({lead_id for lead_id, _ in resultados}) == 50
+    assert all((appt_id is not None) == bool(i % 2) for i, (_, appt_id) in enumerate(resultados))
+
+    conn = db.get_connection(db_path)
+    lead_id, appt_id = resultados[1]
+    row = conn.execute('SELECT lead_id FROM appointments WHERE id = ?', (appt_id,)).fetchone()
+    assert row['lead_id'] == lead_id
+    stats = db.get_stats(conn)
+    assert (stats['total_leads'], stats['total_appointments']) == (50, 25)
+
+
+def test_write_behind_aisla_elemento_invalido(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    writer = db.WriteBehindWriter(db_path, flush_interval_ms=50)
+    ok = writer.submit_lead({'name': 'Ana', 'phone': '1'})
+    malo = writer.submit_lead({'name': object(), 'phone': '2'})
+    writer.close()
+    assert ok.result(timeout=1)[0] > 0
+    with pytest.raises(Exception):
+        malo.result(timeout=1)
+    with pytest.raises(RuntimeError):
+        writer.submit_lead({'name': 'tarde', 'phone': '3'})
+
+
+def test_write_behind_cola_llena(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    db.init_db(db_path).close()
+    writer = db.WriteBehindWriter(db_path, max_queue=1, put_timeout=0.01)
+    bloqueo = threading.Event()
+    writer._write_batch = lambda batch: bloqueo.wait()
+    writer.submit_lead({'name': 'a'})
+    with pytest.raises(db.WriteQueueFullError):
+        for _ in range(3):
+            writer.submit_lead({'name': 'b'})
+    bloqueo.set()
+    writer.close(timeout=1)
+
+
+def test_stats_counters_por_triggers(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    for i, (interest, qualification, day) in enumerate([
+        ('Idiomas', 'Alta', '2030-01-01'), ('Negocios', 'Media', '2030-01-01'), ('Idiomas', 'Alta', '2030-01-02'),
+    ]):
+        lead_id = db.insert_lead(conn, {'name': f'L{i}', 'phone': str(i), 'interest': interest,
+                                        'qualification': qualification, 'created_at': f'{day}T09:00:00'})
+    db.insert_appointment(conn, {'lead_id': lead_id, 'created_at': '2030-01-02T09:05:00'})
+    conn.execute("DELETE FROM leads WHERE name = 'L1'")
+    conn.commit()
+
+    stats = db.get_stats(conn)
+    assert stats['total_leads'] == 2
+    assert stats['total_appointments'] == 1
+    assert stats['by_interest'] == {'Idiomas': 2}
+    assert stats['by_qualification'] == {'Alta': 2}
+    assert stats['by_day'] == {'2030-01-02': {'leads': 1, 'appointments': 1},
+                               '2030-01-01': {'leads': 1, 'appointments': 0}}
+    assert list(db.get_stats(conn, days=1)['by_day']) == ['2030-01-02']
+
+
+def test_stats_counters_rellena_base_existente(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    # Base creada antes de existir stats_counters
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE leads (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, phone TEXT, '
+                 'interest TEXT, qualification TEXT, created_at TEXT)')
+    conn.execute("INSERT INTO leads (name, interest, qualification, created_at) VALUES ('a', 'Otros', 'Baja', '2030-01-01')")
+    conn.commit()
+    conn.close()
+
+    conn = db.init_db(db_path)
+    stats = db.get_stats(conn)
+    assert stats['total_leads'] == 1
+    assert stats['by_interest'] == {'Otros': 1}
+
+
+def test_normalize_phone():
+    assert db.normalize_phone('+57 300-111 2233') == '573001112233'
+    assert db.normalize_phone('(300) 111.22.33') == '3001112233'
+    assert db.normalize_phone('sin número') is None
+    assert db.normalize_phone(None) is None
+
+
+def test_insert_lead_fusiona_llamante_repetido(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    primero = db.insert_lead(conn, {'name': 'Ana', 'phone': '+57 300 111 2233', 'interest': 'Negocios',
+                                    'qualification': 'Media', 'created_at': '2030-01-01T10:00:00'})
+    otro = db.insert_lead(conn, {'name': 'Luis', 'phone': '3004445566', 'interest': 'Otros',
+                                 'qualification': 'Baja', 'created_at': '2030-01-01T11:00:00'})
+    repetido = db.insert_lead(conn, {'name': 'Ana María', 'phone': '573001112233', 'interest': 'Idiomas',
+                                     'qualification': 'Alta', 'created_at': '2030-01-02T10:00:00'})
+    assert repetido == primero != otro
+
+    lead = db.find_lead_by_phone(conn, '57-300-111-2233')
+    assert lead['name'] == 'Ana María'
+    assert lead['interest'] == 'Idiomas'
+    assert lead['call_count'] == 2
+    assert lead['created_at'] == '2030-01-01T10:00:00'
+    assert lead['updated_at'] == '2030-01-02T10:00:00'
+
+    # Una llamada más antigua (p. ej. importada) no pisa los datos recientes
+    db.insert_lead(conn, {'name': 'Viejo', 'phone': '573001112233', 'interest': 'Otros',
+                          'qualification': 'Baja', 'created_at': '2029-12-31T10:00:00'})
+    lead = db.find_lead_by_phone(conn, '573001112233')
+    assert (lead['name'], lead['call_count'], lead['created_at']) == ('Ana María', 3, '2029-12-31T10:00:00')
+
+    stats = db.get_stats(conn)
+    assert stats['total_leads'] == 2
+    assert stats['by_interest'] == {'Idiomas': 1, 'Otros': 1}
+    assert stats['by_day'] == {'2030-01-01': {'leads': 1, 'appointments': 0},
+                               '2029-12-31': {'leads': 1, 'appointments': 0}}
+
+
+def test_insert_leads_batch_fusiona_por_telefono(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    existente = db.insert_lead(conn, {'name': 'Ana', 'phone': '111-222-333', 'created_at': '2030-01-01'})
+    lead_ids, appt_ids = db.insert_leads_batch(conn, [
+        {'name': 'Ana', 'phone': '111222333', 'created_at': '2030-01-02'},
+        {'name': 'Eva', 'phone': '444555666', 'created_at': '2030-01-02'},
+        {'name': 'Eva', 'phone': '444 555 666', 'created_at': '2030-01-03'},
+    ], [{'lead_index': 1, 'date': '2030-01-04', 'time': '10:00'}])
+    assert lead_ids[0] == existente
+    assert lead_ids[1] == lead_ids[2] != existente
+    assert [a['id'] for a in db.get_appointments_for_lead(conn, lead_ids[1])] == appt_ids
+    assert db.find_lead_by_phone(conn, '444555666')['call_count'] == 2
+
+
+def test_cambios_contados_igual_que_los_triggers(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+
+    def contadores():
+        return {(r[0], r[1]): r[2] for r in conn.execute('SELECT dimension, value, count FROM stats_counters')}
+
+    leads = [
+        {'name': 'Ana', 'phone': '300111', 'interest': 'Negocios', 'qualification': 'Media', 'created_at': '2030-01-02T10:00'},
+        {'name': 'Ana', 'phone': '300111', 'interest': 'Idiomas', 'qualification': 'Alta', 'created_at': '2030-01-03T10:00'},
+        # Más antigua que la última: no cambia interés, pero sí el día de alta
+        {'name': 'Ana', 'phone': '300111', 'interest': 'Otros', 'qualification': 'Baja', 'created_at': '2030-01-01T10:00'},
+        {'name': 'Sin teléfono', 'phone': None, 'interest': 'Otros', 'qualification': 'Baja', 'created_at': '2030-01-01T11:00'},
+        {'name': 'Luis', 'phone': '300222', 'interest': None, 'qualification': None, 'created_at': None},
+    ]
+    for lead in leads:
+        antes = contadores()
+        cambios = db.CambiosStats()
+        db.insert_lead(conn, lead, cambios=cambios)
+        despues = contadores()
+        assert {k: n for k, n in cambios.items() if n} == \
+            {k: despues.get(k, 0) - antes.get(k, 0) for k in despues.keys() | antes.keys() if despues.get(k, 0) != antes.get(k, 0)}
+
+    antes = contadores()
+    cambios = db.CambiosStats()
+    lead_ids, _ = db.insert_leads_batch(conn, leads + [dict(leads[0], phone='300333')],
+                                        [{'lead_index': 5, 'date': '2030-01-04', 'time': '10:00',
+                                          'created_at': '2030-01-03T12:00'}], cambios=cambios)
+    despues = contadores()
+    assert {k: n for k, n in cambios.items() if n} == \
+        {k: despues.get(k, 0) - antes.get(k, 0) for k in despues.keys() | antes.keys() if despues.get(k, 0) != antes.get(k, 0)}
+    assert lead_ids[0] == db.find_lead_by_phone(conn, '300111')['id']
+
+
+def test_migracion_fusiona_duplicados_existentes(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    # Base con el esquema original (sin versión) y un llamante repetido
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE leads (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, phone TEXT, '
+                 'interest TEXT, qualification TEXT, created_at TEXT)')
+    conn.execute('CREATE TABLE appointments (id INTEGER PRIMARY KEY AUTOINCREMENT, lead_id INTEGER, date TEXT, '
+                 'time TEXT, type TEXT, status TEXT, created_at TEXT)')
+    conn.executemany('INSERT INTO leads (name, phone, interest, qualification, created_at) VALUES (?, ?, ?, ?, ?)', [
+        ('Ana', '300 111 2233', 'Negocios', 'Media', '2030-01-01T10:00:00'),
+        ('Luis', '3004445566', 'Otros', 'Baja', '2030-01-01T11:00:00'),
+        ('Ana P.', '300-111-2233', 'Idiomas', 'Alta', '2030-01-02T10:00:00'),
+    ])
+    conn.execute("INSERT INTO appointments (lead_id, date, time) VALUES (3, '2030-01-03', '10:00')")
+    conn.commit()
+    conn.close()
+
+    conn = db.init_db(db_path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(db.MIGRATIONS)
+    ana = db.find_lead_by_phone(conn, '3001112233')
+    assert (ana['id'], ana['name'], ana['interest'], ana['call_count']) == (1, 'Ana P.', 'Idiomas', 2)
+    assert [a['lead_id'] for a in db.get_appointments_for_lead(conn, 1)] == [1]
+    stats = db.get_stats(conn)
+    assert stats['total_leads'] == 2
+    assert stats['by_interest'] == {'Idiomas': 1, 'Otros': 1}
+
+    # Reabrir no vuelve a aplicar migraciones
+    conn.close()
+    assert db.migrate(db.get_connection(db_path)) == len(db.MIGRATIONS)
+
+
+@pytest.mark.parametrize('sql, params, index', [
+    (db.SQL_LEAD_BY_PHONE, ('573001112233',), 'idx_leads_phone_normalized'),
+    (db.SQL_LEADS_CREATED_BETWEEN, ('2030-01-01', '2030-01-02'), 'idx_leads_created_at'),
+    (db.SQL_APPOINTMENTS_FOR_LEAD, (1,), 'idx_appointments_lead_id'),
+    (db.SQL_SLOT_OCCUPANCY, ('2030-01-01',), 'idx_appointments_date_time'),
+])
+def test_consultas_frecuentes_usan_indice(tmp_path, sql, params, index):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan
+    assert 'SCAN' not in plan
+
+
+@pytest.mark.parametrize('filtros', [{}, {'interest': 'Idiomas'}, {'qualification': 'Alta'},
+                                     {'interest': 'Idiomas', 'qualification': 'Alta'},
+                                     {'date_from': '2030-01-01', 'date_to': '2030-02-01'}])
+def test_listado_por_cursor_sin_ordenar_en_memoria(tmp_path, filtros):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    for construir in (db._leads_query, db._appointments_query):
+        sql, params = construir(cursor=1000, **filtros)
+        plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql + ' LIMIT 51', params))
+        assert 'TEMP B-TREE' not in plan
+        if construir is db._leads_query and ('interest' in filtros or 'qualification' in filtros):
+            assert 'idx_leads_interest_id' in plan or 'idx_leads_qualification_id' in plan
@@ -0,0 +1,198 @@
+import json
+from collections import Counter
+
+from app import create_app
+from app import db, events
+
+LEAD = {'name': 'Ana Gómez', 'phone': '300 111 2233', 'interest_text': 'inglés', 'schedule': True}
+
+
+def crear(tmp_path, **config):
+    config.setdefault('STATS_STREAM_MIN_INTERVAL', 0)
+    config.setdefault('STATS_STREAM_HEARTBEAT_SECONDS', 2)
+    return create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'NOTIFY_DISPATCHER': False, **config})
+
+
+def leer_evento(fragmentos):
+    """Siguiente evento del stream como (nombre, datos), saltando retry y pings."""
+    for fragmento in fragmentos:
+        texto = fragmento.decode() if isinstance(fragmento, bytes) else fragmento
+        campos = dict(linea.split(': ', 1) for linea in texto.strip().split('\n') if not linea.startswith(':'))
+        if 'event' in campos:
+            return campos['event'], json.loads(campos['data'])
+    return None
+
+
+def test_diferencia_stats():
+    antes = {'total_leads': 1, 'by_qualification': {'Alta': 1}, 'by_day': {'2030-01-01': {'leads': 1, 'appointments': 0}}}
+    despues = {'total_leads': 2, 'by_qualification': {'Alta': 1, 'Media': 1}, 'by_day': {}}
+    assert events.diferencia_stats(antes, despues) == {
+        'total_leads': 2,
+        'by_qualification': {'Media': 1},
+        'by_day': {'2030-01-01': {'leads': 0, 'appointments': 0}}
+    }
+    assert events.diferencia_stats(despues, despues) == {}
+
+
+def test_stream_snapshot_lead_y_stats(tmp_path):
+    app = crear(tmp_path)
+    client = app.test_client()
+    client.post('/api/lead', json=dict(LEAD, schedule=False))
+
+    resp = client.get('/api/stats/stream', buffered=False)
+    assert resp.mimetype == 'text/event-stream'
+    fragmentos = iter(resp.response)
+    nombre, snapshot = leer_evento(fragmentos)
+    assert nombre == 'snapshot'
+    stats = client.get('/api/stats').get_json()
+    stats.pop('idempotency')
+    assert snapshot == stats
+
+    creado = client.post('/api/lead', json=dict(LEAD, phone='311 222 3344')).get_json()
+    nombre, datos = leer_evento(fragmentos)
+    assert nombre == 'lead'
+    assert (datos['lead_id'], datos['appointment']) == (creado['lead_id'], creado['appointment'])
+    nombre, delta = leer_evento(fragmentos)
+    assert nombre == 'stats'
+    assert (delta['total_leads'], delta['total_appointments']) == (2, 1)
+    assert delta['by_qualification'] == {creado['qualification']: 2}
+
+    # Un llamante repetido fusiona su lead: el total no cambia y sí las citas
+    client.post('/api/lead', json=LEAD)
+    assert leer_evento(fragmentos)[0] == 'lead'
+    nombre, delta = leer_evento(fragmentos)
+    assert nombre == 'stats' and 'total_leads' not in delta and delta['total_appointments'] == 2
+    resp.close()
+    assert app.extensions['stats_stream'].render_metrics()[2] == 'stats_stream_subscribers 0'
+
+
+def test_lote_publica_stats(tmp_path):
+    app = crear(tmp_path)
+    client = app.test_client()
+    resp = client.get('/api/stats/stream', buffered=False)
+    fragmentos = iter(resp.response)
+    leer_evento(fragmentos)
+    client.post('/api/leads/batch', json=[LEAD, dict(LEAD, phone='1'), dict(LEAD, phone='2')])
+    nombre, delta = leer_evento(fragmentos)
+    assert (nombre, delta['total_leads'], delta['total_appointments']) == ('stats', 3, 3)
+    resp.close()
+
+
+def test_consumidor_lento_se_descarta():
+    publisher = events.StatsPublisher(lambda: {'total_leads': 0}, buffer_size=3)
+    lento = publisher.suscribir()
+    rapido = publisher.suscribir()
+    for i in range(5):
+        publisher.publicar('lead', {'lead_id': i})
+        while rapido.siguiente(0) not in (None, events.FIN):
+            pass
+    # El lento recibe sólo el aviso y termina; el rápido sigue suscrito
+    assert 'event: dropped' in lento.siguiente(0)
+    assert lento.siguiente(0) is events.FIN
+    assert (publisher.dropped, len(publisher._suscriptores)) == (1, 1)
+    publisher.close()
+    assert rapido.siguiente(0) is events.FIN
+
+
+def test_limite_de_suscriptores(tmp_path):
+    app = crear(tmp_path, STATS_STREAM_MAX_SUBSCRIBERS=1)
+    client = app.test_client()
+    primero = client.get('/api/stats/stream', buffered=False)
+    segundo = client.get('/api/stats/stream', buffered=False)
+    assert (primero.status_code, segundo.status_code) == (200, 503)
+    assert segundo.headers['Retry-After'] == '5'
+    primero.close()
+    assert client.get('/api/stats/stream', buffered=False).status_code == 200
+
+
+def test_sin_suscriptores_no_consulta():
+    consultas = []
+    publisher = events.StatsPublisher(lambda: consultas.append(1) or {'total_leads': len(consultas)})
+    for _ in range(10):
+        publisher.publicar('lead', {})
+        cambios = db.CambiosStats()
+        cambios[('total', 'leads')] += 1
+        publisher.sumar(cambios)
+    assert consultas == [] and publisher.events == 0
+    sus = publisher.suscribir()
+    assert 'event: snapshot' in sus.siguiente(0) and consultas == [1]
+    publisher.close()
+
+
+def test_aplicar_cambios():
+    stats = {'total_leads': 2, 'total_appointments': 0, 'by_qualification': {'Alta': 1, 'Baja': 1},
+             'by_interest': {'Idiomas': 2}, 'by_day': {'2030-01-02': {'leads': 1, 'appointments': 0},
+                                                       '2030-01-01': {'leads': 1, 'appointments': 0}}}
+    cambios = Counter({('total', 'appointments'): 1, ('appointment_day', '2030-01-03'): 1,
+                       ('qualification', 'Baja'): -1, ('qualification', 'Alta'): 1,
+                       ('interest', 'Idiomas'): 0})
+    parche = events.aplicar_cambios(stats, cambios, max_days=2)
+    assert parche == {
+        'total_appointments': 1,
+        'by_qualification': {'Baja': 0, 'Alta': 2},
+        'by_day': {'2030-01-03': {'leads': 0, 'appointments': 1}, '2030-01-01': {'leads': 0, 'appointments': 0}}
+    }
+    assert stats['by_qualification'] == {'Alta': 2}
+    assert list(stats['by_day']) == ['2030-01-03', '2030-01-02']
+    # Un día anterior a la ventana no aparece
+    assert events.aplicar_cambios(stats, Counter({('lead_day', '2029-12-31'): 1}), max_days=2) == {}
+
+
+def test_escrituras_no_consultan_la_base(tmp_path):
+    for write_behind in (False, True):
+        app = crear(tmp_path / str(write_behind), DB_WRITE_BEHIND=write_behind)
+        client = app.test_client()
+        client.post('/api/lead', json=LEAD)
+        resp = client.get('/api/stats/stream', buffered=False)
+        fragmentos = iter(resp.response)
+        nombre, snapshot = leer_evento(fragmentos)
+        for n in range(5):
+            client.post('/api/lead', json=dict(LEAD, phone=f'31{n}', interest_text='python'))
+        client.post('/api/lead', json=dict(LEAD, interest_text='marketing'))
+        client.post('/api/leads/batch', json=[dict(LEAD, phone='1'), dict(LEAD, phone='1', interest_text='python')])
+        publisher = app.extensions['stats_stream']
+        assert publisher.queries == 1
+        # Sumando los parches al snapshot se llega a lo mismo que /api/stats
+        stats = client.get('/api/stats').get_json()
+        stats.pop('idempotency')
+        while snapshot != stats:
+            evento = leer_evento(fragmentos)
+            assert evento is not None
+            nombre, datos = evento
+            if nombre == 'stats':
+                for clave, valor in datos.items():
+                    if isinstance(valor, dict):
+                        for sub, n in valor.items():
+                            if n:
+                                snapshot[clave][sub] = n
+                            else:
+                                snapshot[clave].pop(sub, None)
+                    else:
+                        snapshot[clave] = valor
+        resp.close()
+        assert publisher.queries == 1
+
+
+def test_escritura_durante_el_snapshot_vuelve_a_consultar():
+    consultas = []
+    publisher = events.StatsPublisher(lambda: consultas.append(1) or {'total_leads': len(consultas)},
+                                      min_interval=0)
+    cambios = db.CambiosStats()
+    cambios[('total', 'leads')] += 1
+    sus = publisher.suscribir()
+    assert 'event: snapshot' in sus.siguiente(0)
+    # Empezó antes de la consulta y se confirmó después: el snapshot puede incluirla o no
+    publisher.sumar(cambios)
+    assert 'event: stats' in sus.siguiente(2) and consultas == [1, 1]
+
+    posterior = db.CambiosStats()
+    posterior[('total', 'leads')] += 1
+    publisher.sumar(posterior)
+    assert '"total_leads":3' in sus.siguiente(2) and len(consultas) == 2
+    publisher.close()
+
+
+def test_desactivado(tmp_path):
+    client = crear(tmp_path, STATS_STREAM_ENABLED=False).test_client()
+    assert client.get('/api/stats/stream').status_code == 404
+    assert client.post('/api/lead', json=LEAD).status_code == 200
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+
+import pytest
+from app import create_app, db
+from app import export
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'test.db')
+    conn = db.init_db(path)
+    ana = db.insert_lead(conn, {'name': 'Ana, "la del inglés"', 'phone': '300111', 'interest': 'Idiomas',
+                                'qualification': 'Alta', 'created_at': '2030-01-01T10:00:00'})
+    db.insert_lead(conn, {'name': 'Luis', 'phone': '300222', 'interest': 'Otros',
+                          'qualification': 'Baja', 'created_at': '2030-01-01T11:00:00'})
+    for fecha in ('2030-01-02', '2030-01-03'):
+        db.insert_appointment(conn, {'lead_id': ana, 'date': fecha, 'time': '10:00', 'status': 'Confirmada'})
+    conn.close()
+    return path
+
+
+def test_api_export_csv(db_path):
+    client = create_app({'TESTING': True, 'DATABASE': db_path}).test_client()
+    resp = client.get('/api/export?format=csv')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/csv'
+    assert resp.is_streamed
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert [(r['name'], r['appointment_date']) for r in rows] == [
+        ('Ana, "la del inglés"', '2030-01-02'), ('Ana, "la del inglés"', '2030-01-03'), ('Luis', '')
+    ]
+
+
+def test_api_export_ndjson(db_path, monkeypatch):
+    monkeypatch.setattr(export, 'CHUNK_ROWS', 1)
+    client = create_app({'TESTING': True, 'DATABASE': db_path}).test_client()
+    resp = client.get('/api/export?format=ndjson')
+    registros = [json.loads(linea) for linea in resp.get_data(as_text=True).splitlines()]
+    assert len(registros) == 3
+    luis = registros[2]
+    assert (luis['name'], luis['appointment_id'], luis['call_count']) == ('Luis', None, 1)
+    assert client.get('/api/export?format=xml').status_code == 400
+
+
+def test_cli_export(db_path, tmp_path):
+    salida = tmp_path / 'leads.ndjson'
+    export.main(['--format', 'ndjson', '--database', db_path, '--output', str(salida)])
+    lineas = salida.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(l)['lead_id'] for l in lineas] == [1, 1, 2]
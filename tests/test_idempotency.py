@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+from app import create_app
+
+LEAD = {'name': 'Ana Gómez', 'phone': '300 111 2233', 'interest_text': 'inglés', 'schedule': True}
+
+
+def crear(tmp_path, **config):
+    return create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), **config})
+
+
+def test_reintento_repite_respuesta_sin_insertar(tmp_path):
+    client = crear(tmp_path).test_client()
+    primera = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    segunda = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    assert primera.status_code == segunda.status_code == 200
+    assert 'Idempotent-Replayed' not in primera.headers
+    assert segunda.headers['Idempotent-Replayed'] == 'true'
+    assert segunda.get_json() == primera.get_json()
+
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_leads'], stats['total_appointments']) == (1, 1)
+    assert stats['idempotency'] == {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0, 'size': 1}
+
+
+def test_sin_clave_cada_post_agenda(tmp_path):
+    client = crear(tmp_path).test_client()
+    client.post('/api/lead', json=LEAD)
+    client.post('/api/lead', json=LEAD)
+    assert client.get('/api/stats').get_json()['total_appointments'] == 2
+
+
+def test_clave_con_otro_contenido(tmp_path):
+    client = crear(tmp_path).test_client()
+    client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    resp = client.post('/api/lead', json=dict(LEAD, schedule=False), headers={'Idempotency-Key': 'k1'})
+    assert resp.status_code == 422
+
+
+def test_clave_en_curso_y_demasiado_larga(tmp_path):
+    app = crear(tmp_path)
+    client = app.test_client()
+    app.extensions['idempotency'].reservar('k1')
+    assert client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'}).status_code == 409
+    assert client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'x' * 256}).status_code == 400
+
+
+def test_sobrevive_reinicio(tmp_path):
+    anterior = crear(tmp_path)
+    primera = anterior.test_client().post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    client = crear(tmp_path).test_client()
+    segunda = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    assert segunda.headers['Idempotent-Replayed'] == 'true'
+    assert segunda.get_json() == primera.get_json()
+    assert client.get('/api/stats').get_json()['total_appointments'] == 1
+
+
+def test_lru_expulsa_pero_la_tabla_conserva(tmp_path):
+    client = crear(tmp_path, IDEMPOTENCY_CACHE_SIZE=1).test_client()
+    client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    client.post('/api/lead', json=dict(LEAD, phone='300 999'), headers={'Idempotency-Key': 'k2'})
+    resp = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    assert resp.headers['Idempotent-Replayed'] == 'true'
+    stats = client.get('/api/stats').get_json()['idempotency']
+    assert (stats['hits'], stats['evictions'], stats['size']) == (1, 2, 1)
+
+
+def test_ttl_caducado(tmp_path):
+    client = crear(tmp_path, IDEMPOTENCY_TTL_SECONDS=0).test_client()
+    client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    resp = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    assert 'Idempotent-Replayed' not in resp.headers
+    stats = client.get('/api/stats').get_json()
+    assert stats['total_appointments'] == 2
+    assert stats['idempotency']['expirations'] == 1
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_metricas_y_write_behind(tmp_path, write_behind):
+    client = crear(tmp_path, DB_WRITE_BEHIND=write_behind).test_client()
+    for _ in range(3):
+        assert client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'}).status_code == 200
+    texto = client.get('/metrics').get_data(as_text=True)
+    assert 'idempotency_cache_hits_total 2' in texto
+    assert 'idempotency_cache_misses_total 1' in texto
+    assert client.get('/api/stats').get_json()['total_appointments'] == 1
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_clave_y_lead_en_la_misma_transaccion(tmp_path, write_behind):
+    app = crear(tmp_path, DB_WRITE_BEHIND=write_behind)
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    conn.execute("CREATE TRIGGER sin_claves BEFORE INSERT ON idempotency_keys "
+                 "BEGIN SELECT RAISE(ABORT, 'sin espacio'); END")
+    conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        app.test_client().post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    # Si la clave no se pudo guardar, el lead tampoco: el reintento lo insertará una sola vez
+    assert conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM appointments').fetchone()[0] == 0
+
+    conn.execute('DROP TRIGGER sin_claves')
+    conn.commit()
+    client = app.test_client()
+    primera = client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'})
+    assert conn.execute('SELECT body FROM idempotency_keys').fetchone()[0] == primera.get_data(as_text=True)
+    assert client.post('/api/lead', json=LEAD, headers={'Idempotency-Key': 'k1'}).get_json() == primera.get_json()
+    assert conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0] == 1
+    conn.close()
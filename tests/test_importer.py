@@ -0,0 +1,122 @@
+import io
+import json
+
+import pytest
+from app import db, importer
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 4096])
+def test_iter_json_array_por_fragmentos(chunk_size):
+    datos = [{'nombre': 'Ana', 'n': 12345}, 678, 'texto, con [corchetes]', [], {'anidado': {'a': [1, 2]}}]
+    texto = json.dumps(datos, indent=2, ensure_ascii=False)
+    assert list(importer.iter_json_array(io.StringIO(texto), chunk_size=chunk_size)) == datos
+    assert list(importer.iter_json_array(io.StringIO(' [ ] '), chunk_size=chunk_size)) == []
+
+
+def test_iter_json_array_invalido():
+    with pytest.raises(ValueError):
+        list(importer.iter_json_array(io.StringIO('{"a": 1}')))
+    with pytest.raises(ValueError):
+        list(importer.iter_json_array(io.StringIO('[{"a": 1}, {"b": 2}')))
+
+
+LEADS = [
+    {'nombre': 'Ana Pérez', 'telefono': '3001112233', 'interes': 'Idiomas', 'calificacion': 'Alta',
+     'fecha': '2024-05-01 10:30:00', 'cita_agendada': True},
+    {'nombre': 'Luis Gil', 'telefono': '3004445566', 'interes': 'Desarrollo Personal', 'calificacion': 'Baja',
+     'fecha': '2024-05-01 11:00:00', 'cita_agendada': False},
+    {'nombre': 'Sin Teléfono', 'telefono': '', 'interes': 'Otros', 'calificacion': 'Baja',
+     'fecha': '2024-05-01 12:00:00', 'cita_agendada': False},
+]
+CITAS = [
+    {'nombre': 'Ana Pérez', 'telefono': '3001112233', 'fecha_cita': '2024-05-02', 'hora': '10:00 AM',
+     'tipo': 'Idiomas', 'estado': 'Confirmada', 'fecha_agendamiento': '2024-05-01 10:32:00'},
+    {'nombre': 'Eva Ruiz', 'telefono': '3007778899', 'fecha_cita': '2024-05-03', 'hora': '02:30 PM',
+     'tipo': 'Negocios', 'estado': 'Confirmada', 'fecha_agendamiento': '2024-05-02 09:00:00'},
+]
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    (tmp_path / 'leads.json').write_text(json.dumps(LEADS, ensure_ascii=False, indent=2), encoding='utf-8')
+    (tmp_path / 'citas.json').write_text(json.dumps(CITAS, ensure_ascii=False, indent=2), encoding='utf-8')
+    return tmp_path
+
+
+def test_importar_directorio_mapea_y_enlaza(directorio):
+    conn = db.init_db(str(directorio / 'data.db'))
+    resultados = importer.importar_directorio(conn, str(directorio), batch_size=2)
+    assert resultados['leads.json'] == {'leads': 2, 'citas': 0, 'omitidos': 1, 'ya_importados': 0}
+    assert resultados['citas.json'] == {'leads': 0, 'citas': 2, 'omitidos': 0, 'ya_importados': 0}
+
+    ana = db.find_lead_by_phone(conn, '3001112233')
+    assert (ana['name'], ana['interest'], ana['created_at']) == ('Ana Pérez', 'Idiomas', '2024-05-01T10:30:00')
+    assert db.find_lead_by_phone(conn, '3004445566')['interest'] == 'Desarrollo personal'
+    cita, = db.get_appointments_for_lead(conn, ana['id'])
+    assert (cita['date'], cita['time'], cita['created_at']) == ('2024-05-02', '10:00', '2024-05-01T10:32:00')
+
+    eva = db.find_lead_by_phone(conn, '3007778899')
+    assert (eva['name'], eva['qualification']) == ('Eva Ruiz', 'Media')
+    assert db.get_appointments_for_lead(conn, eva['id'])[0]['time'] == '14:30'
+
+
+def test_importar_es_idempotente_y_reanudable(directorio):
+    conn = db.init_db(str(directorio / 'data.db'))
+    importer.importar_directorio(conn, str(directorio))
+    antes = db.get_stats(conn)
+
+    # Repetir no cambia nada
+    resultados = importer.importar_directorio(conn, str(directorio))
+    assert resultados['leads.json']['ya_importados'] == 3
+    assert db.get_stats(conn) == antes
+    assert db.find_lead_by_phone(conn, '3001112233')['call_count'] == 1
+
+    # Si el escritorio agrega registros, sólo se importan los nuevos
+    nuevos = LEADS + [{'nombre': 'Ana Pérez', 'telefono': '3001112233', 'interes': 'Tecnologia',
+                       'calificacion': 'Alta', 'fecha': '2024-06-01 09:00:00'}]
+    (directorio / 'leads.json').write_text(json.dumps(nuevos), encoding='utf-8')
+    resultados = importer.importar_directorio(conn, str(directorio))
+    assert resultados['leads.json']['leads'] == 1
+    ana = db.find_lead_by_phone(conn, '3001112233')
+    assert (ana['interest'], ana['call_count']) == ('Tecnologia', 2)
+
+
+def test_importar_retoma_tras_fallo(directorio, monkeypatch):
+    conn = db.init_db(str(directorio / 'data.db'))
+    original = importer._importar_lead
+    llamadas = []
+
+    def fallar_en_el_tercero(conn, item, resumen):
+        llamadas.append(item)
+        if len(llamadas) == 3:
+            raise RuntimeError('corte')
+        original(conn, item, resumen)
+
+    monkeypatch.setattr(importer, '_importar_lead', fallar_en_el_tercero)
+    with pytest.raises(RuntimeError):
+        importer.importar_archivo(conn, str(directorio / 'leads.json'), 'leads', batch_size=2)
+    conn.rollback()
+    monkeypatch.setattr(importer, '_importar_lead', original)
+
+    resumen = importer.importar_archivo(conn, str(directorio / 'leads.json'), 'leads', batch_size=2)
+    assert resumen['ya_importados'] == 2
+    assert db.get_stats(conn)['total_leads'] == 2
+
+
+def test_importar_diario_jsonl(tmp_path):
+    (tmp_path / 'leads.jsonl').write_text(
+        ''.join(json.dumps(l, ensure_ascii=False) + '\n' for l in LEADS[:2]), encoding='utf-8')
+    conn = db.init_db(str(tmp_path / 'data.db'))
+    assert importer.importar_directorio(conn, str(tmp_path))['leads.jsonl']['leads'] == 2
+
+    # El diario siguió creciendo: sólo se importa lo nuevo
+    with open(tmp_path / 'leads.jsonl', 'a', encoding='utf-8') as f:
+        f.write(json.dumps(dict(LEADS[0], telefono='3009990000'), ensure_ascii=False) + '\n')
+    resumen = importer.importar_directorio(conn, str(tmp_path))['leads.jsonl']
+    assert (resumen['leads'], resumen['ya_importados']) == (1, 2)
+    conn.close()
+
+
+def test_main_sin_archivos(tmp_path, capsys):
+    importer.main(['--dir', str(tmp_path), '--database', str(tmp_path / 'data.db')])
+    assert 'No se encontraron' in capsys.readouterr().out
@@ -0,0 +1,62 @@
+import json
+import os
+
+from app.journal import Journal, iter_jsonl
+
+LEAD = {'nombre': 'Ana Pérez', 'telefono': '3001112233', 'interes': 'Idiomas', 'calificacion': 'Alta',
+        'fecha': '2024-05-01 10:30:00', 'cita_agendada': True}
+
+
+def test_agregar_anexa_una_linea(tmp_path):
+    diario = Journal(tmp_path / 'leads.jsonl')
+    diario.agregar(LEAD)
+    antes = (tmp_path / 'leads.jsonl').read_bytes()
+    diario.agregar(dict(LEAD, nombre='Luis'))
+    diario.cerrar()
+    contenido = (tmp_path / 'leads.jsonl').read_bytes()
+    # Lo ya escrito no se toca: guardar sólo añade al final
+    assert contenido.startswith(antes)
+    assert contenido.count(b'\n') == 2
+    assert [r['nombre'] for r in Journal(tmp_path / 'leads.jsonl').cargar()] == ['Ana Pérez', 'Luis']
+
+
+def test_cola_cortada_se_descarta_y_trunca(tmp_path):
+    path = tmp_path / 'leads.jsonl'
+    linea = json.dumps(LEAD, ensure_ascii=False) + '\n'
+    path.write_text(linea * 2 + linea[:15], encoding='utf-8')
+    diario = Journal(path)
+    assert len(list(diario.cargar())) == 2
+    assert diario.cola_descartada
+    assert path.read_text(encoding='utf-8') == linea * 2
+
+    # Tras la reparación se puede seguir anexando
+    diario.agregar(LEAD)
+    diario.cerrar()
+    assert len(list(Journal(path).cargar())) == 3
+
+
+def test_lineas_danadas_y_compactacion(tmp_path):
+    path = tmp_path / 'citas.jsonl'
+    path.write_text('{"a": 1}\nbasura\n\n{"a": 2}\n', encoding='utf-8')
+    diario = Journal(path)
+    registros = list(diario.cargar())
+    assert registros == [{'a': 1}, {'a': 2}]
+    assert (diario.lineas_invalidas, diario.cola_descartada) == (1, False)
+
+    diario.compactar(registros)
+    assert path.read_text(encoding='utf-8') == '{"a": 1}\n{"a": 2}\n'
+    assert not os.path.exists(str(path) + '.tmp')
+    assert diario.registros == 2
+
+
+def test_sin_archivo(tmp_path):
+    diario = Journal(tmp_path / 'no_existe.jsonl')
+    assert list(diario.cargar()) == []
+    assert not diario.existe()
+
+
+def test_iter_jsonl(tmp_path):
+    path = tmp_path / 'x.jsonl'
+    path.write_bytes(b'{"a": 1}\nmal\n{"a": 2}\n{"a": ')
+    with open(path, 'rb') as f:
+        assert list(iter_jsonl(f)) == [{'a': 1}, {'a': 2}]
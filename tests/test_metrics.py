@@ -0,0 +1,63 @@
+import pytest
+from app import create_app
+from app.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_cubetas():
+    hist = Histogram(buckets=(0.01, 0.1))
+    for valor in (0.005, 0.01, 0.05, 3.0):
+        hist.observe(valor)
+    counts, total, count = hist.snapshot()
+    assert counts == [2, 1, 1]
+    assert count == 4
+    assert total == pytest.approx(3.065)
+
+
+def test_registry_render_formato_prometheus():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.request_started()
+    registry.request_finished('POST', '/api/lead', 200, 0.05)
+    registry.request_started()
+    registry.request_finished('POST', '/api/lead', 500, 2.0)
+    registry.observe_stage('commit', 0.002)
+    texto = registry.render()
+    assert 'http_requests_total{method="POST",route="/api/lead",status="200"} 1' in texto
+    assert 'http_request_errors_total{method="POST",route="/api/lead"} 1' in texto
+    assert 'http_requests_in_flight 0' in texto
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/lead",le="0.1"} 1' in texto
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/lead",le="+Inf"} 2' in texto
+    assert 'lead_stage_duration_seconds_count{stage="commit"} 1' in texto
+
+
+@pytest.mark.parametrize('write_behind, etapas', [
+    (False, ['crear_lead_payload', 'insert_lead', 'insert_appointment', 'commit']),
+    (True, ['crear_lead_payload', 'write_behind_wait', 'insert_lead', 'insert_appointment', 'group_commit']),
+])
+def test_endpoint_metrics(tmp_path, write_behind, etapas):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'DB_WRITE_BEHIND': write_behind,
+                      'PROPAGATE_EXCEPTIONS': False})
+
+    @app.route('/falla')
+    def falla():
+        raise RuntimeError('falla')
+
+    client = app.test_client()
+    client.post('/api/lead', json={'name': 'Ana', 'phone': '300111', 'interest_text': 'python', 'schedule': True})
+    client.post('/api/lead', json={'name': 'Ana'})
+    assert client.get('/falla').status_code == 500
+    texto = client.get('/metrics').get_data(as_text=True)
+
+    assert 'http_requests_total{method="POST",route="/api/lead",status="200"} 1' in texto
+    assert 'http_requests_total{method="POST",route="/api/lead",status="400"} 1' in texto
+    assert 'http_request_errors_total{method="GET",route="/falla"} 1' in texto
+    # La propia petición a /metrics está en curso mientras se genera el texto
+    assert 'http_requests_in_flight 1' in texto
+    for etapa in etapas:
+        assert f'lead_stage_duration_seconds_count{{stage="{etapa}"}} 1' in texto
+
+
+def test_metrics_desactivadas(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'METRICS_ENABLED': False})
+    client = app.test_client()
+    assert client.post('/api/lead', json={'name': 'Ana', 'phone': '300111'}).status_code == 200
+    assert client.get('/metrics').status_code == 404
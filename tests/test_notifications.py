@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app import create_app
+from app import db as db_module
+from app import notifications
+
+LEAD = {'name': 'Ana Gómez', 'phone': '300 111 2233', 'interest_text': 'inglés', 'schedule': True}
+
+
+def crear(tmp_path, **config):
+    return create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), **config})
+
+
+def filas_outbox(db_path):
+    conn = db_module.get_connection(db_path)
+    try:
+        return [dict(r) for r in conn.execute('SELECT * FROM outbox ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def dispatcher(db_path, gateway, **kwargs):
+    kwargs.setdefault('backoff_seconds', 0)
+    return notifications.Dispatcher(db_path, gateway, **kwargs)
+
+
+def test_cita_encola_confirmacion_en_la_misma_transaccion(tmp_path):
+    client = crear(tmp_path, NOTIFY_DISPATCHER=False).test_client()
+    cita = client.post('/api/lead', json=LEAD).get_json()['appointment']
+    client.post('/api/lead', json=dict(LEAD, schedule=False))
+
+    (fila,) = filas_outbox(str(tmp_path / 'test.db'))
+    assert (fila['appointment_id'], fila['channel'], fila['recipient'], fila['status']) == \
+        (cita['id'], 'whatsapp', '3001112233', 'pending')
+    assert cita['date'] in fila['body'] and cita['time'] in fila['body']
+
+
+def test_cita_sin_guardar_no_deja_mensaje(tmp_path):
+    conn = db_module.init_db(str(tmp_path / 'test.db'))
+    aviso = {'channel': 'sms', 'recipient': '3001112233', 'body': 'hola'}
+    cita = {'lead_id': None, 'date': '2030-01-07', 'time': '09:00', 'type': 'Inglés', 'status': 'Confirmada',
+            'created_at': '2030-01-01T00:00:00', 'notification': aviso}
+    db_module.insert_appointment(conn, cita, commit=False)
+    conn.rollback()
+    db_module.insert_appointment(conn, cita, capacity=1)
+    with pytest.raises(db_module.SlotUnavailableError):
+        db_module.insert_appointment(conn, cita, capacity=1)
+    conn.commit()
+    assert conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0] == 1
+    conn.close()
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_lote_y_escritura_diferida_encolan(tmp_path, write_behind):
+    client = crear(tmp_path, NOTIFY_DISPATCHER=False, DB_WRITE_BEHIND=write_behind).test_client()
+    client.post('/api/lead', json=LEAD)
+    client.post('/api/leads/batch', json=[LEAD, dict(LEAD, schedule=False), dict(LEAD, phone='311 000 0000')])
+    destinatarios = [f['recipient'] for f in filas_outbox(str(tmp_path / 'test.db'))]
+    assert destinatarios == ['3001112233', '3001112233', '3110000000']
+
+
+def test_despachador_envia_en_lotes(tmp_path):
+    app = crear(tmp_path, NOTIFY_DISPATCHER=False)
+    client = app.test_client()
+    client.post('/api/leads/batch', json=[LEAD] * 5)
+
+    gateway = notifications.StubGateway()
+    d = dispatcher(app.config['DATABASE'], gateway, batch_size=2)
+    assert [d.procesar_lote() for _ in range(4)] == [2, 2, 1, 0]
+    assert len(gateway.enviados) == 5
+    assert (d.sent, d.batches) == (5, 3)
+    assert {f['status'] for f in filas_outbox(app.config['DATABASE'])} == {'sent'}
+    d.close()
+
+
+def test_reintenta_y_marca_fallido(tmp_path):
+    app = crear(tmp_path, NOTIFY_DISPATCHER=False)
+    app.test_client().post('/api/lead', json=LEAD)
+    gateway = notifications.StubGateway()
+    gateway.fallos = ['timeout'] * 3
+    d = dispatcher(app.config['DATABASE'], gateway, max_attempts=3)
+
+    for _ in range(3):
+        assert d.procesar_lote() == 1
+    (fila,) = filas_outbox(app.config['DATABASE'])
+    assert (fila['status'], fila['attempts'], fila['last_error']) == ('failed', 3, 'timeout')
+    assert (d.retried, d.failed, d.sent) == (2, 1, 0)
+    assert d.procesar_lote() == 0
+    d.close()
+
+
+def test_reintento_respeta_la_espera(tmp_path):
+    app = crear(tmp_path, NOTIFY_DISPATCHER=False)
+    app.test_client().post('/api/lead', json=LEAD)
+    gateway = notifications.StubGateway()
+    gateway.fallos = ['caída']
+    d = dispatcher(app.config['DATABASE'], gateway, backoff_seconds=60)
+    assert d.procesar_lote() == 1
+    # El mensaje no vuelve a estar disponible hasta que vence la espera
+    assert d.procesar_lote() == 0
+    assert 48 <= d.espera_reintento(1) <= 72
+    assert d.espera_reintento(20) <= d.backoff_max_seconds * 1.2
+    d.close()
+
+
+def test_excepcion_de_la_pasarela_reintenta_el_lote(tmp_path):
+    class Caida(notifications.Gateway):
+        def send_batch(self, mensajes):
+            raise ConnectionError('sin red')
+
+    app = crear(tmp_path, NOTIFY_DISPATCHER=False)
+    app.test_client().post('/api/leads/batch', json=[LEAD] * 2)
+    d = dispatcher(app.config['DATABASE'], Caida())
+    assert d.procesar_lote() == 2
+    assert d.retried == 2
+    assert {f['last_error'] for f in filas_outbox(app.config['DATABASE'])} == {'ConnectionError: sin red'}
+    d.close()
+
+
+def test_http_gateway(tmp_path):
+    recibidos = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            datos = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            recibidos.append((self.headers.get('Authorization'), datos))
+            resultados = [{'id': m['id'], 'error': 'número inválido' if m['recipient'] == '1' else None}
+                          for m in datos['messages']]
+            cuerpo = json.dumps({'results': resultados}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = HTTPServer(('127.0.0.1', 0), Handler)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        gateway = notifications.HttpGateway(f'http://127.0.0.1:{servidor.server_port}/enviar', token='secreto')
+        mensajes = [{'id': 1, 'channel': 'sms', 'recipient': '300', 'body': 'a'},
+                    {'id': 2, 'channel': 'sms', 'recipient': '1', 'body': 'b'}]
+        assert gateway.send_batch(mensajes) == [None, 'número inválido']
+        assert recibidos[0][0] == 'Bearer secreto'
+        assert [m['id'] for m in recibidos[0][1]['messages']] == [1, 2]
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_pasarela_lenta_no_frena_api_lead(tmp_path, monkeypatch):
+    lenta = notifications.StubGateway(latencia=0.5)
+    monkeypatch.setattr(notifications, 'crear_gateway', lambda config: lenta)
+    app = crear(tmp_path, NOTIFY_GATEWAY='stub', NOTIFY_POLL_SECONDS=0.05)
+    client = app.test_client()
+
+    t0 = time.perf_counter()
+    for _ in range(3):
+        assert client.post('/api/lead', json=LEAD).status_code == 200
+    assert time.perf_counter() - t0 < 0.5
+
+    despachador = app.extensions['notifier']
+    limite = time.time() + 5
+    while despachador.sent < 3 and time.time() < limite:
+        time.sleep(0.05)
+    assert len(lenta.enviados) == 3
+    assert 'outbox_deliveries_total{result="sent"} 3' in client.get('/metrics').get_data(as_text=True)
+    despachador.close()
+
+
+def test_desactivado_no_encola(tmp_path):
+    app = crear(tmp_path, NOTIFY_ENABLED=False)
+    app.test_client().post('/api/lead', json=LEAD)
+    assert 'notifier' not in app.extensions
+    assert filas_outbox(app.config['DATABASE']) == []
+
+
+def test_consulta_de_pendientes_usa_indice_parcial(tmp_path):
+    conn = db_module.init_db(str(tmp_path / 'test.db'))
+    plan = ' '.join(r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + db_module.SQL_OUTBOX_DUE, (0,)))
+    assert 'idx_outbox_pending' in plan
+    conn.close()
+
+
+def test_sin_pasarela_los_mensajes_quedan_pendientes(tmp_path):
+    app = crear(tmp_path)
+    app.test_client().post('/api/lead', json=LEAD)
+    assert 'notifier' not in app.extensions
+    assert [fila['status'] for fila in filas_outbox(app.config['DATABASE'])] == ['pending']
+    with pytest.raises(SystemExit):
+        notifications.main(['--database', app.config['DATABASE']])
+
+
+def test_stub_conserva_solo_los_ultimos_envios():
+    gateway = notifications.StubGateway(max_enviados=2)
+    assert gateway.send_batch([{'id': i} for i in range(5)]) == [None] * 5
+    assert [m['id'] for m in gateway.enviados] == [3, 4]
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from app import create_app, profiling
+
+
+def _app(tmp_path, **config):
+    return create_app(dict({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'PROFILE_ENABLED': True,
+                            'PROFILE_DIR': str(tmp_path / 'profiles')}, **config))
+
+
+def _perfiles(app):
+    app.extensions['profiling'].esperar()
+    return profiling.listar_perfiles(app.config['PROFILE_DIR'])
+
+
+def test_perfilado_por_muestreo_y_rotacion(tmp_path):
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=2, PROFILE_MAX_FILES=3)
+    client = app.test_client()
+    for i in range(10):
+        client.post('/api/lead', json={'name': 'Ana', 'phone': f'300{i}', 'interest_text': 'python'})
+    perfiles = _perfiles(app)
+    archivos = sorted(os.listdir(tmp_path / 'profiles'))
+    assert len([a for a in archivos if a.endswith('.prof')]) == 3
+    assert len([a for a in archivos if a.endswith('.json')]) == 3
+
+    assert client.get('/debug/profiles').get_json()['profiles'] == perfiles
+    assert [p['elapsed_ms'] for p in perfiles] == sorted((p['elapsed_ms'] for p in perfiles), reverse=True)
+    assert perfiles[0]['route'] == '/api/lead'
+    assert (perfiles[0]['reason'], perfiles[0]['kind']) == ('sample', 'cprofile')
+    assert any('api_lead' in f['function'] for f in perfiles[0]['top_functions'])
+    assert 'profiles_saved_total 5' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_perfilado_por_umbral_sin_muestreo(tmp_path):
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=0, PROFILE_THRESHOLD_MS=10_000)
+    app.test_client().get('/api/stats')
+    assert _perfiles(app) == []
+
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=0, PROFILE_THRESHOLD_MS=30, PROFILE_STACK_INTERVAL_MS=1)
+
+    @app.route('/lenta')
+    def lenta():
+        fin = time.perf_counter() + 0.05
+        while time.perf_counter() < fin:
+            pass
+        return 'ok'
+
+    client = app.test_client()
+    client.get('/api/stats')
+    client.get('/lenta')
+    perfil, = _perfiles(app)
+    assert (perfil['route'], perfil['reason'], perfil['kind']) == ('/lenta', 'threshold', 'stacks')
+    assert perfil['elapsed_ms'] >= 30 and perfil['samples'] > 0
+    assert perfil['top_functions'][0]['samples'] == perfil['samples']
+    with open(tmp_path / 'profiles' / perfil['profile'], encoding='utf-8') as f:
+        pila, n = f.readline().rsplit(' ', 1)
+    assert int(n) > 0 and 'lenta' in pila
+
+
+def test_umbral_o_muestreo(tmp_path):
+    # Las muestreadas se guardan aunque no lleguen al umbral, y las lentas aunque no sean muestra
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=3, PROFILE_THRESHOLD_MS=0.001)
+    client = app.test_client()
+    for _ in range(6):
+        client.get('/api/stats')
+    perfiles = _perfiles(app)
+    assert len(perfiles) == 6
+    assert sorted(p['kind'] for p in perfiles) == ['cprofile'] * 2 + ['stacks'] * 4
+    assert {p['reason'] for p in perfiles} == {'threshold'}
+
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=1, PROFILE_THRESHOLD_MS=10_000,
+               PROFILE_DIR=str(tmp_path / 'muestras'))
+    app.test_client().get('/api/stats')
+    perfil, = _perfiles(app)
+    assert perfil['reason'] == 'sample'
+
+
+def test_otra_peticion_perfilandose_guarda_las_pilas(tmp_path):
+    app = _app(tmp_path, PROFILE_SAMPLE_RATE=1)
+    client = app.test_client()
+    assert profiling._PERFILANDO.acquire(blocking=False)
+    try:
+        assert client.get('/api/stats').status_code == 200
+    finally:
+        profiling._PERFILANDO.release()
+    perfil, = _perfiles(app)
+    assert (perfil['reason'], perfil['kind']) == ('sample', 'stacks')
+
+    client.get('/api/stats')
+    assert [p['kind'] for p in _perfiles(app)].count('cprofile') == 1
+    assert not profiling._PERFILANDO.locked()
+
+
+def test_escritor_cuenta_los_descartes(tmp_path):
+    escritor = profiling.EscritorPerfiles(max_pendientes=1)
+    bloqueo = threading.Event()
+    assert escritor.encolar(bloqueo.wait)
+    time.sleep(0.05)
+    assert escritor.encolar(lambda: None)
+    assert not escritor.encolar(lambda: None)
+    bloqueo.set()
+    escritor.esperar()
+    assert (escritor.saved, escritor.dropped) == (2, 1)
+    assert 'profiles_dropped_total 1' in escritor.render_metrics()
+    escritor.close()
+
+
+def test_perfilado_desactivado_por_defecto(tmp_path, monkeypatch):
+    monkeypatch.delenv('ASISTENTE_PROFILE', raising=False)
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db')})
+    assert app.test_client().get('/debug/profiles').status_code == 404
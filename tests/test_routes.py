@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from app import create_app
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db')})
+    return app.test_client()
+
+
+def test_api_lead_y_stats(client):
+    resp = client.post('/api/lead', json={'name': 'Ana Gómez', 'phone': '573001112233',
+                                          'interest_text': 'quiero aprender inglés', 'schedule': True})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['interest'] == 'Idiomas'
+    assert body['qualification'] == 'Alta'
+    # Primer turno del horario por defecto
+    assert body['appointment']['time'] == '09:00'
+
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_leads'], stats['total_appointments']) == (1, 1)
+    assert stats['by_qualification'] == {'Alta': 1}
+    assert stats['by_interest'] == {'Idiomas': 1}
+
+
+def test_api_lead_faltan_campos(client):
+    resp = client.post('/api/lead', json={'name': 'Ana'})
+    assert resp.status_code == 400
+
+
+def test_api_leads_batch(client):
+    resp = client.post('/api/leads/batch', json=[
+        {'name': 'Ana', 'phone': '573001112233', 'interest_text': 'python', 'schedule': True},
+        {'name': 'Luis'},
+        {'name': 'Eva', 'phone': '573004445566', 'interest_text': 'marketing'},
+        'no es un objeto',
+        {'name': 'Raúl', 'phone': '573007778899', 'interest_text': 'liderazgo', 'schedule': True},
+    ])
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['created'] == 3
+    assert body['errors'] == 2
+
+    ana, luis, eva, invalido, raul = body['results']
+    assert [r['index'] for r in body['results']] == [0, 1, 2, 3, 4]
+    assert 'error' in luis and 'error' in invalido
+    assert ana['interest'] == 'Tecnologia' and 'appointment' in ana
+    assert eva['qualification'] == 'Media' and 'appointment' not in eva
+    assert raul['interest'] == 'Desarrollo personal'
+    assert len({ana['lead_id'], eva['lead_id'], raul['lead_id']}) == 3
+    assert ana['appointment']['id'] != raul['appointment']['id']
+    assert set(ana['appointment']) == {'id', 'date', 'time'}
+
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_leads'], stats['total_appointments']) == (3, 2)
+    assert stats['by_qualification'] == {'Alta': 1, 'Media': 1, 'Baja': 1}
+
+
+def test_api_leads_batch_requiere_arreglo(client):
+    assert client.post('/api/leads/batch', json={'name': 'Ana'}).status_code == 400
+
+
+def test_api_leads_batch_limite(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'BATCH_MAX_ITEMS': 2})
+    resp = app.test_client().post('/api/leads/batch', json=[{'name': 'a', 'phone': '1'}] * 3)
+    assert resp.status_code == 413
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_api_lead_concurrente_sin_errores_ni_perdidas(tmp_path, write_behind):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'DB_POOL_SIZE': 4,
+                      'DB_WRITE_BEHIND': write_behind})
+    hilos, por_hilo = 8, 25
+
+    def enviar(n):
+        client = app.test_client()
+        codigos = []
+        for i in range(por_hilo):
+            resp = client.post('/api/lead', json={'name': f'Cliente {n}-{i}', 'phone': f'57300{n:03d}{i:04d}',
+                                                  'interest_text': 'python', 'schedule': i % 2 == 0})
+            codigos.append(resp.status_code)
+        return codigos
+
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        resultados = list(executor.map(enviar, range(hilos)))
+
+    assert all(codigo == 200 for codigos in resultados for codigo in codigos)
+    stats = app.test_client().get('/api/stats').get_json()
+    assert stats['total_leads'] == hilos * por_hilo
+    assert stats['total_appointments'] == hilos * ((por_hilo + 1) // 2)
+
+
+def test_api_lead_write_behind(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'DB_WRITE_BEHIND': True})
+    client = app.test_client()
+    body = client.post('/api/lead', json={'name': 'Ana', 'phone': '573001112233',
+                                          'interest_text': 'inglés', 'schedule': True}).get_json()
+    assert body['lead_id'] and body['appointment']['id']
+    app.extensions['db_writer'].close()
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_leads'], stats['total_appointments']) == (1, 1)
+
+
+def test_api_lead_llamante_repetido_reutiliza_lead(client):
+    primero = client.post('/api/lead', json={'name': 'Ana', 'phone': '+57 300 111 2233', 'interest_text': 'ventas'})
+    segundo = client.post('/api/lead', json={'name': 'Ana', 'phone': '573001112233', 'interest_text': 'inglés'})
+    assert primero.get_json()['lead_id'] == segundo.get_json()['lead_id']
+    stats = client.get('/api/stats').get_json()
+    assert stats['total_leads'] == 1
+    assert stats['by_interest'] == {'Idiomas': 1}
+
+
+def test_api_lead_telefono_sin_digitos(client):
+    assert client.post('/api/lead', json={'name': 'Ana', 'phone': 'no tengo'}).status_code == 400
+
+
+def _cargar_leads(client, n):
+    intereses = ['inglés', 'python', 'marketing', 'liderazgo', 'horarios']
+    for i in range(n):
+        client.post('/api/lead', json={'name': f'Cliente {i}', 'phone': f'57300{i:07d}',
+                                       'interest_text': intereses[i % 5], 'schedule': i % 2 == 0})
+
+
+def test_api_leads_paginacion_por_cursor(client):
+    _cargar_leads(client, 12)
+    vistos = []
+    cursor = ''
+    while True:
+        body = client.get(f'/api/leads?limit=5&cursor={cursor}').get_json()
+        vistos.extend(item['id'] for item in body['items'])
+        if body['next_cursor'] is None:
+            break
+        cursor = body['next_cursor']
+    assert vistos == sorted(vistos, reverse=True)
+    assert len(vistos) == len(set(vistos)) == 12
+
+
+def test_api_leads_filtros(client):
+    _cargar_leads(client, 10)
+    body = client.get('/api/leads?interest=Idiomas').get_json()
+    assert [item['name'] for item in body['items']] == ['Cliente 5', 'Cliente 0']
+    body = client.get('/api/leads?qualification=Alta&limit=3').get_json()
+    assert len(body['items']) == 3 and body['next_cursor'] is not None
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    assert len(client.get(f'/api/leads?from={hoy}&to={hoy}').get_json()['items']) == 10
+    assert client.get('/api/leads?to=2000-01-01').get_json() == {'items': [], 'next_cursor': None}
+    assert client.get('/api/leads?from=ayer').status_code == 400
+    assert client.get('/api/leads?limit=0').status_code == 400
+
+
+def test_api_appointments(client):
+    _cargar_leads(client, 10)
+    body = client.get('/api/appointments?limit=2').get_json()
+    assert len(body['items']) == 2
+    assert body['items'][0]['lead_name'] == 'Cliente 8'
+    siguiente = client.get(f"/api/appointments?cursor={body['next_cursor']}").get_json()
+    assert len(siguiente['items']) == 3
+    body = client.get('/api/appointments?qualification=Baja').get_json()
+    assert [item['lead_name'] for item in body['items']] == ['Cliente 8', 'Cliente 4']
+    body = client.get('/api/appointments?interest=Tecnologia').get_json()
+    assert [item['type'] for item in body['items']] == ['Tecnologia']
+
+
+def test_arranque_eager_y_sondas(tmp_path):
+    db_path = tmp_path / 'test.db'
+    app = create_app({'TESTING': True, 'DATABASE': str(db_path)})
+    # La base y el pool existen antes de la primera petición
+    assert db_path.exists()
+    assert 'db_pool' in app.extensions
+
+    client = app.test_client()
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+    body = client.get('/readyz').get_json()
+    assert body['status'] == 'ready'
+    assert body['startup_seconds'] >= 0
+    assert 'app_startup_seconds' in client.get('/metrics').get_data(as_text=True)
+
+    app.extensions['ready'] = False
+    assert client.get('/readyz').status_code == 503
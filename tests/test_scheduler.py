@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from app import create_app, db
+from app.scheduler import HORARIO_POR_DEFECTO, HorarioAtencion, SinCuposError, SlotScheduler
+
+# Viernes al mediodía: el día siguiente es sábado (09:00-13:00) y luego lunes
+VIERNES = datetime(2026, 10, 16, 12, 0)
+
+
+def crear_scheduler(capacidad=1, ocupados=None, **kwargs):
+    ocupados = {} if ocupados is None else ocupados
+    cargas = []
+
+    def cargar_dia(conn, fecha):
+        cargas.append(fecha)
+        return dict(ocupados.get(fecha, {}))
+
+    scheduler = SlotScheduler(HorarioAtencion(HORARIO_POR_DEFECTO, 30), capacidad, cargar_dia, **kwargs)
+    return scheduler, cargas
+
+
+def test_horario_turnos_por_dia():
+    horario = HorarioAtencion(HORARIO_POR_DEFECTO, 30)
+    assert len(horario.turnos(datetime(2026, 10, 12).date())) == 18
+    assert horario.turnos(datetime(2026, 10, 17).date())[-1] == '12:30'
+    assert horario.turnos(datetime(2026, 10, 18).date()) == ()
+    assert horario.primer_turno(datetime(2026, 10, 18).date()) == ('2026-10-19', '09:00')
+
+
+def test_reservar_llena_turnos_en_orden():
+    scheduler, cargas = crear_scheduler(capacidad=2, ocupados={'2026-10-17': {'09:00': 1}})
+    reservas = [scheduler.reservar(ahora=VIERNES) for _ in range(4)]
+    assert reservas == [('2026-10-17', '09:00'), ('2026-10-17', '09:30'),
+                        ('2026-10-17', '09:30'), ('2026-10-17', '10:00')]
+    # Cada día se lee de la base una sola vez
+    assert cargas == ['2026-10-17']
+
+
+def test_reservar_salta_dias_llenos_y_domingo():
+    scheduler, _ = crear_scheduler()
+    sabado = [scheduler.reservar(ahora=VIERNES) for _ in range(8)]
+    assert {fecha for fecha, _ in sabado} == {'2026-10-17'}
+    assert scheduler.reservar(ahora=VIERNES) == ('2026-10-19', '09:00')
+
+
+def test_reservar_hoy_solo_turnos_futuros():
+    scheduler, _ = crear_scheduler(dias_minimos=0)
+    assert scheduler.reservar(ahora=VIERNES) == ('2026-10-16', '12:30')
+
+
+def test_sin_cupos_en_el_horizonte():
+    scheduler, _ = crear_scheduler(dias_maximos=1)
+    for _ in range(8):
+        scheduler.reservar(ahora=VIERNES)
+    with pytest.raises(SinCuposError):
+        scheduler.reservar(ahora=VIERNES)
+
+
+def test_liberar_y_confirmar():
+    scheduler, _ = crear_scheduler()
+    fecha, hora = scheduler.reservar(ahora=VIERNES)
+    scheduler.liberar(fecha, hora)
+    assert scheduler.reservar(ahora=VIERNES) == (fecha, hora)
+    scheduler.confirmar(fecha, hora)
+    # Una cita ya confirmada no se libera
+    scheduler.liberar(fecha, hora)
+    assert scheduler.reservar(ahora=VIERNES) == (fecha, '09:30')
+
+
+def test_refrescar_conserva_reservas_pendientes():
+    ocupados = {}
+    scheduler, _ = crear_scheduler(ocupados=ocupados)
+    scheduler.reservar(ahora=VIERNES)  # 09:00 pendiente
+    # Otra instancia ocupó 09:30 en la base
+    ocupados['2026-10-17'] = {'09:30': 1}
+    scheduler.refrescar(None, '2026-10-17')
+    assert scheduler.ocupacion('2026-10-17')['09:00'] == 1
+    assert scheduler.reservar(ahora=VIERNES) == ('2026-10-17', '10:00')
+
+
+def test_insert_appointment_respeta_capacidad(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    cita = {'lead_id': 1, 'date': '2030-01-07', 'time': '09:00', 'type': 'Idiomas', 'status': 'Confirmada'}
+    db.insert_appointment(conn, cita, capacity=1)
+    with pytest.raises(db.SlotUnavailableError):
+        db.insert_appointment(conn, cita, capacity=1)
+    db.insert_appointment(conn, cita, capacity=2)
+    assert db.count_appointments_by_slot(conn, '2030-01-07') == {'09:00': 2}
+
+
+def test_insert_leads_batch_deshace_si_un_turno_esta_lleno(tmp_path):
+    conn = db.init_db(str(tmp_path / 'test.db'))
+    db.insert_appointment(conn, {'lead_id': 1, 'date': '2030-01-07', 'time': '09:30'}, capacity=1)
+    leads = [{'name': 'Ana', 'phone': '300111'}, {'name': 'Luis', 'phone': '300222'}]
+    citas = [{'lead_index': 0, 'date': '2030-01-07', 'time': '09:00'},
+             {'lead_index': 1, 'date': '2030-01-07', 'time': '09:30'}]
+    with pytest.raises(db.SlotUnavailableError):
+        db.insert_leads_batch(conn, leads, citas, capacity=1)
+    assert conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0] == 0
+    assert db.count_appointments_by_slot(conn, '2030-01-07') == {'09:30': 1}
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_api_lead_concurrente_no_sobrevende(tmp_path, write_behind):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'DB_WRITE_BEHIND': write_behind,
+                      'SCHEDULE_SLOT_CAPACITY': 2})
+
+    def enviar(n):
+        client = app.test_client()
+        return [client.post('/api/lead', json={'name': f'Cliente {n}', 'phone': f'300{n:02d}{i:03d}',
+                                               'schedule': True}).get_json()['appointment']
+                for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        citas = [c for lote in executor.map(enviar, range(8)) for c in lote]
+    turnos = {}
+    for cita in citas:
+        turnos[(cita['date'], cita['time'])] = turnos.get((cita['date'], cita['time']), 0) + 1
+    assert len(citas) == 80 and max(turnos.values()) == 2
+    conn = db.get_connection(str(tmp_path / 'test.db'))
+    ocupacion = conn.execute('SELECT MAX(n) FROM (SELECT COUNT(*) n FROM appointments GROUP BY date, time)')
+    assert ocupacion.fetchone()[0] == 2
+
+
+def test_dos_instancias_sobre_la_misma_base(tmp_path):
+    config = {'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'SCHEDULE_SLOT_CAPACITY': 1}
+    a, b = create_app(config).test_client(), create_app(config).test_client()
+
+    def agendar(client, telefono):
+        return client.post('/api/lead', json={'name': 'Ana', 'phone': telefono, 'schedule': True}).get_json()['appointment']
+
+    primera = agendar(a, '300001')
+    segunda = agendar(b, '300002')
+    # `a` no sabe de la cita de `b`: la base rechaza el turno y `a` relee el día
+    tercera = agendar(a, '300003')
+    assert len({(c['date'], c['time']) for c in (primera, segunda, tercera)}) == 3
+
+
+def test_api_leads_batch_asigna_turnos(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'SCHEDULE_SLOT_CAPACITY': 1})
+    client = app.test_client()
+    data = client.post('/api/leads/batch', json=[
+        {'name': 'Ana', 'phone': '300111', 'schedule': True},
+        {'name': 'Luis', 'phone': '300222'},
+        {'name': 'Eva', 'phone': '300333', 'schedule': True},
+    ]).get_json()
+    citas = [r.get('appointment') for r in data['results']]
+    assert citas[1] is None
+    assert citas[0]['date'] == citas[2]['date']
+    assert (citas[0]['time'], citas[2]['time']) == ('09:00', '09:30')
+
+
+def test_api_lead_sin_cupos_guarda_el_lead(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'SCHEDULE_BUSINESS_HOURS': {}})
+    client = app.test_client()
+    body = client.post('/api/lead', json={'name': 'Ana', 'phone': '300111', 'schedule': True}).get_json()
+    assert body['appointment'] is None and 'warning' in body
+    assert client.get('/api/stats').get_json()['total_leads'] == 1
+
+
+def test_api_leads_batch_sin_cupos_avisa_por_elemento(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'test.db'), 'SCHEDULE_BUSINESS_HOURS': {}})
+    client = app.test_client()
+    data = client.post('/api/leads/batch', json=[
+        {'name': 'Ana', 'phone': '300111', 'schedule': True},
+        {'name': 'Luis', 'phone': '300222'},
+    ]).get_json()
+    con_cita, sin_pedir = data['results']
+    assert con_cita['appointment'] is None
+    assert con_cita['warning'] == client.post('/api/lead', json={
+        'name': 'Eva', 'phone': '300333', 'schedule': True}).get_json()['warning']
+    assert 'appointment' not in sin_pedir and 'warning' not in sin_pedir
+    assert data['created'] == 2
@@ -0,0 +1,20 @@
+from app import serve
+
+
+def test_config_por_argumentos():
+    args = serve.build_parser().parse_args(['--threads', '16', '--write-behind', '--database', '/tmp/x.db'])
+    assert serve.app_config(args) == {'DB_POOL_SIZE': 16, 'DB_WRITE_BEHIND': True, 'DATABASE': '/tmp/x.db',
+                                      'ADMISSION_MAX_IN_FLIGHT': 4, 'ADMISSION_MAX_QUEUE': 4}
+
+
+def test_config_por_entorno(monkeypatch):
+    monkeypatch.setenv('ASISTENTE_THREADS', '4')
+    monkeypatch.setenv('ASISTENTE_BACKLOG', '64')
+    monkeypatch.setenv('ASISTENTE_WRITE_BEHIND', '1')
+    monkeypatch.setenv('ASISTENTE_MAX_QUEUE', '10')
+    args = serve.build_parser().parse_args([])
+    assert (args.threads, args.backlog, args.write_behind, args.max_queue) == (4, 64, True, 10)
+    assert serve.app_config(args)['DB_POOL_SIZE'] == 4
+    monkeypatch.delenv('ASISTENTE_THREADS')
+    args = serve.build_parser().parse_args([])
+    assert serve.app_config(args)['DB_POOL_SIZE'] == 4 + 10 + serve.HILOS_LIBRES
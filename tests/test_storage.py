@@ -0,0 +1,195 @@
+import json
+from datetime import datetime
+
+import pytest
+from app import db, storage
+
+
+def lead(i, telefono=None, calificacion='Alta'):
+    return {'nombre': f'Lead {i:03d}', 'telefono': telefono or str(3000000000 + i), 'interes': 'Idiomas',
+            'calificacion': calificacion, 'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def cita(i, fecha='2030-01-07', hora='10:00'):
+    return {'nombre': f'Lead {i:03d}', 'telefono': str(3000000000 + i), 'fecha_cita': fecha, 'hora': hora,
+            'tipo': 'Idiomas', 'estado': 'Confirmada',
+            'fecha_agendamiento': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = storage.AlmacenSQLite(str(tmp_path / 'data.db'), directorio_heredado=str(tmp_path), capacidad=2)
+    yield almacen
+    almacen.cerrar()
+
+
+def test_sqlite_guarda_lead_y_cita_juntos(almacen):
+    assert almacen.guardar_lead(lead(1), cita(1)) is True
+    assert almacen.guardar_lead(lead(2)) is True
+    assert almacen.resumen() == {'leads': 2, 'citas': 1, 'leads_hoy': 2}
+    assert almacen.reservas_por_turno('2030-01-07') == {'10:00': 1}
+    # Una llamada = una sola llamada registrada en el lead
+    assert almacen.conn.execute('SELECT call_count FROM leads WHERE phone = ?', ('3000000001',)).fetchone()[0] == 1
+
+    fuente = almacen.fuente_citas()
+    assert fuente.ventana(0, 10) == [('Lead 001', '3000000001', '2030-01-07', '10:00', 'Idiomas', 'Confirmada')]
+
+    # Un llamante repetido se fusiona y no cuenta como fila nueva
+    assert almacen.guardar_lead(lead(1)) is False
+    assert len(almacen.fuente_leads()) == 2
+
+
+def test_sqlite_rechaza_turno_lleno(almacen):
+    almacen.guardar_lead(lead(1), cita(1))
+    almacen.guardar_lead(lead(2), cita(2))
+    with pytest.raises(db.SlotUnavailableError):
+        almacen.guardar_lead(lead(3), cita(3))
+    # El lead de la cita rechazada no queda guardado a medias
+    assert almacen.resumen()['leads'] == 2
+
+
+def test_sqlite_fuente_paginada_ordena_y_filtra(almacen):
+    for i in range(30):
+        almacen.guardar_lead(lead(i, calificacion='Baja' if i % 3 else 'Alta'))
+    fuente = almacen.fuente_leads()
+    fuente.tam_pagina = 7
+    assert len(fuente) == 30
+    assert [f[0] for f in fuente.ventana(5, 4)] == ['Lead 005', 'Lead 006', 'Lead 007', 'Lead 008']
+
+    fuente.ordenar('nombre', descendente=True)
+    assert fuente.ventana(0, 1)[0][0] == 'Lead 029'
+    fuente.filtrar('', calificacion='Alta')
+    assert len(fuente) == 10
+    assert fuente.ventana(0, 2)[0][0] == 'Lead 027'
+    # El texto se busca literal (sin comodines de LIKE)
+    fuente.filtrar('LEAD 01')
+    assert len(fuente) == 10
+    fuente.filtrar('%')
+    assert len(fuente) == 0
+
+
+def test_sqlite_filtro_sin_distinguir_mayusculas_con_tildes(almacen):
+    almacen.guardar_lead(dict(lead(1), nombre='ÁLVARO ÑÚÑEZ'))
+    almacen.guardar_lead(dict(lead(2), nombre='Ana'))
+    fuente = almacen.fuente_leads()
+    for texto in ('álvaro', 'ñúñez', 'ÁLVARO'):
+        fuente.filtrar(texto)
+        assert [f[0] for f in fuente.ventana(0, 5)] == ['ÁLVARO ÑÚÑEZ'], texto
+
+
+@pytest.mark.parametrize('orden', [None, 'nombre', 'fecha', 'calificacion'])
+@pytest.mark.parametrize('descendente', [False, True])
+def test_sqlite_paginas_por_clave_coinciden_con_el_orden_completo(almacen, orden, descendente):
+    for i in range(23):
+        almacen.guardar_lead(dict(lead(i, calificacion='Baja' if i % 3 else 'Alta'),
+                                  nombre=f'Lead {i % 7}', fecha=None if i % 5 == 0 else f'2026-10-{i + 1:02d} 10:00:00'))
+    fuente = almacen.fuente_leads()
+    fuente.tam_pagina = 4
+    if orden or descendente:
+        fuente.ordenar(orden, descendente)
+    # Recorrido página a página (con anclas) y saltando a una página lejana (desde el ancla más cercana)
+    secuencial = fuente.ventana(0, 23)
+    fuente.ordenar(fuente.orden, fuente.descendente)
+    salto = fuente.ventana(17, 6)
+    completo = almacen.fuente_leads()
+    completo.tam_pagina = 100
+    completo.ordenar(orden, descendente)
+    esperado = completo.ventana(0, 23)
+    assert len(esperado) == 23
+    assert secuencial == esperado and salto == esperado[17:]
+
+
+def test_sqlite_consultas_de_pagina_usan_indices(almacen):
+    def plan(sql, params):
+        return ' '.join(f[3] for f in almacen.conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+    consultas = []
+    almacen.conn.set_trace_callback(consultas.append)
+    fuente = almacen.fuente_leads()
+    fuente.ordenar('nombre')
+    for i in range(3):
+        almacen.guardar_lead(lead(i))
+    fuente.tam_pagina = 1
+    fuente.ventana(0, 2)
+    almacen.conn.set_trace_callback(None)
+    siguiente = [c for c in consultas if 'LIMIT' in c][-1]
+    # La segunda página busca en el índice a partir del ancla, sin recorrer ni ordenar
+    detalle = plan(siguiente, ())
+    assert 'idx_leads_name_id' in detalle and 'SEARCH' in detalle and 'TEMP B-TREE' not in detalle
+
+
+def test_sqlite_conteo_sin_filtro_no_recorre_la_tabla(almacen):
+    for i in range(5):
+        almacen.guardar_lead(lead(i))
+    consultas = []
+    almacen.conn.set_trace_callback(consultas.append)
+    assert len(almacen.fuente_leads()) == 5
+    almacen.conn.set_trace_callback(None)
+    assert all('stats_counters' in c for c in consultas)
+
+
+def test_sqlite_importa_archivos_heredados_una_vez(tmp_path, almacen):
+    with open(tmp_path / 'leads.jsonl', 'w', encoding='utf-8') as f:
+        for i in range(3):
+            f.write(json.dumps(lead(i)) + '\n')
+    with open(tmp_path / 'citas.json', 'w', encoding='utf-8') as f:
+        json.dump([dict(cita(1), hora='10:00 AM')], f)
+
+    avisos = almacen.cargar()
+    assert len(avisos) == 2
+    assert (tmp_path / 'leads.jsonl.importado').exists() and not (tmp_path / 'leads.jsonl').exists()
+    assert almacen.resumen()['leads'] == 3
+    assert almacen.reservas_por_turno('2030-01-07') == {'10:00': 1}
+
+    # Un diario nuevo con el mismo nombre se importa desde el principio
+    with open(tmp_path / 'leads.jsonl', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(lead(9)) + '\n')
+    assert almacen.cargar() == [f"leads.jsonl: 1 leads y 0 citas importados a {almacen.db_path}"]
+    assert almacen.resumen()['leads'] == 4
+    assert almacen.cargar() == []
+
+
+def test_diario_ida_y_vuelta(tmp_path):
+    almacen = storage.AlmacenDiario(str(tmp_path))
+    assert almacen.cargar() == []
+    almacen.guardar_lead(lead(1), cita(1))
+    almacen.cerrar()
+
+    almacen = storage.AlmacenDiario(str(tmp_path))
+    almacen.cargar()
+    assert almacen.resumen() == {'leads': 1, 'citas': 1, 'leads_hoy': 1}
+    assert almacen.reservas_por_turno('2030-01-07') == {'10:00': 1}
+    assert almacen.fuente_leads().ventana(0, 5)[0][0] == 'Lead 001'
+    almacen.cerrar()
+
+
+def test_diario_migra_json_heredado_y_compacta(tmp_path):
+    with open(tmp_path / 'leads.json', 'w', encoding='utf-8') as f:
+        json.dump([lead(1), lead(2)], f)
+    with open(tmp_path / 'citas.jsonl', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(cita(1)) + '\n{dañada\n' + json.dumps(cita(2, hora='10:30')) + '\n')
+
+    almacen = storage.AlmacenDiario(str(tmp_path))
+    assert almacen.cargar() == []
+    # Mismo sufijo que AlmacenSQLite para lo que ya pasó a otro formato
+    assert (tmp_path / 'leads.json.importado').exists() and not (tmp_path / 'leads.json').exists()
+    assert len((tmp_path / 'leads.jsonl').read_text(encoding='utf-8').splitlines()) == 2
+    assert len((tmp_path / 'citas.jsonl').read_text(encoding='utf-8').splitlines()) == 2
+    assert almacen.resumen() == {'leads': 2, 'citas': 2, 'leads_hoy': 2}
+    assert almacen.reservas_por_turno('2030-01-07') == {'10:00': 1, '10:30': 1}
+    assert len(almacen.fuente_citas()) == 2
+
+    almacen.guardar_lead(lead(3), cita(3))
+    assert almacen.resumen() == {'leads': 3, 'citas': 3, 'leads_hoy': 3}
+    assert almacen.reservas_por_turno('2030-01-07') == {'10:00': 2, '10:30': 1}
+    almacen.cerrar()
+
+
+def test_crear_almacen(tmp_path, monkeypatch):
+    monkeypatch.setenv('ASISTENTE_DESKTOP_STORAGE', 'jsonl')
+    assert isinstance(storage.crear_almacen(tmp_path), storage.AlmacenDiario)
+    almacen = storage.crear_almacen(tmp_path, tipo='sqlite', capacidad=3)
+    assert isinstance(almacen, storage.AlmacenSQLite) and almacen.capacidad == 3
+    assert almacen.db_path == str(tmp_path / 'data.db')
+    with pytest.raises(ValueError):
+        storage.crear_almacen(tmp_path, tipo='csv')
@@ -0,0 +1,197 @@
+import time
+
+import pytest
+
+from app.virtual_table import FuentePaginada, IndiceTabla, TablaVirtual
+
+COLUMNAS = ('nombre', 'telefono', 'interes', 'calificacion', 'fecha')
+
+
+class TreeFalso:
+    """Lo mínimo de ttk.Treeview que usa TablaVirtual."""
+
+    def __init__(self):
+        self.items = {}
+        self.orden = []
+        self.encabezados = {}
+        self.llamadas = 0
+
+    def insert(self, parent, index, values=()):
+        iid = f'I{self.llamadas}'
+        self.items[iid] = tuple(values)
+        self.orden.append(iid)
+        self.llamadas += 1
+        return iid
+
+    def item(self, iid, values):
+        self.items[iid] = tuple(values)
+        self.llamadas += 1
+
+    def delete(self, iid):
+        del self.items[iid]
+        self.orden.remove(iid)
+
+    def heading(self, columna, command):
+        self.encabezados[columna] = command
+
+    def bind(self, evento, funcion):
+        pass
+
+    def visibles(self):
+        return [self.items[i] for i in self.orden]
+
+
+class BarraFalsa:
+    def __init__(self):
+        self.posicion = (0.0, 1.0)
+
+    def configure(self, command):
+        self.command = command
+
+    def set(self, primero, ultimo):
+        self.posicion = (primero, ultimo)
+
+
+def lead(i, calificacion='Alta'):
+    return {'nombre': f'Lead {i:06d}', 'telefono': str(3000000000 + i), 'interes': 'Idiomas',
+            'calificacion': calificacion, 'fecha': '2026-10-18 10:00:00'}
+
+
+def crear_tabla(alto=5):
+    tree, barra = TreeFalso(), BarraFalsa()
+    return TablaVirtual(tree, barra, COLUMNAS, alto=alto), tree, barra
+
+
+def test_indice_ordena_y_agrega_en_su_lugar():
+    indice = IndiceTabla(('nombre', 'edad'))
+    indice.cargar([('carla', 30), ('ana', 25), ('Beto', None)])
+    indice.ordenar('nombre')
+    assert [f[0] for f in indice.ventana(0, 10)] == ['ana', 'Beto', 'carla']
+    assert indice.agregar(('bruno', 40)) == 2
+    indice.ordenar('nombre', descendente=True)
+    assert [f[0] for f in indice.ventana(0, 10)] == ['carla', 'bruno', 'Beto', 'ana']
+    indice.ordenar('edad')
+    # Los vacíos van al final
+    assert [f[1] for f in indice.ventana(0, 10)] == [25, 30, 40, None]
+
+
+def test_indice_filtra_por_texto_y_columna():
+    indice = IndiceTabla(COLUMNAS)
+    indice.cargar([tuple(lead(i, 'Baja' if i % 2 else 'Alta').values()) for i in range(1, 13)])
+    indice.filtrar('lead 00001')
+    assert [f[0] for f in indice.ventana(0, 10)] == ['Lead 000010', 'Lead 000011', 'Lead 000012']
+    indice.filtrar('lead 000011')
+    assert len(indice) == 1
+    indice.filtrar('', calificacion='Baja')
+    assert len(indice) == 6
+    # Un lead nuevo que no pasa el filtro no entra en la vista
+    assert indice.agregar(tuple(lead(99, 'Alta').values())) is None
+    assert (len(indice), indice.total) == (6, 13)
+    with pytest.raises(ValueError):
+        indice.filtrar(estado='x')
+
+
+def test_tabla_materializa_solo_la_ventana():
+    tabla, tree, barra = crear_tabla(alto=5)
+    tabla.cargar([lead(i) for i in range(100)])
+    assert len(tree.items) == 5
+    assert tree.visibles()[0][0] == 'Lead 000000'
+
+    tabla.yview('moveto', '0.5')
+    assert tree.visibles()[0][0] == 'Lead 000050'
+    assert barra.posicion == (0.5, 0.55)
+    tabla.yview('scroll', '1', 'pages')
+    assert tree.visibles()[0][0] == 'Lead 000055'
+    tabla.yview('moveto', '1.0')
+    assert tree.visibles()[-1][0] == 'Lead 000099'
+    assert len(tree.items) == 5
+
+
+def test_agregar_fuera_de_la_ventana_no_redibuja():
+    tabla, tree, barra = crear_tabla(alto=5)
+    tabla.cargar([lead(i) for i in range(20)])
+    antes = tree.llamadas
+    tabla.agregar(lead(20))
+    assert tree.llamadas == antes
+    assert barra.posicion == (0.0, 5 / 21)
+
+    # Ordenado por nombre descendente, el nuevo queda arriba y sí se ve
+    tabla.alternar_orden('nombre')
+    tabla.alternar_orden('nombre')
+    tabla.agregar(lead(500))
+    assert tree.visibles()[0][0] == 'Lead 000500'
+    tabla.alternar_orden('nombre')
+    assert tree.visibles()[0][0] == 'Lead 000000'
+
+
+def test_filtro_y_encabezados():
+    tabla, tree, _ = crear_tabla(alto=5)
+    tabla.cargar([lead(i, 'Baja' if i % 3 else 'Alta') for i in range(30)])
+    tree.encabezados['telefono']()
+    tabla.filtrar('', calificacion='Alta')
+    assert [v[3] for v in tree.visibles()] == ['Alta'] * 5
+    tabla.filtrar('lead 000029')
+    assert [v[0] for v in tree.visibles()] == ['Lead 000029']
+    assert len(tree.items) == 1
+
+
+def test_cien_mil_leads():
+    tabla, tree, _ = crear_tabla(alto=15)
+    t0 = time.perf_counter()
+    tabla.cargar([lead(i) for i in range(100000)])
+    tabla.alternar_orden('nombre')
+    tabla.alternar_orden('nombre')
+    carga = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(1000):
+        tabla.agregar(lead(100000 + i))
+    por_lead = (time.perf_counter() - t0) / 1000
+    assert len(tree.items) == 15
+    assert tree.visibles()[0][0] == 'Lead 100999'
+    # Márgenes amplios para máquinas lentas; reinsertar las 100k filas tardaba segundos
+    assert carga < 5 and por_lead < 0.005
+
+
+def test_fuente_paginada_lee_solo_las_paginas_visibles():
+    filas = [(f'Lead {i:06d}',) for i in range(1000)]
+    lecturas = []
+
+    def leer(ancla, saltar, cantidad, orden, descendente, filtro, exactos):
+        # La clave de cada fila es su posición en el orden pedido
+        datos = sorted(filas, reverse=descendente) if orden else filas
+        inicio = (ancla + 1 if ancla is not None else 0) + saltar
+        lecturas.append((ancla, saltar))
+        return list(enumerate(datos))[inicio:inicio + cantidad]
+
+    contados = []
+
+    def contar(filtro, exactos):
+        contados.append(1)
+        return len(filas)
+
+    fuente = FuentePaginada(('nombre',), contar, leer, tam_pagina=100, max_paginas=2)
+    tabla, tree, _ = crear_tabla(alto=5)
+    tabla = TablaVirtual(tree, BarraFalsa(), ('nombre',), alto=5, fuente=fuente)
+    tabla.refrescar()
+    tabla.yview('moveto', '0.5')
+    tabla.desplazar(3)
+    assert tree.visibles()[0][0] == 'Lead 000503'
+    assert lecturas == [(None, 0), (99, 400)]
+
+    # Un registro nuevo en orden de llegada no obliga a releer la ventana
+    filas.append(('Lead 001000',))
+    tabla.agregar({'nombre': 'Lead 001000'})
+    assert len(lecturas) == 2
+    tabla.yview('moveto', '1.0')
+    assert tree.visibles()[-1][0] == 'Lead 001000'
+    # La página siguiente a una ya leída parte de su ancla, sin saltar filas
+    tabla.yview('moveto', str(600 / 1001))
+    assert lecturas[-1] == (599, 0)
+
+    # Las páginas más antiguas salen de la caché; el conteo se hace una sola vez
+    tabla.yview('moveto', '0.0')
+    assert lecturas[-1] == (None, 0) and contados == [1]
+    tabla.alternar_orden('nombre')
+    tabla.alternar_orden('nombre')
+    assert tree.visibles()[0][0] == 'Lead 001000'